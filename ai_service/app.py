@@ -1,14 +1,51 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Request, Header
+from pydantic import BaseModel
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from pathlib import Path
 import tempfile
+
+# Thread budget for BLAS / OpenMP / numba / TFLite, sized from the CPU quota
+# (runtime/concurrency.py). Applied before numpy is imported so every pool
+# starts at its cap.
+from runtime.concurrency import apply_thread_limits, plan_from_env, thread_report
+CONCURRENCY = plan_from_env()
+apply_thread_limits(CONCURRENCY.threads_per_request)
+
 import numpy as np
 import librosa
+import soundfile as sf
 import os
+import json
+import threading
+import time
 import traceback
+from collections import deque
+from typing import Optional
 
 from runtime.tflite_runner import TFLiteRunner
-from runtime.audio_preprocessing import preprocess_audio
+from runtime.tflite_tuning import resolve_runner_options
+from runtime.audio_preprocessing import hum_detect_from_env, mains_hum_notches, preprocess_audio
+from runtime.features import (
+    SAMPLE_RATE, N_FFT, HOP,
+    load_wav_mono_16k, normalize_peak, to_features, predict, sigmoid_to_result,
+)
+from runtime.windowing import predict_windows
+from runtime.heart_rate import analyze_heart_sounds
+from runtime.streaming import stream_predictions
+from runtime.progressive import progressive_predict
+from runtime.wav_io import load_wav_mmap_mono_16k, pcm_from_bytes, pcm_to_mono_16k, resolve_storage_path
+from runtime.dsp_workspace import MAX_RETAINED_BYTES, workspace_for, workspace_stats
+from runtime.supervisor import process_memory
+from runtime.signal_quality import assess_signal_quality, qc_enabled_from_env, thresholds_from_env
+from runtime.memory import (
+    CROP_MARGIN_SECONDS, NO_TRACE, MemoryBudgetExceeded, MemoryStats, RecordingInfo, StageMemoryTrace,
+    plan_request, probe_recording, start_tracing,
+)
+from runtime.capture import LatencyCapture
+from runtime.jobs import JobQueue, QueueFull
+from runtime.warmup import LatencyTracker, run_warmup, synthetic_recording
+from runtime.postprocess.recommendation import build_recommendation
 
 app = FastAPI(title="AI Stethoscope Inference Service")
 
@@ -17,123 +54,116 @@ app = FastAPI(title="AI Stethoscope Inference Service")
 # -------------------------
 BASE_DIR = Path(__file__).resolve().parent
 
-MODEL_HEART = BASE_DIR / "models" / "heart_model.tflite"
-MODEL_LUNG  = BASE_DIR / "models" / "lung_model.tflite"   # <- matches your folder
+# Override with AI_HEART_MODEL / AI_LUNG_MODEL to deploy e.g. int8 builds
+MODEL_HEART = Path(os.environ.get("AI_HEART_MODEL", BASE_DIR / "models" / "heart_model.tflite"))
+MODEL_LUNG  = Path(os.environ.get("AI_LUNG_MODEL", BASE_DIR / "models" / "lung_model.tflite"))   # <- matches your folder
 
 if not MODEL_HEART.exists():
     raise FileNotFoundError(f"Missing heart model: {MODEL_HEART}")
 if not MODEL_LUNG.exists():
     raise FileNotFoundError(f"Missing lung model: {MODEL_LUNG}")
 
-runner_heart = TFLiteRunner(str(MODEL_HEART))
-runner_lung  = TFLiteRunner(str(MODEL_LUNG))
+# Interpreter options:
+#   AI_TFLITE_AUTOTUNE = off | cache (default) | startup
+#   AI_TFLITE_THREADS / AI_TFLITE_DELEGATE override the tuned values for both models;
+#   with neither set nor tuned, the governor sizes them to the process's CPUs
+TFLITE_AUTOTUNE = os.environ.get("AI_TFLITE_AUTOTUNE", "cache")
+TFLITE_THREADS = os.environ.get("AI_TFLITE_THREADS")
+TFLITE_DELEGATE = os.environ.get("AI_TFLITE_DELEGATE")
+
+def _build_runner(model_path: Path):
+    opts = resolve_runner_options(
+        str(model_path),
+        autotune_mode=TFLITE_AUTOTUNE,
+        num_threads=int(TFLITE_THREADS) if TFLITE_THREADS else None,
+        delegate=TFLITE_DELEGATE,
+    )
+    if opts["num_threads"] is None:
+        # the runtime default sizes itself to the machine, not the cgroup quota
+        opts["num_threads"] = CONCURRENCY.tflite_threads
+        opts["source"] = "governor"
+    runner = TFLiteRunner(str(model_path), num_threads=opts["num_threads"], delegate=opts["delegate"])
+    runner.options_source = opts["source"]
+    return runner
+
+runner_heart = _build_runner(MODEL_HEART)
+runner_lung  = _build_runner(MODEL_LUNG)
 
 # -------------------------
 # Audio / Feature params
 # -------------------------
-SAMPLE_RATE = 16000
-N_FFT = 1024
-HOP = 512
+MAX_SECONDS = 10                # single-clip mode crops to this
+WINDOW_BATCH = int(os.environ.get("AI_WINDOW_BATCH", "8"))
+UPLOAD_CHUNK = 1 << 20          # bytes per read when spooling uploads to disk
+PCM_MAX_BYTES = int(os.environ.get("AI_PCM_MAX_BYTES", str(32 << 20)))   # raw PCM body limit
+# Progressive single-clip mode (?progressive=true): score INITIAL seconds, stop once the
+# probability is MARGIN away from the 0.30 threshold, else extend by STEP seconds
+PROGRESSIVE_MARGIN = float(os.environ.get("AI_PROGRESSIVE_MARGIN", "0.15"))
+PROGRESSIVE_INITIAL_SECONDS = float(os.environ.get("AI_PROGRESSIVE_INITIAL_SECONDS", "4"))
+PROGRESSIVE_STEP_SECONDS = float(os.environ.get("AI_PROGRESSIVE_STEP_SECONDS", "2"))
+# Notch only the mains hum (50/60 Hz + harmonics) detected in each recording;
+# 0 restores the fixed 60 Hz notch
+HUM_DETECT = hum_detect_from_env()
+# Reuse per-thread DSP buffers across requests (runtime/dsp_workspace.py)
+DSP_WORKSPACE = os.environ.get("AI_DSP_WORKSPACE", "1") != "0"
+
+# Signal-quality gate (runs on the raw decoded signal before preprocess_audio).
+# AI_QC_ENABLED=0 disables it; AI_QC_* thresholds: see runtime/signal_quality.py
+QC_ENABLED = qc_enabled_from_env()
+QC_THRESHOLDS = thresholds_from_env()
+
+# Async job API: bounded in-process queue feeding inference worker threads
+JOB_WORKERS = int(os.environ.get("AI_JOB_WORKERS", CONCURRENCY.request_workers))
+JOB_QUEUE_DEPTH = int(os.environ.get("AI_JOB_QUEUE_DEPTH", "8"))
+JOB_RESULT_TTL = float(os.environ.get("AI_JOB_RESULT_TTL", "600"))
+JOB_MAX_WAIT = 60.0             # longest long-poll a client may ask for
+
+# Memory: AI_MEMORY_TRACE=1 records per-stage peak memory (debug.memory, /metrics);
+# AI_MEMORY_BUDGET_MB caps the per-request footprint estimated from the header:
+# over budget -> cropped decode / streaming path, or 413 (runtime/memory.py)
+MEMORY_TRACE = os.environ.get("AI_MEMORY_TRACE", "0") == "1"
+MEMORY_BUDGET = (int(float(os.environ["AI_MEMORY_BUDGET_MB"]) * (1 << 20))
+                 if os.environ.get("AI_MEMORY_BUDGET_MB") else None)
+# the worker's DSP workspace stays allocated on top of a request's own peak
+REQUEST_BUDGET = (max(0, MEMORY_BUDGET - (MAX_RETAINED_BYTES if DSP_WORKSPACE else 0))
+                  if MEMORY_BUDGET is not None else None)
+memory_stats = MemoryStats()
+if MEMORY_TRACE:
+    start_tracing()
+
+# Warm-up: AI_WARMUP=1 (default) runs a synthetic recording through every
+# request path at startup so lazy imports, numba compilation and first
+# interpreter invokes do not land on the first request (runtime/warmup.py)
+WARMUP = os.environ.get("AI_WARMUP", "1") != "0"
+warmup_report = None
+request_latency = LatencyTracker()
+
+# Slow-request capture: AI_CAPTURE_DIR keeps the input + metadata/timings of
+# requests slower than AI_CAPTURE_THRESHOLD_MS or the AI_CAPTURE_PERCENTILE
+# latency percentile (default p99) in a ring capped at AI_CAPTURE_MAX_MB;
+# replay.py re-runs them offline (runtime/capture.py)
+CAPTURE_DIR = os.environ.get("AI_CAPTURE_DIR")
+CAPTURE_THRESHOLD_MS = (float(os.environ["AI_CAPTURE_THRESHOLD_MS"])
+                        if os.environ.get("AI_CAPTURE_THRESHOLD_MS") else None)
+CAPTURE_PERCENTILE = (float(os.environ["AI_CAPTURE_PERCENTILE"]) if os.environ.get("AI_CAPTURE_PERCENTILE")
+                      else None if CAPTURE_THRESHOLD_MS is not None else 99.0)
+CAPTURE_MAX_BYTES = int(float(os.environ.get("AI_CAPTURE_MAX_MB", "256")) * (1 << 20))
+slow_capture = (LatencyCapture(CAPTURE_DIR, threshold_ms=CAPTURE_THRESHOLD_MS, percentile=CAPTURE_PERCENTILE,
+                               max_bytes=CAPTURE_MAX_BYTES) if CAPTURE_DIR else None)
+
+# Directory shared with the backend (e.g. Laravel storage/app/private).
+# /infer/{mode}/path only reads files below it; unset = endpoint disabled.
+SHARED_STORAGE_ROOT = os.environ.get("AI_SHARED_STORAGE_ROOT")
 
 # -------------------------
 # Utilities
 # -------------------------
-def _runner_expected_hw(runner):
-    """
-    Expect model input shape like (1, H, W, C)
-    Returns (H, W, C) as ints.
-    """
-    shape = tuple(int(v) for v in runner.input_shape)
-    if len(shape) != 4:
-        raise ValueError(f"Model input shape must be rank-4 (1,H,W,C). Got: {shape}")
-    _, H, W, C = shape
-    return H, W, C
-
-def load_wav_mono_16k(path: str) -> np.ndarray:
-    y, _ = librosa.load(path, sr=SAMPLE_RATE, mono=True)
-    # normalize safely
-    y = y / (np.max(np.abs(y)) + 1e-9)
-    return y.astype(np.float32)
-
-def to_features(audio: np.ndarray, runner) -> np.ndarray:
-    """
-    Build log-mel features that MATCH the model's expected H (n_mels) and W (frames).
-    This is the #1 fix for heart working but lung crashing.
-    """
-    H, W, C = _runner_expected_hw(runner)
-
-    if C != 1:
-        raise ValueError(f"Expected channel C=1, got C={C}. Model shape mismatch.")
-
-    mel = librosa.feature.melspectrogram(
-        y=audio,
-        sr=SAMPLE_RATE,
-        n_mels=H,        # <- match model height
-        n_fft=N_FFT,
-        hop_length=HOP,
-        power=2.0,
-    )
-    mel_db = librosa.power_to_db(mel, ref=np.max)
-
-    # pad/crop time axis to match model width
-    if mel_db.shape[1] < W:
-        mel_db = np.pad(mel_db, ((0, 0), (0, W - mel_db.shape[1])))
-    else:
-        mel_db = mel_db[:, :W]
-
-    x = mel_db[np.newaxis, ..., np.newaxis].astype(runner.input_dtype)
-
-    expected_shape = (1, H, W, 1)
-    if x.shape != expected_shape:
-        raise ValueError(f"Feature shape {x.shape} != expected {expected_shape}")
-
-    return x
-
-def predict(runner, x):
-    """
-    Supports different runner method names.
-    """
-    if hasattr(runner, "predict_proba"):
-        return runner.predict_proba(x)
-    if hasattr(runner, "predict"):
-        return runner.predict(x)
-    if hasattr(runner, "run"):
-        return runner.run(x)
-    raise AttributeError("TFLiteRunner missing predict method (predict_proba/predict/run)")
-
-def sigmoid_to_result(p, threshold=0.30):
-    """
-    Convert scalar probability to (detected, confidence_pct, prob)
-    confidence_pct is "model confidence", not medical certainty.
-    """
-    p = float(np.array(p).reshape(-1)[0])
-    detected = p > threshold
-    conf = p if detected else 1.0 - p
-    return detected, int(round(conf * 100)), p
-
 def estimate_bpm(audio: np.ndarray):
     """
-    Very rough BPM estimator (works better on clean heart sounds).
+    Heart rate from the decimated Shannon-energy envelope (runtime/heart_rate.py).
     Safe: returns None if it cannot estimate.
     """
-    onset_env = librosa.onset.onset_strength(y=audio, sr=SAMPLE_RATE, hop_length=HOP)
-    ac = np.correlate(onset_env, onset_env, mode="full")
-    ac = ac[len(ac)//2:]
-
-    min_bpm, max_bpm = 40, 200
-    min_lag = int((60 / max_bpm) * (SAMPLE_RATE / HOP))
-    max_lag = int((60 / min_bpm) * (SAMPLE_RATE / HOP))
-
-    if max_lag <= min_lag or max_lag >= len(ac):
-        return None
-
-    seg = ac[min_lag:max_lag]
-    peak = np.argmax(seg) + min_lag
-    if peak <= 0:
-        return None
-
-    bpm = 60.0 / (peak * (HOP / SAMPLE_RATE))
-    return int(round(bpm))
+    return analyze_heart_sounds(audio, SAMPLE_RATE).bpm
 
 def estimate_respiratory_rate(audio: np.ndarray):
     """
@@ -178,110 +208,693 @@ def health():
     # useful for Laravel checks / monitoring
     return {
         "status": "ok",
-        "heart_model": "heart_model.tflite",
-        "lung_model": "lung_model.tflite",
+        "heart_model": MODEL_HEART.name,
+        "lung_model": MODEL_LUNG.name,
         "heart_input_shape": [int(v) for v in runner_heart.input_shape],
         "lung_input_shape": [int(v) for v in runner_lung.input_shape],
+        "heart_input_dtype": np.dtype(runner_heart.input_dtype).name,
+        "lung_input_dtype": np.dtype(runner_lung.input_dtype).name,
+        "concurrency": {**CONCURRENCY.to_dict(), "threads": thread_report()},
+        "interpreter": {
+            name: {
+                "delegate": r.delegate,
+                "num_threads": r.num_threads,
+                "source": r.options_source,
+            }
+            for name, r in (("heart", runner_heart), ("lung", runner_lung))
+        },
+        "jobs": job_queue.stats(),
+        "warmup": warmup_report,
     }
 
-@app.post("/infer/heart")
-async def infer_heart(file: UploadFile = File(...)):
+def _mode_config(mode: str) -> dict:
+    """
+    Per-mode names used in the response schema.
+    """
+    if mode == "heart":
+        return {"runner": runner_heart, "rate_key": "bpm", "rate_fn": estimate_bpm,
+                "flag_key": "murmur_detected", "prob_key": "murmur_probability"}
+    if mode == "lung":
+        return {"runner": runner_lung, "rate_key": "resp_rate", "rate_fn": estimate_respiratory_rate,
+                "flag_key": "crackle_detected", "prob_key": "crackle_probability"}
+    raise HTTPException(status_code=404, detail=f"Unknown mode: {mode}")
+
+def _poor_quality_response(mode: str, quality) -> dict:
+    cfg = _mode_config(mode)
+    return {
+        "mode": mode,
+        "status": "poor_signal_quality",
+        "result": "retake",
+        cfg["rate_key"]: None,
+        "ai_confidence_pct": 0,
+        cfg["flag_key"]: False,
+        "message": "Poor signal quality, please retake the recording: " + ", ".join(quality.reasons) + ".",
+        "debug": {
+            "signal_quality": quality.to_dict(),
+        }
+    }
+
+def _mains_hum(y: np.ndarray) -> list:
+    """
+    Frequencies to notch: the mains hum found in y (averaged Hann-block
+    rFFTs, each 50/60 Hz candidate and harmonic against a ring of
+    neighbouring bins, ~1 ms), or the fixed 60 Hz notch with AI_HUM_DETECT=0.
+    """
+    return mains_hum_notches(y, SAMPLE_RATE, detect=HUM_DETECT)
+
+def analyze(mode: str, y: np.ndarray, windowed: bool = False, hop_seconds: Optional[float] = None,
+            trace: StageMemoryTrace = NO_TRACE, stream_path: Optional[str] = None,
+            progressive_margin: Optional[float] = None) -> dict:
+    """
+    Full pipeline on decoded 16 kHz mono audio at its original level
+    (load with normalize=False) -> normalized (UI-friendly) response.
+
+    Unusable recordings (silence, clipping, steady hum) stop at the
+    signal-quality gate with status "poor_signal_quality".
+
+    Default: first MAX_SECONDS only, one model window.
+    windowed=True: the whole recording is split into overlapping model-sized
+    windows; "timeline" lists each window and the top-level result uses the
+    most abnormal window.
+    stream_path: windowed analysis of that file on the bounded-memory
+    streaming path (memory budget); y is then only its start, used for the
+    quality gate and the rate estimate.
+    progressive_margin: single-clip mode only; score a short initial span and
+    extend it until the probability is this far from the threshold
+    (runtime/progressive.py). The rate is then estimated on the analysed span.
+    trace: per-stage peak memory (runtime/memory.py).
+    """
+    cfg = _mode_config(mode)
+    runner = cfg["runner"]
+
+    quality = None
+    if QC_ENABLED:
+        with trace.stage("quality"):
+            quality = assess_signal_quality(y, SAMPLE_RATE, QC_THRESHOLDS)
+        if not quality.ok:
+            return _poor_quality_response(mode, quality)
+
+    extra = {}
+    debug = {}
+    progressive = progressive_margin is not None and not windowed
+
+    notch_freqs = _mains_hum(y)
+    debug["mains_hum_hz"] = notch_freqs
+
+    if progressive:
+        with trace.stage("progressive"):
+            prog, y = progressive_predict(y, runner, mode, SAMPLE_RATE * MAX_SECONDS, threshold=0.30,
+                                          margin=progressive_margin,
+                                          initial_seconds=PROGRESSIVE_INITIAL_SECONDS,
+                                          step_seconds=PROGRESSIVE_STEP_SECONDS,
+                                          notch_freqs=notch_freqs)
+        proba = prog.probability
+        debug["progressive"] = prog.to_dict()
+    else:
+        with trace.stage("preprocess"):
+            if not windowed:
+                # only the analysed span, plus the cropped decode's margin so filter edges stay outside it
+                y = y[:int(SAMPLE_RATE * (MAX_SECONDS + CROP_MARGIN_SECONDS))]
+            y = normalize_peak(y)
+            workspace = workspace_for(len(y)) if DSP_WORKSPACE else None
+
+            # Apply audio preprocessing (band-pass + notch + denoise)
+            y = preprocess_audio(y, SAMPLE_RATE, mode=mode, workspace=workspace, notch_freqs=notch_freqs)
+
+        if not windowed or stream_path is not None:
+            # Limit audio duration to 10 seconds to improve performance
+            max_samples = SAMPLE_RATE * MAX_SECONDS
+            if len(y) > max_samples:
+                y = y[:max_samples]
+
+    with trace.stage("rate"):
+        if mode == "heart":
+            # S1/S2 segmentation, beat intervals and HRV alongside the bpm
+            heart = analyze_heart_sounds(y, SAMPLE_RATE)
+            rate = heart.bpm
+            debug["heart_rate"] = heart.to_dict()
+        else:
+            rate = cfg["rate_fn"](y)
+
+    if windowed:
+        with trace.stage("windows"):
+            if stream_path is None:
+                timeline = predict_windows(y, runner, mode, threshold=0.30,
+                                           hop_seconds=hop_seconds, batch_size=WINDOW_BATCH)
+                seconds = len(y) / SAMPLE_RATE
+            else:
+                timeline = list(stream_predictions(stream_path, runner, mode, threshold=0.30,
+                                                   hop_seconds=hop_seconds, notch_freqs=notch_freqs))
+                seconds = sum(w.window_seconds for w in timeline)
+        proba = max(w.probability for w in timeline)
+        reco = build_recommendation(mode, timeline, lookback_seconds=max(seconds, 1.0))
+        extra["timeline"] = [
+            {
+                "start_s": round(w.start_seconds, 3),
+                "seconds": round(w.window_seconds, 3),
+                "label": w.label,
+                "probability": w.probability,
+            }
+            for w in timeline
+        ]
+        extra["recommendation"] = {
+            "status": reco.status,
+            "confidence_pct": reco.confidence_pct,
+            "consistency_text": reco.consistency_text,
+            "recommendation": reco.recommendation,
+        }
+        debug["windows"] = len(timeline)
+    elif not progressive:
+        with trace.stage("features"):
+            x = to_features(y, runner, workspace=workspace)
+        with trace.stage("inference"):
+            proba = predict(runner, x)
+        if workspace is not None:
+            workspace.trim()
+
+    if quality is not None:
+        debug["signal_quality"] = quality.to_dict()
+
+    detected, confidence_pct, prob = sigmoid_to_result(proba, threshold=0.30)
+
+    # normalized response (UI-friendly)
+    return {
+        "mode": mode,
+        "status": "completed",
+        "result": "abnormal" if detected else "normal",
+        cfg["rate_key"]: rate,
+        "ai_confidence_pct": confidence_pct,
+        cfg["flag_key"]: detected,
+        **extra,
+        "debug": {
+            cfg["prob_key"]: prob,
+            **debug,
+        }
+    }
+
+def _with_memory_debug(result: dict, trace: StageMemoryTrace, plan: dict) -> dict:
+    memory_stats.record_trace(trace)
+    memory = {}
+    if trace.enabled:
+        memory["stages"] = trace.to_dict()
+    if MEMORY_BUDGET is not None:
+        memory_stats.record_path(plan["path"])
+        memory["budget"] = plan
+    if memory:
+        result.setdefault("debug", {})["memory"] = memory
+    return result
+
+def _budget_plan(path: str, windowed: bool, streaming_ok: bool = True) -> dict:
+    """
+    Memory-budget decision from the file header, before decoding.
+    Raises MemoryBudgetExceeded.
+    """
+    info = probe_recording(path) if MEMORY_BUDGET is not None else None
+    return plan_request(info, REQUEST_BUDGET, windowed, MAX_SECONDS, streaming_ok)
+
+def _run_file(mode: str, path: str, windowed: bool, hop_seconds: Optional[float],
+              loader=load_wav_mono_16k, progressive_margin: Optional[float] = None,
+              trace: Optional[StageMemoryTrace] = None) -> dict:
+    """
+    Decode + analyze a recording on disk within the memory budget.
+    """
+    plan = _budget_plan(path, windowed)
+    if trace is None:
+        trace = StageMemoryTrace(MEMORY_TRACE)
+
+    with trace.stage("decode"):
+        y = loader(path, normalize=False, max_seconds=plan.get("max_seconds"))
+    stream_path = path if plan["path"] == "streaming" else None
+    result = analyze(mode, y, windowed=windowed, hop_seconds=hop_seconds, trace=trace, stream_path=stream_path,
+                     progressive_margin=progressive_margin)
+    return _with_memory_debug(result, trace, plan)
+
+def _run_pcm(mode: str, samples: np.ndarray, sample_rate: int, windowed: bool, hop_seconds: Optional[float],
+             plan: dict, progressive_margin: Optional[float] = None,
+             trace: Optional[StageMemoryTrace] = None) -> dict:
+    """
+    Analyze PCM samples (from pcm_from_bytes) within the header-based plan.
+    """
+    if trace is None:
+        trace = StageMemoryTrace(MEMORY_TRACE)
+    if "max_seconds" in plan:
+        samples = samples[:int(plan["max_seconds"] * sample_rate)]
+    with trace.stage("decode"):
+        y = pcm_to_mono_16k(samples, sample_rate, normalize=False)
+    result = analyze(mode, y, windowed=windowed, hop_seconds=hop_seconds, trace=trace,
+                     progressive_margin=progressive_margin)
+    return _with_memory_debug(result, trace, plan)
+
+def _capture_summary(mode: str, result: Optional[dict], error: Optional[BaseException]) -> dict:
+    if error is not None:
+        return {"error": f"{type(error).__name__}: {error}"}
+    return {
+        "status": result.get("status"),
+        "result": result.get("result"),
+        "probability": result.get("debug", {}).get(_mode_config(mode)["prob_key"]),
+    }
+
+# at most CONCURRENCY.request_workers analyses run at once per process; more
+# would only split the same CPUs between more threads
+analysis_slots = threading.BoundedSemaphore(CONCURRENCY.request_workers)
+
+def _captured(run, mode: str, endpoint: str, params: dict, source_path: Optional[str] = None,
+              data: Optional[bytes] = None, suffix: str = ".wav") -> dict:
+    """
+    run(trace) -> result in one of the process's analysis slots, timed
+    (request_latency) and offered to slow_capture (when enabled) together
+    with the request's input, parameters and per-stage timings.
+    """
+    with analysis_slots:          # queue-wait is not part of the measured latency
+        trace = StageMemoryTrace(MEMORY_TRACE, timed=slow_capture is not None)
+        result, error = None, None
+        start = time.perf_counter()
+        try:
+            result = run(trace)
+        except BaseException as e:
+            error = e
+        elapsed_ms = (time.perf_counter() - start) * 1000.0
+
+    # after the slot is released: pinning a capture's input never holds one up
+    request_latency.record(mode, elapsed_ms)
+    if slow_capture is not None:
+        meta = {
+            "endpoint": endpoint,
+            "mode": mode,
+            "params": params,
+            "timings_ms": trace.timings_ms,
+            **_capture_summary(mode, result, error),
+        }
+        slow_capture.observe(elapsed_ms, meta, source_path=source_path, data=data, suffix=suffix)
+    if error is not None:
+        raise error
+    return result
+
+def _analyze_file(mode: str, path: str, windowed: bool, hop_seconds: Optional[float],
+                  loader=load_wav_mono_16k, progressive_margin: Optional[float] = None,
+                  endpoint: str = "upload") -> dict:
+    """
+    _run_file, captured for replay when slow (AI_CAPTURE_DIR).
+    """
+    params = {
+        "windowed": windowed,
+        "hop_seconds": hop_seconds,
+        "progressive_margin": progressive_margin,
+        "loader": "mmap" if loader is load_wav_mmap_mono_16k else "decode",
+    }
+    return _captured(
+        lambda trace: _run_file(mode, path, windowed, hop_seconds, loader, progressive_margin, trace),
+        mode, endpoint, params, source_path=path,
+    )
+
+def _budget_exceeded(e: MemoryBudgetExceeded):
+    return HTTPException(status_code=413, detail=str(e))
+
+def _progressive_margin(progressive: bool, margin: Optional[float]) -> Optional[float]:
+    if not progressive:
+        return None
+    return PROGRESSIVE_MARGIN if margin is None else margin
+
+async def _save_upload(file: UploadFile) -> str:
+    """
+    Copy the upload to a temp wav in chunks (never the whole body in memory).
+    """
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK)
+            if not chunk:
+                break
+            tmp.write(chunk)
+        return tmp.name
+
+def _remove_quietly(path: Optional[str]):
+    if path and os.path.exists(path):
+        try:
+            os.remove(path)
+        except:
+            pass
+
+async def _infer_upload(mode: str, file: UploadFile, windowed: bool, hop_seconds: Optional[float],
+                        progressive_margin: Optional[float] = None):
     tmp_path = None
     try:
         # save upload to temp wav
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp:
-            tmp.write(await file.read())
-            tmp_path = tmp.name
-
-        # Load and preprocess audio
-        y = load_wav_mono_16k(tmp_path)
-        
-        # Apply audio preprocessing (band-pass + notch + denoise)
-        y = preprocess_audio(y, SAMPLE_RATE, mode="heart")
-
-        # Limit audio duration to 10 seconds to improve performance
-        max_samples = SAMPLE_RATE * 10  # 10 seconds
-        if len(y) > max_samples:
-            y = y[:max_samples]
-
-        bpm = estimate_bpm(y)
-
-        x = to_features(y, runner_heart)
-        proba = predict(runner_heart, x)
-        murmur_detected, confidence_pct, murmur_prob = sigmoid_to_result(proba, threshold=0.30)
-
-        # normalized response (UI-friendly)
-        return JSONResponse({
-            "mode": "heart",
-            "status": "completed",
-            "result": "abnormal" if murmur_detected else "normal",
-            "bpm": bpm,
-            "ai_confidence_pct": confidence_pct,
-            "murmur_detected": murmur_detected,
-            "debug": {
-                "murmur_probability": murmur_prob
-            }
-        })
+        tmp_path = await _save_upload(file)
+
+        # in the threadpool: waiting for an analysis slot must not block the event loop
+        return JSONResponse(await run_in_threadpool(_analyze_file, mode, tmp_path, windowed, hop_seconds,
+                                                    progressive_margin=progressive_margin))
+
+    except MemoryBudgetExceeded as e:
+        raise _budget_exceeded(e)
 
     except Exception as e:
         tb = traceback.format_exc()
         return _error_500(str(e), tb)
 
     finally:
-        if tmp_path and os.path.exists(tmp_path):
-            try:
-                os.remove(tmp_path)
-            except:
-                pass
+        _remove_quietly(tmp_path)
+
+@app.post("/infer/heart")
+async def infer_heart(
+    file: UploadFile = File(...),
+    windowed: bool = Query(False, description="Analyse the full recording in overlapping windows"),
+    hop_seconds: Optional[float] = Query(None, gt=0, description="Window hop (default: half a window)"),
+    progressive: bool = Query(False, description="Single-clip: stop early once the first seconds are conclusive"),
+    margin: Optional[float] = Query(None, ge=0, description="Early-exit distance from the threshold (default AI_PROGRESSIVE_MARGIN)"),
+):
+    return await _infer_upload("heart", file, windowed, hop_seconds, _progressive_margin(progressive, margin))
 
 @app.post("/infer/lung")
-async def infer_lung(file: UploadFile = File(...)):
-    tmp_path = None
+async def infer_lung(
+    file: UploadFile = File(...),
+    windowed: bool = Query(False, description="Analyse the full recording in overlapping windows"),
+    hop_seconds: Optional[float] = Query(None, gt=0, description="Window hop (default: half a window)"),
+    progressive: bool = Query(False, description="Single-clip: stop early once the first seconds are conclusive"),
+    margin: Optional[float] = Query(None, ge=0, description="Early-exit distance from the threshold (default AI_PROGRESSIVE_MARGIN)"),
+):
+    return await _infer_upload("lung", file, windowed, hop_seconds, _progressive_margin(progressive, margin))
+
+class PathRequest(BaseModel):
+    path: str   # storage key relative to AI_SHARED_STORAGE_ROOT (or absolute path inside it)
+
+@app.post("/infer/{mode}/path")
+def infer_path(
+    mode: str,
+    req: PathRequest,
+    windowed: bool = Query(False, description="Analyse the full recording in overlapping windows"),
+    hop_seconds: Optional[float] = Query(None, gt=0, description="Window hop (default: half a window)"),
+    progressive: bool = Query(False, description="Single-clip: stop early once the first seconds are conclusive"),
+    margin: Optional[float] = Query(None, ge=0, description="Early-exit distance from the threshold (default AI_PROGRESSIVE_MARGIN)"),
+):
+    """
+    Same response as /infer/{mode}, but the WAV is read (memory-mapped) from
+    shared storage instead of being uploaded.
+    """
+    _mode_config(mode)
+    if not SHARED_STORAGE_ROOT:
+        raise HTTPException(status_code=404, detail="Shared storage is not configured (AI_SHARED_STORAGE_ROOT)")
+
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp:
-            tmp.write(await file.read())
-            tmp_path = tmp.name
-
-        # Load and preprocess audio
-        y = load_wav_mono_16k(tmp_path)
-        
-        # Apply audio preprocessing (band-pass + notch + denoise)
-        y = preprocess_audio(y, SAMPLE_RATE, mode="lung")
-
-        # Limit audio duration to 10 seconds to improve performance
-        max_samples = SAMPLE_RATE * 10  # 10 seconds
-        if len(y) > max_samples:
-            y = y[:max_samples]
-
-        resp_rate = estimate_respiratory_rate(y)
-
-        x = to_features(y, runner_lung)
-        proba = predict(runner_lung, x)
-        crackle_detected, confidence_pct, crackle_prob = sigmoid_to_result(proba, threshold=0.30)
-
-        return JSONResponse({
-            "mode": "lung",
-            "status": "completed",
-            "result": "abnormal" if crackle_detected else "normal",
-            "resp_rate": resp_rate,
-            "ai_confidence_pct": confidence_pct,
-            "crackle_detected": crackle_detected,
-            "debug": {
-                "crackle_probability": crackle_prob
-            }
-        })
+        audio_path = resolve_storage_path(Path(SHARED_STORAGE_ROOT), req.path)
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if not audio_path.is_file():
+        raise HTTPException(status_code=404, detail=f"Audio file not found: {req.path}")
+
+    try:
+        return JSONResponse(_analyze_file(mode, str(audio_path), windowed, hop_seconds,
+                                          loader=load_wav_mmap_mono_16k,
+                                          progressive_margin=_progressive_margin(progressive, margin),
+                                          endpoint="path"))
+
+    except MemoryBudgetExceeded as e:
+        raise _budget_exceeded(e)
 
     except Exception as e:
         tb = traceback.format_exc()
         return _error_500(str(e), tb)
 
+@app.post("/infer/{mode}/pcm")
+async def infer_pcm(
+    mode: str,
+    request: Request,
+    x_sample_rate: int = Header(..., gt=0, description="Sample rate of the PCM body (Hz)"),
+    x_channels: int = Header(1, ge=1, description="Interleaved channel count"),
+    x_sample_format: str = Header("int16", description="int16 or float32 (little-endian)"),
+    windowed: bool = Query(False, description="Analyse the full recording in overlapping windows"),
+    hop_seconds: Optional[float] = Query(None, gt=0, description="Window hop (default: half a window)"),
+    progressive: bool = Query(False, description="Single-clip: stop early once the first seconds are conclusive"),
+    margin: Optional[float] = Query(None, ge=0, description="Early-exit distance from the threshold (default AI_PROGRESSIVE_MARGIN)"),
+):
+    """
+    Same response as /infer/{mode}, but the body is raw application/octet-stream
+    PCM: no multipart parsing, temp file or WAV decoder. The samples are
+    viewed in place with np.frombuffer; results equal the WAV upload of the
+    same samples.
+    """
+    _mode_config(mode)
+
+    content_type = request.headers.get("content-type", "application/octet-stream")
+    if content_type.split(";")[0].strip().lower() != "application/octet-stream":
+        raise HTTPException(status_code=415, detail="Expected an application/octet-stream PCM body")
+
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > PCM_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"PCM body larger than {PCM_MAX_BYTES} bytes")
+
+    # budget from the headers alone (no streaming path for request bodies)
+    plan = {"path": "full"}
+    if MEMORY_BUDGET is not None and declared and declared.isdigit():
+        frame_bytes = 2 * x_channels if x_sample_format.lower() == "int16" else 4 * x_channels
+        info = RecordingInfo(x_sample_rate, x_channels, int(declared) // frame_bytes)
+        try:
+            plan = plan_request(info, REQUEST_BUDGET, windowed, MAX_SECONDS, streaming_ok=False)
+        except MemoryBudgetExceeded as e:
+            raise _budget_exceeded(e)
+
+    body = await request.body()
+    if len(body) > PCM_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"PCM body larger than {PCM_MAX_BYTES} bytes")
+
+    try:
+        samples = pcm_from_bytes(body, x_sample_format, x_channels)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        progressive_margin = _progressive_margin(progressive, margin)
+        params = {
+            "windowed": windowed,
+            "hop_seconds": hop_seconds,
+            "progressive_margin": progressive_margin,
+            "sample_rate": x_sample_rate,
+            "channels": x_channels,
+            "sample_format": x_sample_format,
+            "plan": plan,
+        }
+        return JSONResponse(await run_in_threadpool(
+            _captured,
+            lambda trace: _run_pcm(mode, samples, x_sample_rate, windowed, hop_seconds, plan,
+                                   progressive_margin, trace),
+            mode, "pcm", params, data=body, suffix=".pcm",
+        ))
+
+    except Exception as e:
+        tb = traceback.format_exc()
+        return _error_500(str(e), tb)
+
+def _stream_lines(mode: str, tmp_path: str, hop_seconds: Optional[float], lookback_seconds: float):
+    """
+    NDJSON lines for /infer/{mode}/stream: one per window, then a summary.
+    Only the windows inside lookback_seconds are kept for the recommendation,
+    so memory stays bounded however long the recording is. A recording
+    whose first MAX_SECONDS fail the signal-quality gate gets only a
+    summary line with status "poor_signal_quality".
+    """
+    cfg = _mode_config(mode)
+    recent = deque()
+    recent_seconds = 0.0
+    windows = 0
+    peak_p = 0.0
+    try:
+        # one analysis slot for the whole stream (CPU governor), held while windows are sent
+        with analysis_slots:
+            # quality gate and hum detection on the start, as on the memory-budget streaming path
+            head = load_wav_mmap_mono_16k(tmp_path, normalize=False, max_seconds=MAX_SECONDS)
+            if QC_ENABLED:
+                quality = assess_signal_quality(head, SAMPLE_RATE, QC_THRESHOLDS)
+                if not quality.ok:
+                    yield json.dumps({"type": "summary", **_poor_quality_response(mode, quality)}) + "\n"
+                    return
+            notch_freqs = _mains_hum(head)
+            del head
+
+            for w in stream_predictions(tmp_path, cfg["runner"], mode, threshold=0.30, hop_seconds=hop_seconds,
+                                        notch_freqs=notch_freqs):
+                windows += 1
+                peak_p = max(peak_p, w.probability)
+                recent.append(w)
+                recent_seconds += w.window_seconds
+                while len(recent) > 1 and recent_seconds - recent[0].window_seconds >= lookback_seconds:
+                    recent_seconds -= recent.popleft().window_seconds
+
+                yield json.dumps({
+                    "type": "window",
+                    "start_s": round(w.start_seconds, 3),
+                    "seconds": round(w.window_seconds, 3),
+                    "label": w.label,
+                    "probability": w.probability,
+                }) + "\n"
+
+            detected, confidence_pct, prob = sigmoid_to_result(peak_p, threshold=0.30)
+            reco = build_recommendation(mode, list(recent), lookback_seconds=lookback_seconds)
+            yield json.dumps({
+                "type": "summary",
+                "mode": mode,
+                "status": "completed",
+                "result": "abnormal" if detected else "normal",
+                "ai_confidence_pct": confidence_pct,
+                cfg["flag_key"]: detected,
+                "recommendation": {
+                    "status": reco.status,
+                    "confidence_pct": reco.confidence_pct,
+                    "consistency_text": reco.consistency_text,
+                    "recommendation": reco.recommendation,
+                },
+                "debug": {cfg["prob_key"]: prob, "windows": windows, "mains_hum_hz": notch_freqs},
+            }) + "\n"
+
+    except Exception as e:
+        print("=== INFERENCE ERROR ===")
+        print(traceback.format_exc())
+        yield json.dumps({"type": "error", "status": "error", "detail": str(e)}) + "\n"
+
     finally:
-        if tmp_path and os.path.exists(tmp_path):
-            try:
-                os.remove(tmp_path)
-            except:
-                pass
-  
+        _remove_quietly(tmp_path)
+
+@app.post("/infer/{mode}/stream")
+async def infer_stream(
+    mode: str,
+    file: UploadFile = File(...),
+    hop_seconds: Optional[float] = Query(None, gt=0, description="Window hop (default: half a window)"),
+    lookback_seconds: float = Query(30.0, gt=0, description="Span used for the final recommendation"),
+):
+    """
+    Bounded-memory analysis of very long recordings (see runtime/streaming.py).
+    Returns application/x-ndjson, one line per window as it is produced.
+    """
+    _mode_config(mode)
+    tmp_path = await _save_upload(file)
+    return StreamingResponse(
+        _stream_lines(mode, tmp_path, hop_seconds, lookback_seconds),
+        media_type="application/x-ndjson",
+    )
+
+# -------------------------
+# Async jobs
+# -------------------------
+def _run_job(job) -> dict:
+    """
+    Worker-thread handler: payload is (tmp_path, windowed, hop_seconds, progressive_margin).
+    """
+    tmp_path, windowed, hop_seconds, progressive_margin = job.payload
+    try:
+        return _analyze_file(job.mode, tmp_path, windowed, hop_seconds, progressive_margin=progressive_margin,
+                             endpoint="job")
+    except Exception:
+        print("=== INFERENCE ERROR ===")
+        print(traceback.format_exc())
+        raise
+    finally:
+        _remove_quietly(tmp_path)
+
+job_queue = JobQueue(_run_job, workers=JOB_WORKERS, max_depth=JOB_QUEUE_DEPTH, result_ttl=JOB_RESULT_TTL)
+
+@app.on_event("startup")
+def _start_job_workers():
+    job_queue.start()
+
+def _warmup_steps(path: str, pcm: bytes) -> dict:
+    """
+    Every request path once per model, on a 44.1 kHz stereo recording so
+    decoding also resamples and downmixes.
+    """
+    steps = {}
+    for mode in ("heart", "lung"):
+        steps[f"{mode}_single"] = lambda mode=mode: _run_file(mode, path, False, None)
+        steps[f"{mode}_windowed"] = lambda mode=mode: _run_file(mode, path, True, None, load_wav_mmap_mono_16k)
+        steps[f"{mode}_progressive"] = lambda mode=mode: _run_file(mode, path, False, None, progressive_margin=1.0)
+        steps[f"{mode}_pcm"] = lambda mode=mode: _run_pcm(mode, pcm_from_bytes(pcm, "int16", 2), 44100,
+                                                          False, None, {"path": "full"})
+        steps[f"{mode}_stream"] = lambda mode=mode: list(stream_predictions(path, _mode_config(mode)["runner"], mode))
+    return steps
+
+@app.on_event("startup")
+def _warm_up():
+    """
+    Runs before the server accepts connections; the report is in /health.
+    """
+    global warmup_report
+    if not WARMUP:
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "warmup.wav")
+        sf.write(path, synthetic_recording(), 44100, subtype="PCM_16")
+        pcm = (synthetic_recording(4.0) * 32767).astype("<i2").tobytes()
+        warmup_report = run_warmup(_warmup_steps(path, pcm))
+    print(f"Warm-up finished in {warmup_report['total_ms']:.0f} ms")
+
+def _queue_full_response(retry_after: int):
+    return JSONResponse(
+        status_code=429,
+        headers={"Retry-After": str(retry_after)},
+        content={"status": "error", "detail": "Inference queue is full, retry later.", "retry_after": retry_after},
+    )
+
+@app.post("/jobs/{mode}", status_code=202)
+async def submit_job(
+    mode: str,
+    file: UploadFile = File(...),
+    windowed: bool = Query(False, description="Analyse the full recording in overlapping windows"),
+    hop_seconds: Optional[float] = Query(None, gt=0, description="Window hop (default: half a window)"),
+    progressive: bool = Query(False, description="Single-clip: stop early once the first seconds are conclusive"),
+    margin: Optional[float] = Query(None, ge=0, description="Early-exit distance from the threshold (default AI_PROGRESSIVE_MARGIN)"),
+):
+    """
+    Queue a recording for analysis. Returns a job id to poll with GET /jobs/{job_id};
+    429 + Retry-After when the queue is full (load shedding).
+    """
+    _mode_config(mode)
+
+    # shed load before reading the body
+    if job_queue.full():
+        return _queue_full_response(job_queue.shed())
+
+    tmp_path = await _save_upload(file)
+    try:
+        # reject over-budget recordings now rather than from the worker
+        _budget_plan(tmp_path, windowed)
+    except MemoryBudgetExceeded as e:
+        _remove_quietly(tmp_path)
+        raise _budget_exceeded(e)
+
+    try:
+        job = job_queue.submit(mode, (tmp_path, windowed, hop_seconds, _progressive_margin(progressive, margin)))
+    except QueueFull as e:
+        _remove_quietly(tmp_path)
+        return _queue_full_response(e.retry_after)
+
+    return JSONResponse(status_code=202, content={
+        "job_id": job.id,
+        "status": job.status,
+        "queue_depth": job_queue.stats()["queue_depth"],
+    })
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = Query(0.0, ge=0, description="Long-poll up to this many seconds")):
+    # on the event loop: a long-poll must not hold a threadpool thread that analyses and /health need
+    job = await job_queue.wait_async(job_id, min(wait, JOB_MAX_WAIT))
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired job: {job_id}")
+    return job.to_dict()
+
+@app.get("/metrics")
+def metrics():
+    workspaces = workspace_stats()
+    return {
+        "jobs": job_queue.stats(),
+        "dsp_workspace": workspaces,
+        "process": {"pid": os.getpid(), **process_memory()},
+        "memory": {"trace": MEMORY_TRACE, "budget_bytes": MEMORY_BUDGET, "request_budget_bytes": REQUEST_BUDGET,
+                   "workspace_retained_bytes": workspaces["buffer_bytes"], **memory_stats.snapshot()},
+        "capture": slow_capture.stats() if slow_capture else None,
+        "latency": request_latency.snapshot(),
+    }
+
 # -------------------------  
 # Run server  
 # -------------------------  
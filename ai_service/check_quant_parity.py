@@ -0,0 +1,67 @@
+"""
+Parity check between a float TFLite model and its int8/uint8 build.
+
+Usage:
+    python check_quant_parity.py models/heart_model.tflite models/heart_model_int8.tflite
+    python check_quant_parity.py <float.tflite> <quant.tflite> --wav-dir recordings/
+
+Without --wav-dir, random log-mel tensors in the usual dB range (-80..0) are used.
+With --wav-dir, every WAV goes through the same decode -> preprocess -> to_features
+path as the service.
+"""
+
+import argparse
+import json
+from pathlib import Path
+
+import numpy as np
+
+from runtime.tflite_runner import TFLiteRunner, compare_runners
+
+
+def _synthetic_inputs(runner: TFLiteRunner, count: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    shape = tuple(int(v) for v in runner.input_shape)
+    for _ in range(count):
+        yield rng.uniform(-80.0, 0.0, size=shape).astype(np.float32)
+
+
+def _wav_inputs(runner: TFLiteRunner, wav_dir: Path, mode: str):
+    from runtime.audio_preprocessing import preprocess_audio
+    from runtime.features import SAMPLE_RATE, load_wav_mono_16k, to_features
+
+    for path in sorted(wav_dir.glob("*.wav")):
+        y = load_wav_mono_16k(str(path))
+        y = preprocess_audio(y, SAMPLE_RATE, mode=mode)
+        yield to_features(y, runner)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("float_model")
+    parser.add_argument("quant_model")
+    parser.add_argument("--wav-dir", type=Path, default=None)
+    parser.add_argument("--mode", choices=["heart", "lung"], default="heart")
+    parser.add_argument("--count", type=int, default=64, help="synthetic inputs when no --wav-dir")
+    parser.add_argument("--threshold", type=float, default=0.30)
+    args = parser.parse_args()
+
+    ref = TFLiteRunner(args.float_model)
+    cand = TFLiteRunner(args.quant_model)
+
+    if tuple(ref.input_shape) != tuple(cand.input_shape):
+        raise SystemExit(f"Input shape mismatch: {ref.input_shape} vs {cand.input_shape}")
+
+    if args.wav_dir is not None:
+        inputs = list(_wav_inputs(ref, args.wav_dir, args.mode))
+    else:
+        inputs = list(_synthetic_inputs(ref, args.count))
+
+    report = compare_runners(ref, cand, inputs, threshold=args.threshold)
+    report["reference_dtype"] = np.dtype(ref.input_dtype).name
+    report["candidate_dtype"] = np.dtype(cand.input_dtype).name
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
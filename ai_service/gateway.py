@@ -0,0 +1,207 @@
+"""
+Scale-out gateway: one address in front of several AI service instances
+(on this host or others), so the backend's services.ai_service.url can
+stay a single URL.
+
+  * routing: consistent hashing on the audio in the request (same
+    recording -> same instance) with bounded loads, least-outstanding for
+    everything else (runtime/routing.py)
+  * health: every instance's /health is polled; failing instances leave
+    the rotation until they answer again
+  * retries: a request that could not reach an instance, or got 429 / 502 /
+    503 / 504 from it, is sent to the next instance (the body is buffered,
+    so uploads can be replayed)
+  * jobs: POST /jobs/{mode} ids are prefixed with the instance index, and
+    GET /jobs/{id} goes back to that instance
+
+Every proxied response carries X-Gateway-Instance. GET /health reports the
+gateway and its instances; everything else is forwarded unchanged.
+
+Usage:
+    uvicorn app:app --port 8002 &  uvicorn app:app --port 8003 &
+    python gateway.py --instance http://127.0.0.1:8002 --instance http://127.0.0.1:8003
+    AI_GATEWAY_INSTANCES=http://10.0.0.5:8001,http://10.0.0.6:8001 python gateway.py --port 8001
+"""
+
+import argparse
+import asyncio
+import json
+import os
+from typing import List, Optional, Sequence
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+from runtime.routing import InstancePool, content_key
+
+RETRY_STATUSES = {429, 502, 503, 504}
+# hop-by-hop headers (RFC 9110 7.6.1) plus the ones httpx recomputes
+SKIP_HEADERS = {"connection", "keep-alive", "proxy-authenticate", "proxy-authorization", "te", "trailer",
+                "transfer-encoding", "upgrade", "host", "content-length"}
+
+
+def _forward_headers(headers) -> dict:
+    return {k: v for k, v in headers.items() if k.lower() not in SKIP_HEADERS}
+
+
+def create_app(urls: Sequence[str], retries: int = 2, health_interval: float = 5.0,
+               timeout: float = 300.0, load_factor: float = 0.25) -> FastAPI:
+    pool = InstancePool(urls, load_factor=load_factor)
+    gateway = FastAPI(title="AI Stethoscope Gateway")
+    state = {"client": None, "health_task": None}
+
+    async def check(inst):
+        try:
+            r = await state["client"].get(f"{inst.url}/health", timeout=min(5.0, health_interval or 5.0))
+            ok = r.status_code == 200 and r.json().get("status") == "ok"
+            pool.mark_checked(inst, ok, None if ok else f"/health returned {r.status_code}")
+        except (httpx.HTTPError, ValueError) as e:
+            pool.mark_checked(inst, False, f"{type(e).__name__}: {e}")
+
+    async def health_loop():
+        while True:
+            await asyncio.gather(*(check(inst) for inst in pool.instances))
+            await asyncio.sleep(health_interval)
+
+    @gateway.on_event("startup")
+    async def _startup():
+        state["client"] = httpx.AsyncClient(timeout=httpx.Timeout(timeout, connect=5.0))
+        if health_interval > 0:
+            state["health_task"] = asyncio.create_task(health_loop())
+
+    @gateway.on_event("shutdown")
+    async def _shutdown():
+        if state["health_task"] is not None:
+            state["health_task"].cancel()
+        await state["client"].aclose()
+
+    async def send(inst, request: Request, path: str, body: bytes) -> httpx.Response:
+        url = f"{inst.url}/{path}"
+        if request.url.query:
+            url += "?" + request.url.query
+        upstream = state["client"].build_request(request.method, url, content=body,
+                                                 headers=_forward_headers(request.headers))
+        return await state["client"].send(upstream, stream=True)
+
+    async def relay(inst, upstream: httpx.Response, rewrite_job: bool = False) -> Response:
+        """
+        Stream the instance's response back; the request stays outstanding
+        on the instance until the last byte has been relayed.
+        """
+        headers = _forward_headers(upstream.headers)
+        headers["X-Gateway-Instance"] = inst.url
+
+        if rewrite_job:
+            try:
+                content = json.loads(await upstream.aread())
+                if isinstance(content, dict) and "job_id" in content:
+                    content["job_id"] = f"{pool.index(inst)}-{content['job_id']}"
+                headers.pop("content-encoding", None)
+                return Response(json.dumps(content), status_code=upstream.status_code,
+                                headers=headers, media_type="application/json")
+            finally:
+                await upstream.aclose()
+                pool.release(inst)
+
+        async def body():
+            try:
+                async for chunk in upstream.aiter_raw():
+                    yield chunk
+            finally:
+                await upstream.aclose()
+                pool.release(inst)
+
+        return StreamingResponse(body(), status_code=upstream.status_code, headers=headers)
+
+    async def proxy(request: Request, path: str, pinned: Optional[int] = None, rewrite_job: bool = False):
+        body = await request.body()
+        key = content_key(request.url.path, request.headers.get("content-type", ""), body)
+        tried: List = []
+        last_error = "no instance available"
+
+        for _ in range(1 if pinned is not None else retries + 1):
+            inst = pool.acquire_index(pinned) if pinned is not None else pool.acquire(key, exclude=tried)
+            if inst is None:
+                break
+            tried.append(inst)
+
+            try:
+                upstream = await send(inst, request, path, body)
+            except httpx.HTTPError as e:
+                pool.release(inst)
+                last_error = f"{inst.url}: {type(e).__name__}: {e}"
+                pool.mark_failed(inst, last_error)
+                continue
+
+            if upstream.status_code in RETRY_STATUSES and pinned is None and len(tried) <= retries:
+                last_error = f"{inst.url}: HTTP {upstream.status_code}"
+                await upstream.aclose()
+                pool.release(inst)
+                if upstream.status_code != 429:       # a full queue is load, not failure
+                    pool.mark_failed(inst, last_error)
+                continue
+            return await relay(inst, upstream, rewrite_job)
+
+        return JSONResponse(status_code=503, content={"status": "error", "detail": f"Gateway: {last_error}"})
+
+    @gateway.get("/health")
+    def health():
+        instances = pool.stats()
+        healthy = sum(i["healthy"] for i in instances)
+        return JSONResponse(status_code=200 if healthy else 503, content={
+            "status": "ok" if healthy else "unavailable",
+            "gateway": True,
+            "healthy_instances": healthy,
+            "instances": instances,
+        })
+
+    @gateway.post("/jobs/{mode}")
+    async def submit_job(mode: str, request: Request):
+        return await proxy(request, f"jobs/{mode}", rewrite_job=True)
+
+    @gateway.get("/jobs/{job_id}")
+    async def get_job(job_id: str, request: Request):
+        index, _, upstream_id = job_id.partition("-")
+        if not index.isdigit() or int(index) >= len(pool.instances) or not upstream_id:
+            return JSONResponse(status_code=404, content={"detail": f"Unknown or expired job: {job_id}"})
+        return await proxy(request, f"jobs/{upstream_id}", pinned=int(index), rewrite_job=True)
+
+    @gateway.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH"])
+    async def forward(path: str, request: Request):
+        return await proxy(request, path)
+
+    gateway.state.pool = pool
+    return gateway
+
+
+def _instances_from_env() -> List[str]:
+    return [u.strip() for u in os.environ.get("AI_GATEWAY_INSTANCES", "").split(",") if u.strip()]
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--instance", action="append", default=None,
+                    help="AI service base URL (repeat; default AI_GATEWAY_INSTANCES, comma-separated)")
+    ap.add_argument("--host", default="0.0.0.0")
+    ap.add_argument("--port", type=int, default=8001)
+    ap.add_argument("--retries", type=int, default=int(os.environ.get("AI_GATEWAY_RETRIES", "2")))
+    ap.add_argument("--health-interval", type=float,
+                    default=float(os.environ.get("AI_GATEWAY_HEALTH_INTERVAL", "5")))
+    ap.add_argument("--timeout", type=float, default=float(os.environ.get("AI_GATEWAY_TIMEOUT", "300")),
+                    help="Seconds to wait for an instance's response")
+    ap.add_argument("--load-factor", type=float, default=float(os.environ.get("AI_GATEWAY_LOAD_FACTOR", "0.25")),
+                    help="Bounded-load slack over the average in-flight requests")
+    args = ap.parse_args(argv)
+
+    urls = args.instance or _instances_from_env()
+    if not urls:
+        ap.error("no instances: pass --instance URL or set AI_GATEWAY_INSTANCES")
+
+    import uvicorn
+    uvicorn.run(create_app(urls, args.retries, args.health_interval, args.timeout, args.load_factor),
+                host=args.host, port=args.port, log_level="info")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,367 @@
+"""
+Offline bulk re-analysis of stored recordings, without the web server.
+
+Every file goes through the service's default path (quality gate ->
+first 11 s -> preprocess_audio -> first 10 s -> to_features ->
+TFLiteRunner) in a pool of worker processes, each with its own
+single-threaded interpreters.
+The gate and the notch read the service's AI_QC_* and AI_HUM_DETECT
+settings.
+Results are appended to the output as they finish, so the output is also
+the checkpoint: rerunning the same command skips files already in it.
+
+With --batch N each task is N files of the same mode: decoded and
+quality-gated one by one, then preprocessed and featurized together
+(runtime/batch_dsp.py) and scored with one batched invoke.
+
+Usage:
+    python reanalyze.py ../backend/storage/app/private/recordings --out scores.csv
+    python reanalyze.py --manifest recordings.csv --out scores.jsonl --workers 8
+    python reanalyze.py recordings/ --out scores.csv --batch 16
+
+A manifest is either one path per line, or a CSV with a "path" column and
+an optional "mode" column (heart/lung, overrides --mode). Relative paths
+are resolved against the manifest's directory.
+"""
+
+import os
+
+# one thread per process: the pool provides the parallelism
+for _var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "NUMBA_NUM_THREADS"):
+    os.environ.setdefault(_var, "1")
+
+import argparse
+import csv
+import json
+import multiprocessing
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+MODELS = {
+    "heart": Path(os.environ.get("AI_HEART_MODEL", BASE_DIR / "models" / "heart_model.tflite")),
+    "lung": Path(os.environ.get("AI_LUNG_MODEL", BASE_DIR / "models" / "lung_model.tflite")),
+}
+MAX_SECONDS = 10        # same crop as app.MAX_SECONDS
+CROP_SECONDS = 11       # preprocessed span: MAX_SECONDS + the service's filter-edge margin
+THRESHOLD = 0.30
+
+FIELDS = ["path", "mode", "result", "probability", "confidence_pct", "duration_s", "elapsed_ms", "error"]
+
+# -------------------------
+# worker process
+# -------------------------
+_runners = {}
+_qc = None              # QualityThresholds, or None when the gate is off
+_hum_detect = True
+
+
+def _init_worker(qc: bool):
+    """
+    The service's AI_QC_* and AI_HUM_DETECT settings, so a file scores here
+    as it would through the API. --no-qc turns the gate off as well.
+    """
+    from runtime.audio_preprocessing import hum_detect_from_env
+    from runtime.signal_quality import qc_enabled_from_env, thresholds_from_env
+
+    global _qc, _hum_detect
+    _qc = thresholds_from_env() if qc and qc_enabled_from_env() else None
+    _hum_detect = hum_detect_from_env()
+
+
+def _runner(mode: str):
+    from runtime.tflite_runner import TFLiteRunner
+
+    if mode not in _runners:
+        _runners[mode] = TFLiteRunner(str(MODELS[mode]), num_threads=1)
+    return _runners[mode]
+
+
+def _score(item) -> dict:
+    import numpy as np
+    from runtime.audio_preprocessing import mains_hum_notches, preprocess_audio
+    from runtime.dsp_workspace import workspace_for
+    from runtime.features import SAMPLE_RATE, normalize_peak, predict, sigmoid_to_result, to_features
+    from runtime.signal_quality import assess_signal_quality
+    from runtime.wav_io import load_wav_mmap_mono_16k
+
+    path, mode = item
+    row = {"path": path, "mode": mode}
+    start = time.perf_counter()
+    try:
+        y = load_wav_mmap_mono_16k(path, normalize=False)
+        row["duration_s"] = round(len(y) / SAMPLE_RATE, 3)
+
+        if _qc is not None:
+            quality = assess_signal_quality(y, SAMPLE_RATE, _qc)
+            if not quality.ok:
+                row["result"] = "retake"
+                row["error"] = "poor signal quality: " + ", ".join(quality.reasons)
+                return row
+
+        notch_freqs = mains_hum_notches(y, SAMPLE_RATE, detect=_hum_detect)
+        y = y[:SAMPLE_RATE * CROP_SECONDS]
+        workspace = workspace_for(len(y))
+        y = preprocess_audio(normalize_peak(y), SAMPLE_RATE, mode=mode, workspace=workspace, notch_freqs=notch_freqs)
+        y = y[:SAMPLE_RATE * MAX_SECONDS]
+
+        runner = _runner(mode)
+        proba = predict(runner, to_features(y, runner, workspace=workspace))
+        detected, confidence_pct, prob = sigmoid_to_result(np.asarray(proba), threshold=THRESHOLD)
+        row.update(result="abnormal" if detected else "normal", probability=prob, confidence_pct=confidence_pct)
+    except Exception as e:
+        row["result"] = "error"
+        row["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        row["elapsed_ms"] = round((time.perf_counter() - start) * 1000.0, 1)
+    return row
+
+
+def _score_batch(items) -> list:
+    """
+    _score for several files of the same mode. If a batched stage fails,
+    the files are scored one by one so each gets its own result or error.
+    """
+    if len(items) == 1:
+        return [_score(items[0])]
+
+    import numpy as np
+    from runtime.audio_preprocessing import mains_hum_notches
+    from runtime.batch_dsp import pad_batch, preprocess_audio_batch, to_features_batch
+    from runtime.features import SAMPLE_RATE, normalize_peak, sigmoid_to_result
+    from runtime.signal_quality import assess_signal_quality
+    from runtime.wav_io import load_wav_mmap_mono_16k
+
+    mode = items[0][1]
+    rows, signals, notch_freqs, scored = [], [], [], []
+    for path, _ in items:
+        row = {"path": path, "mode": mode}
+        rows.append(row)
+        start = time.perf_counter()
+        try:
+            y = load_wav_mmap_mono_16k(path, normalize=False)
+            row["duration_s"] = round(len(y) / SAMPLE_RATE, 3)
+            quality = assess_signal_quality(y, SAMPLE_RATE, _qc) if _qc is not None else None
+            if quality is not None and not quality.ok:
+                row["result"] = "retake"
+                row["error"] = "poor signal quality: " + ", ".join(quality.reasons)
+            else:
+                notch_freqs.append(mains_hum_notches(y, SAMPLE_RATE, detect=_hum_detect))
+                signals.append(normalize_peak(y[:SAMPLE_RATE * CROP_SECONDS]))
+                scored.append(len(rows) - 1)
+        except Exception as e:
+            row["result"] = "error"
+            row["error"] = f"{type(e).__name__}: {e}"
+        finally:
+            row["elapsed_ms"] = round((time.perf_counter() - start) * 1000.0, 1)
+
+    if not scored:
+        return rows
+
+    start = time.perf_counter()
+    try:
+        audio, lengths = pad_batch(signals)
+        audio = preprocess_audio_batch(audio, lengths, SAMPLE_RATE, mode=mode, notch_freqs=notch_freqs)
+        max_samples = SAMPLE_RATE * MAX_SECONDS
+        runner = _runner(mode)
+        x = to_features_batch(audio[:, :max_samples], np.minimum(lengths, max_samples), runner)
+        probas = runner.predict_batch(x, batch_size=len(items))
+    except Exception:
+        return [_score((row["path"], mode)) if i in scored else row for i, row in enumerate(rows)]
+
+    # the batched stages' time is shared evenly between the files in them
+    share_ms = (time.perf_counter() - start) * 1000.0 / len(scored)
+    for i, proba in zip(scored, probas):
+        detected, confidence_pct, prob = sigmoid_to_result(np.asarray(proba), threshold=THRESHOLD)
+        rows[i].update(result="abnormal" if detected else "normal", probability=prob, confidence_pct=confidence_pct,
+                       elapsed_ms=round(rows[i]["elapsed_ms"] + share_ms, 1))
+    return rows
+
+
+def _batches(items, size: int):
+    """
+    Consecutive runs of up to size items with the same mode.
+    """
+    chunk = []
+    for it in items:
+        if chunk and (len(chunk) >= size or it[1] != chunk[0][1]):
+            yield chunk
+            chunk = []
+        chunk.append(it)
+    if chunk:
+        yield chunk
+
+
+# -------------------------
+# inputs / checkpoint
+# -------------------------
+def collect_inputs(source, manifest, mode: str):
+    """
+    [(path, mode)] from a directory walk (*.wav, sorted) or a manifest.
+    """
+    if manifest is not None:
+        manifest = Path(manifest)
+        base = manifest.resolve().parent
+        with open(manifest, newline="") as f:
+            first = f.readline()
+            f.seek(0)
+            if "path" in [c.strip().lower() for c in first.split(",")]:
+                rows = [(r.get("path") or r.get("Path"), (r.get("mode") or mode).strip().lower())
+                        for r in csv.DictReader(f)]
+            else:
+                rows = [(line.strip(), mode) for line in f if line.strip() and not line.startswith("#")]
+        items = [(str(p if Path(p).is_absolute() else base / p), m) for p, m in rows if p]
+    else:
+        items = [(str(p), mode) for p in sorted(Path(source).rglob("*")) if p.suffix.lower() == ".wav" and p.is_file()]
+
+    bad = sorted({m for _, m in items if m not in MODELS})
+    if bad:
+        raise SystemExit(f"Unknown mode(s) in manifest: {', '.join(bad)}")
+    return items
+
+
+def _truncate_partial_line(path: Path):
+    """
+    Drop a half-written last line left by an interrupted run.
+    """
+    with open(path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+
+
+def completed_keys(out: Path) -> set:
+    """
+    (path, mode) pairs already in the output.
+    """
+    if not out.exists() or out.stat().st_size == 0:
+        return set()
+    _truncate_partial_line(out)
+    done = set()
+    with open(out, newline="") as f:
+        if out.suffix.lower() == ".csv":
+            for r in csv.DictReader(f):
+                done.add((r["path"], r["mode"]))
+        else:
+            for line in f:
+                if line.strip():
+                    r = json.loads(line)
+                    done.add((r["path"], r["mode"]))
+    return done
+
+
+class ResultWriter:
+    def __init__(self, out: Path):
+        self.out = out
+        self.is_csv = out.suffix.lower() == ".csv"
+        new = not out.exists() or out.stat().st_size == 0
+        self.f = open(out, "a", newline="")
+        if self.is_csv:
+            self.writer = csv.DictWriter(self.f, fieldnames=FIELDS, extrasaction="ignore")
+            if new:
+                self.writer.writeheader()
+
+    def write(self, row: dict):
+        if self.is_csv:
+            self.writer.writerow({k: row.get(k, "") for k in FIELDS})
+        else:
+            self.f.write(json.dumps({k: row.get(k) for k in FIELDS}) + "\n")
+        # flushed per row so the output is a usable checkpoint
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+
+def _format_eta(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+# -------------------------
+# driver
+# -------------------------
+def run(items, out: Path, workers: int, qc: bool = True, restart: bool = False, progress_every: float = 2.0,
+        batch: int = 1) -> dict:
+    if restart and out.exists():
+        out.unlink()
+
+    done = completed_keys(out)
+    todo = [it for it in items if it not in done]
+    total = len(todo)
+    print(f"{len(items)} recordings, {len(items) - total} already in {out}, {total} to process with {workers} workers",
+          flush=True)
+    if not todo:
+        return {"processed": 0, "errors": 0, "seconds": 0.0}
+
+    # import TensorFlow and the DSP stack once; forked workers share it copy-on-write
+    from runtime.supervisor import preload
+    preload()
+
+    writer = ResultWriter(out)
+    processed = errors = 0
+    start = last_report = time.monotonic()
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork"),
+                                 initializer=_init_worker, initargs=(qc,)) as pool:
+            pending = set()
+            queue = _batches(todo, max(1, batch))
+            # bounded in-flight work: huge archives never materialize all futures
+            for chunk in queue:
+                pending.add(pool.submit(_score_batch, chunk))
+                if len(pending) >= workers * 4:
+                    break
+
+            while pending:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    for row in fut.result():
+                        writer.write(row)
+                        processed += 1
+                        errors += row.get("result") == "error"
+                    nxt = next(queue, None)
+                    if nxt is not None:
+                        pending.add(pool.submit(_score_batch, nxt))
+
+                now = time.monotonic()
+                if now - last_report >= progress_every or processed == total:
+                    rate = processed / max(now - start, 1e-9)
+                    eta = (total - processed) / rate if rate > 0 else 0.0
+                    print(f"{processed}/{total} files  {rate:.2f} files/s  ETA {_format_eta(eta)}  errors {errors}",
+                          flush=True)
+                    last_report = now
+    finally:
+        writer.close()
+
+    return {"processed": processed, "errors": errors, "seconds": round(time.monotonic() - start, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", nargs="?", help="directory of recordings (searched recursively for *.wav)")
+    parser.add_argument("--manifest", help="file list or CSV with a path column instead of a directory")
+    parser.add_argument("--mode", choices=sorted(MODELS), default="heart")
+    parser.add_argument("--out", type=Path, required=True, help="results .csv or .jsonl (also the checkpoint)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--no-qc", action="store_true", help="skip the signal-quality gate")
+    parser.add_argument("--batch", type=int, default=1,
+                        help="files of the same mode per task, preprocessed and scored as one batch")
+    parser.add_argument("--restart", action="store_true", help="discard existing results instead of resuming")
+    args = parser.parse_args()
+
+    if (args.source is None) == (args.manifest is None):
+        parser.error("give either a source directory or --manifest")
+    if args.out.suffix.lower() not in (".csv", ".jsonl"):
+        parser.error("--out must end in .csv or .jsonl")
+
+    items = collect_inputs(args.source, args.manifest, args.mode)
+    summary = run(items, args.out, max(1, args.workers), qc=not args.no_qc, restart=args.restart,
+                  batch=args.batch)
+    print(json.dumps(summary), flush=True)
+    return 0 if summary["errors"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+"""
+Offline replay of slow requests captured by the service (AI_CAPTURE_DIR).
+
+Every capture is run through the same in-process pipeline as its endpoint
+(_run_file for upload/path/job captures, _run_pcm for raw PCM bodies) with
+the captured parameters, `--repeat` times after one warm-up run, with
+per-stage timings. The report compares the captured latency with the
+replayed one and flags captures whose result or probability changed, so a
+capture directory doubles as a benchmark set of real-world inputs.
+
+Usage:
+    python replay.py /var/lib/ai-service/captures
+    python replay.py captures/ --repeat 5 --out replay.jsonl
+
+The service's other settings (AI_MEMORY_BUDGET_MB, AI_HUM_DETECT, models,
+...) come from the environment as usual; capturing itself is disabled.
+"""
+
+import os
+
+# replaying must not capture into the directory being replayed
+os.environ["AI_CAPTURE_DIR"] = ""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+import app
+from runtime.capture import load_captures
+from runtime.memory import StageMemoryTrace
+from runtime.wav_io import load_wav_mmap_mono_16k, load_wav_mono_16k, pcm_from_bytes
+
+PROBABILITY_TOLERANCE = 1e-4
+
+
+def _runner_for(capture: dict):
+    """
+    trace -> result, replaying one capture the way its endpoint ran it.
+    """
+    mode = capture["mode"]
+    params = capture.get("params", {})
+    path = capture["input_path"]
+    margin = params.get("progressive_margin")
+
+    if capture.get("endpoint") == "pcm":
+        body = Path(path).read_bytes()
+        samples = pcm_from_bytes(body, params["sample_format"], params["channels"])
+        plan = params.get("plan", {"path": "full"})
+        return lambda trace: app._run_pcm(mode, samples, params["sample_rate"], params["windowed"],
+                                          params.get("hop_seconds"), plan, margin, trace)
+
+    loader = load_wav_mmap_mono_16k if params.get("loader") == "mmap" else load_wav_mono_16k
+    return lambda trace: app._run_file(mode, path, params.get("windowed", False), params.get("hop_seconds"),
+                                       loader, margin, trace)
+
+
+def replay(capture: dict, repeat: int = 3) -> dict:
+    """
+    Replay one capture; returns the report row.
+    """
+    row = {
+        "id": capture["id"],
+        "endpoint": capture.get("endpoint"),
+        "mode": capture.get("mode"),
+        "captured_ms": capture.get("elapsed_ms"),
+        "captured_stages_ms": capture.get("timings_ms", {}),
+    }
+    try:
+        run = _runner_for(capture)
+        result = run(StageMemoryTrace(False))          # warm-up (lazy imports, JIT, caches)
+
+        elapsed, stages = [], {}
+        for _ in range(max(1, repeat)):
+            trace = StageMemoryTrace(False, timed=True)
+            start = time.perf_counter()
+            result = run(trace)
+            elapsed.append((time.perf_counter() - start) * 1000.0)
+            for name, ms in trace.timings_ms.items():
+                stages.setdefault(name, []).append(ms)
+    except Exception as e:
+        row["error"] = f"{type(e).__name__}: {e}"
+        return row
+
+    summary = app._capture_summary(capture["mode"], result, None)
+    row.update({
+        "replay_ms_min": round(min(elapsed), 3),
+        "replay_ms_median": round(statistics.median(elapsed), 3),
+        "replay_stages_ms": {name: round(statistics.median(v), 3) for name, v in stages.items()},
+        **summary,
+    })
+
+    captured_p, replayed_p = capture.get("probability"), summary["probability"]
+    row["changed"] = (
+        capture.get("result") != summary["result"]
+        or (captured_p is None) != (replayed_p is None)
+        or (captured_p is not None and abs(captured_p - replayed_p) > PROBABILITY_TOLERANCE)
+    )
+    return row
+
+
+def _format_row(row: dict) -> str:
+    if "error" in row:
+        return f"{row['id']}  {row['mode']:<5} {row['endpoint']:<6} ERROR {row['error']}"
+    captured = row["captured_ms"]
+    slowest = max(row["replay_stages_ms"].items(), key=lambda kv: kv[1], default=("-", 0.0))
+    return (f"{row['id']}  {row['mode']:<5} {row['endpoint']:<6} "
+            f"captured {captured if captured is not None else float('nan'):8.1f} ms  "
+            f"replay {row['replay_ms_median']:8.1f} ms (min {row['replay_ms_min']:.1f})  "
+            f"slowest stage {slowest[0]} {slowest[1]:.1f} ms"
+            + ("  CHANGED" if row["changed"] else ""))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Replay captured slow requests with per-stage timings.")
+    parser.add_argument("capture_dir", help="Directory written by the service with AI_CAPTURE_DIR")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per capture (after one warm-up)")
+    parser.add_argument("--out", type=Path, help="Write one JSON report row per capture (.jsonl)")
+    args = parser.parse_args(argv)
+
+    captures = load_captures(args.capture_dir)
+    if not captures:
+        print(f"No captures in {args.capture_dir}", file=sys.stderr)
+        return 1
+
+    rows = []
+    out = args.out.open("w", encoding="utf-8") if args.out else None
+    try:
+        for capture in captures:
+            row = replay(capture, args.repeat)
+            rows.append(row)
+            print(_format_row(row), flush=True)
+            if out:
+                out.write(json.dumps(row) + "\n")
+                out.flush()
+    finally:
+        if out:
+            out.close()
+
+    ok = [r for r in rows if "error" not in r]
+    if ok:
+        print(f"\n{len(ok)}/{len(rows)} replayed, median {np.median([r['replay_ms_median'] for r in ok]):.1f} ms, "
+              f"{sum(r['changed'] for r in ok)} changed")
+    return 0 if len(ok) == len(rows) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
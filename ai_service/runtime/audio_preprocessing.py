@@ -4,12 +4,29 @@ Audio preprocessing module for noise reduction and signal enhancement.
 Includes band-pass filtering, notch filtering, and light denoising.
 """
 
+import os
+from typing import List, Optional, Sequence
+
 import numpy as np
 from scipy import signal
-from scipy.signal import butter, filtfilt, iirnotch
+from scipy.signal import butter, filtfilt, iirnotch, sosfiltfilt, tf2sos
+
+MAINS_FUNDAMENTALS = (50.0, 60.0)   # Europe/Africa/most of Asia, Americas/parts of Asia
+
+
+def _float32_result(filtered: np.ndarray, workspace, name: str) -> np.ndarray:
+    """
+    filtered.astype(float32), written into a workspace buffer when one is given.
+    """
+    if workspace is None:
+        return filtered.astype(np.float32)
+    out = workspace.buffer(name, len(filtered), np.float32)
+    out[...] = filtered
+    return out
 
 
-def bandpass_filter(audio: np.ndarray, sr: int, lowcut: float = 20.0, highcut: float = 2000.0, order: int = 5) -> np.ndarray:
+def bandpass_filter(audio: np.ndarray, sr: int, lowcut: float = 20.0, highcut: float = 2000.0, order: int = 5,
+                    workspace=None) -> np.ndarray:
     """
     Apply band-pass filter to remove frequencies outside the range of interest.
     
@@ -22,6 +39,7 @@ def bandpass_filter(audio: np.ndarray, sr: int, lowcut: float = 20.0, highcut: f
         lowcut: Low frequency cutoff (Hz)
         highcut: High frequency cutoff (Hz)
         order: Filter order (higher = steeper rolloff)
+        workspace: Optional DSPWorkspace (caches coefficients, reuses the output buffer)
     
     Returns:
         Filtered audio signal
@@ -38,13 +56,17 @@ def bandpass_filter(audio: np.ndarray, sr: int, lowcut: float = 20.0, highcut: f
         # If invalid range, return original audio
         return audio
     
-    b, a = butter(order, [low, high], btype='band')
+    if workspace is None:
+        b, a = butter(order, [low, high], btype='band')
+    else:
+        b, a = workspace.memo(("butter", order, low, high), lambda: butter(order, [low, high], btype='band'))
     filtered = filtfilt(b, a, audio)
     
-    return filtered.astype(np.float32)
+    return _float32_result(filtered, workspace, "bandpass")
 
 
-def notch_filter(audio: np.ndarray, sr: int, freq: float = 60.0, quality: float = 30.0) -> np.ndarray:
+def notch_filter(audio: np.ndarray, sr: int, freq: float = 60.0, quality: float = 30.0,
+                 workspace=None) -> np.ndarray:
     """
     Apply notch filter to remove specific frequency (e.g., 50/60 Hz power line noise).
     
@@ -53,6 +75,7 @@ def notch_filter(audio: np.ndarray, sr: int, freq: float = 60.0, quality: float
         sr: Sample rate
         freq: Frequency to remove (Hz) - typically 50 Hz (Europe) or 60 Hz (US/Asia)
         quality: Quality factor (higher = narrower notch)
+        workspace: Optional DSPWorkspace (caches coefficients, reuses the output buffer)
     
     Returns:
         Filtered audio signal
@@ -64,16 +87,115 @@ def notch_filter(audio: np.ndarray, sr: int, freq: float = 60.0, quality: float
     if w0 <= 0 or w0 >= 1:
         return audio
     
-    b, a = iirnotch(w0, quality)
+    if workspace is None:
+        b, a = iirnotch(w0, quality)
+    else:
+        b, a = workspace.memo(("iirnotch", w0, quality), lambda: iirnotch(w0, quality))
     filtered = filtfilt(b, a, audio)
     
-    return filtered.astype(np.float32)
+    return _float32_result(filtered, workspace, "notch")
 
 
-def spectral_subtraction_denoise(audio: np.ndarray, sr: int, noise_duration: float = 0.1) -> np.ndarray:
+def notch_filters(audio: np.ndarray, sr: int, freqs: Sequence[float], quality: float = 30.0,
+                  workspace=None) -> np.ndarray:
     """
-    Apply light spectral subtraction denoising.
-    Estimates noise from the first portion of the audio and subtracts it.
+    Notch every frequency in freqs: none returns the audio untouched, one is
+    notch_filter, several run as one zero-phase SOS cascade (one pass
+    instead of one filtfilt per frequency).
+    """
+    nyquist = sr / 2.0
+    freqs = tuple(f for f in freqs if 0 < f / nyquist < 1)
+    if not freqs:
+        return audio
+    if len(freqs) == 1:
+        return notch_filter(audio, sr, freq=freqs[0], quality=quality, workspace=workspace)
+
+    def design():
+        return np.vstack([tf2sos(*iirnotch(f / nyquist, quality)) for f in freqs])
+
+    sos = design() if workspace is None else workspace.memo(("notch_sos", sr, freqs, quality), design)
+    # scipy's sosfilt kernel needs a writable sos; memoized arrays are read-only
+    filtered = sosfiltfilt(np.array(sos), audio)
+
+    return _float32_result(filtered, workspace, "notch")
+
+
+def detect_mains_hum(audio: np.ndarray, sr: int, fundamentals: Sequence[float] = MAINS_FUNDAMENTALS,
+                     harmonics: int = 3, min_ratio_db: float = 10.0, max_blocks: int = 4,
+                     block_seconds: float = 2.0) -> List[float]:
+    """
+    Mains-hum frequencies (each fundamental and its first `harmonics`
+    multiples) present in the audio.
+
+    Power spectra of up to max_blocks Hann-windowed blocks spread over the
+    recording are averaged. A candidate is hum when its bin (+-1 for mains
+    drift) stands min_ratio_db above the strongest bin 1.5-5 Hz either side:
+    an isolated steady tone. Heart sounds are beat-periodic, so their
+    spectrum is a comb of lines one heart rate apart and a line at 50/60 Hz
+    always has comparable neighbours in that ring; broadband lung sounds
+    have no lines at all. Audio shorter than a block uses one 1 s block;
+    under 1 s returns [].
+
+    Args:
+        audio: Input audio signal
+        sr: Sample rate
+        fundamentals: Mains frequencies to check (Hz)
+        harmonics: Multiples of each fundamental to check (1 = fundamental only)
+        min_ratio_db: Peak-to-neighbourhood power ratio that counts as hum
+        max_blocks: Number of blocks to average
+        block_seconds: Block length (longer = finer resolution, more sensitive)
+
+    Returns:
+        Detected frequencies (Hz), ascending
+    """
+    block = int(block_seconds * sr)
+    if len(audio) < block:
+        block = int(sr)
+    n_blocks = min(max_blocks, len(audio) // block)
+    if n_blocks < 1:
+        return []
+
+    bin_hz = sr / block
+    ring_lo = int(np.ceil(1.5 / bin_hz)) if bin_hz < 1.0 else 3    # outside the Hann main lobe (+-2 bins)
+    ring_hi = max(ring_lo, int(5.0 / bin_hz))
+
+    starts = np.linspace(0, len(audio) - block, n_blocks).astype(int)
+    blocks = np.stack([audio[s:s + block] for s in starts]) * np.hanning(block)
+    # only the bins up to the highest candidate's ring are needed
+    top = int(max(fundamentals) * harmonics / bin_hz) + ring_hi + 1
+    power = np.square(np.abs(np.fft.rfft(blocks, axis=1)[:, :top + 1])).mean(axis=0)
+
+    found = []
+    min_ratio = 10.0 ** (min_ratio_db / 10.0)
+    for f in sorted({k * f0 for f0 in fundamentals for k in range(1, harmonics + 1)}):
+        k = int(round(f / bin_hz))
+        if k + ring_hi >= len(power) or k - ring_hi < 1:
+            continue
+        peak = power[k - 1:k + 2].max()
+        ring = max(power[k - ring_hi:k - ring_lo + 1].max(), power[k + ring_lo:k + ring_hi + 1].max())
+        if peak > 0 and peak >= min_ratio * ring:
+            found.append(float(f))
+    return found
+
+
+def hum_detect_from_env() -> bool:
+    """
+    AI_HUM_DETECT (default 1); 0 restores the fixed 60 Hz notch.
+    """
+    return os.environ.get("AI_HUM_DETECT", "1") != "0"
+
+
+def mains_hum_notches(audio: np.ndarray, sr: int, detect: bool = True) -> List[float]:
+    """
+    Frequencies preprocess_audio should notch: the hum detect_mains_hum
+    finds, or the fixed 60 Hz notch when detection is off.
+    """
+    return detect_mains_hum(audio, sr) if detect else [60.0]
+
+
+def estimate_noise_magnitude(audio: np.ndarray, sr: int, noise_duration: float = 0.1):
+    """
+    Noise magnitude spectrum from the first portion of the audio.
     
     Args:
         audio: Input audio signal
@@ -81,114 +203,194 @@ def spectral_subtraction_denoise(audio: np.ndarray, sr: int, noise_duration: flo
         noise_duration: Duration (seconds) to use for noise estimation
     
     Returns:
-        Denoised audio signal
+        rfft magnitude of the noise segment, or None if the audio is too short
     """
-    # Estimate noise from first portion
     noise_samples = int(noise_duration * sr)
     noise_samples = min(noise_samples, len(audio) // 4)  # Use max 25% of audio
     
     if noise_samples < 100:
         # Too short to estimate noise reliably
-        return audio
+        return None
     
-    # Compute noise spectrum
     noise_segment = audio[:noise_samples]
-    noise_fft = np.fft.rfft(noise_segment)
-    noise_magnitude = np.abs(noise_fft)
-    
-    # Process audio in overlapping windows
-    window_size = 2048
-    hop_size = window_size // 2
-    
-    # Pad audio to ensure we can process all of it
-    padded_length = len(audio) + window_size
-    padded_audio = np.pad(audio, (0, padded_length - len(audio)), mode='constant')
-    
-    # Output buffer
-    output = np.zeros_like(padded_audio)
-    window_count = np.zeros_like(padded_audio)
-    
-    # Hanning window for smooth transitions
-    window = np.hanning(window_size)
-    
-    # Process each window
-    for start in range(0, len(audio) - window_size + 1, hop_size):
+    return np.abs(np.fft.rfft(noise_segment))
+
+
+def denoise_noise_floor(noise_magnitude: np.ndarray, n_bins: int, alpha: float = 1.5) -> np.ndarray:
+    """
+    Noise magnitude interpolated to n_bins and scaled by the over-subtraction factor.
+    """
+    # Interpolate noise magnitude to match segment length (same for every window)
+    if len(noise_magnitude) != n_bins:
+        noise_mag_interp = np.interp(
+            np.linspace(0, 1, n_bins),
+            np.linspace(0, 1, len(noise_magnitude)),
+            noise_magnitude
+        )
+    else:
+        noise_mag_interp = noise_magnitude
+    return alpha * noise_mag_interp
+
+
+def denoise_windows(audio: np.ndarray, starts, window: np.ndarray, noise_floor: np.ndarray,
+                    output: np.ndarray, window_count: np.ndarray, segment_buf: np.ndarray, beta: float = 0.1):
+    """
+    Spectral subtraction of the windows at `starts`, overlap-added into
+    output / window_count (so it can be run a few windows at a time).
+    """
+    window_size = len(window)
+    for start in starts:
         # Extract window
-        segment = padded_audio[start:start + window_size] * window
-        
+        segment = np.multiply(audio[start:start + window_size], window, out=segment_buf)
+
         # FFT
         segment_fft = np.fft.rfft(segment)
         segment_magnitude = np.abs(segment_fft)
         segment_phase = np.angle(segment_fft)
-        
-        # Spectral subtraction (conservative)
-        # Interpolate noise magnitude to match segment length
-        if len(noise_magnitude) != len(segment_magnitude):
-            noise_mag_interp = np.interp(
-                np.linspace(0, 1, len(segment_magnitude)),
-                np.linspace(0, 1, len(noise_magnitude)),
-                noise_magnitude
-            )
-        else:
-            noise_mag_interp = noise_magnitude
-        
+
         # Subtract noise (with floor to avoid over-subtraction)
-        alpha = 1.5  # Over-subtraction factor
-        beta = 0.1   # Spectral floor (prevents complete removal)
         cleaned_magnitude = np.maximum(
-            segment_magnitude - alpha * noise_mag_interp,
+            segment_magnitude - noise_floor,
             beta * segment_magnitude
         )
-        
+
         # Reconstruct signal
         cleaned_fft = cleaned_magnitude * np.exp(1j * segment_phase)
         cleaned_segment = np.fft.irfft(cleaned_fft, n=window_size)
-        
+
         # Add to output with windowing
-        output[start:start + window_size] += cleaned_segment * window
+        output[start:start + window_size] += np.multiply(cleaned_segment, window, out=segment_buf)
         window_count[start:start + window_size] += window
+
+
+def spectral_subtraction_denoise(audio: np.ndarray, sr: int, noise_duration: float = 0.1,
+                                 noise_magnitude: np.ndarray = None, workspace=None) -> np.ndarray:
+    """
+    Apply light spectral subtraction denoising.
+    Estimates noise from the first portion of the audio and subtracts it.
+    
+    Args:
+        audio: Input audio signal
+        sr: Sample rate
+        noise_duration: Duration (seconds) to use for noise estimation
+        noise_magnitude: Precomputed noise spectrum (e.g. from the start of a
+            stream); skips the estimate from this audio's own start
+        workspace: Optional DSPWorkspace; padding, overlap-add accumulators
+            and the output come from its buffers instead of being allocated
+    
+    Returns:
+        Denoised audio signal
+    """
+    if noise_magnitude is None:
+        # Estimate noise from first portion
+        noise_magnitude = estimate_noise_magnitude(audio, sr, noise_duration)
+    
+    if noise_magnitude is None:
+        # Too short to estimate noise reliably
+        return audio
+    
+    # Process audio in overlapping windows
+    window_size = 2048
+    hop_size = window_size // 2
+    n_bins = window_size // 2 + 1
     
+    # Pad audio to ensure we can process all of it
+    padded_length = len(audio) + window_size
+    if workspace is None:
+        padded_audio = np.pad(audio, (0, padded_length - len(audio)), mode='constant')
+        
+        # Output buffer
+        output = np.zeros_like(padded_audio)
+        window_count = np.zeros_like(padded_audio)
+        
+        # Hanning window for smooth transitions
+        window = np.hanning(window_size)
+        segment_buf = np.empty(window_size)
+    else:
+        padded_audio = workspace.buffer("denoise_padded", padded_length, audio.dtype)
+        padded_audio[:len(audio)] = audio
+        padded_audio[len(audio):] = 0
+        
+        output = workspace.buffer("denoise_output", padded_length, audio.dtype, zero=True)
+        window_count = workspace.buffer("denoise_count", padded_length, audio.dtype, zero=True)
+        
+        window = workspace.hann(window_size)
+        segment_buf = workspace.buffer("denoise_segment", window_size, np.float64)
+    
+    noise_floor = denoise_noise_floor(noise_magnitude, n_bins)
+
+    # Process each window
+    denoise_windows(padded_audio, range(0, len(audio) - window_size + 1, hop_size), window, noise_floor,
+                    output, window_count, segment_buf)
+
     # Normalize by window overlap
-    window_count = np.maximum(window_count, 1e-8)
-    output = output / window_count
+    window_count = np.maximum(window_count, 1e-8, out=window_count)
     
     # Trim to original length
-    output = output[:len(audio)]
-    
-    return output.astype(np.float32)
+    n = len(audio)
+    if workspace is None:
+        return (output[:n] / window_count[:n]).astype(np.float32)
+    result = workspace.buffer("denoise", n, np.float32)
+    np.divide(output[:n], window_count[:n], out=result)
+    return result
+
+
+def filter_stage(audio: np.ndarray, sr: int, mode: str = "heart", workspace=None,
+                 notch_freqs: Optional[Sequence[float]] = None) -> np.ndarray:
+    """
+    Steps 1-2 of preprocess_audio: mode band-pass, then the power-line notch
+    at notch_freqs (None: detect_mains_hum on this audio).
+    """
+    if notch_freqs is None:
+        notch_freqs = detect_mains_hum(audio, sr)
 
+    # Step 1: Band-pass filter
+    if mode == "heart":
+        # Heart sounds: 20-2000 Hz (S1 ~30-45 Hz, S2 ~50-70 Hz, murmurs up to 500 Hz)
+        audio = bandpass_filter(audio, sr, lowcut=20.0, highcut=2000.0, order=5, workspace=workspace)
+    else:  # lung
+        # Lung sounds: 20-2000 Hz (normal breath 100-1000 Hz, crackles 100-2000 Hz, wheezes 100-1000 Hz)
+        audio = bandpass_filter(audio, sr, lowcut=20.0, highcut=2000.0, order=5, workspace=workspace)
+
+    # Step 2: Notch filter for power line noise, only where hum is present
+    # (50/60 Hz and harmonics; clean battery-powered captures skip it)
+    return notch_filters(audio, sr, notch_freqs, quality=30.0, workspace=workspace)
 
-def preprocess_audio(audio: np.ndarray, sr: int, mode: str = "heart") -> np.ndarray:
+
+def preprocess_audio(audio: np.ndarray, sr: int, mode: str = "heart", workspace=None,
+                     notch_freqs: Optional[Sequence[float]] = None) -> np.ndarray:
     """
     Complete audio preprocessing pipeline:
     1. Band-pass filter (20-2000 Hz)
-    2. Notch filter (60 Hz power line noise)
+    2. Notch filter at the detected power-line hum frequencies (if any)
     3. Light spectral subtraction denoising
     
     Args:
         audio: Input audio signal
         sr: Sample rate
         mode: "heart" or "lung" (for mode-specific tuning)
+        workspace: Optional DSPWorkspace (runtime.dsp_workspace); the result is
+            then a view into its buffers, valid until its next use
+        notch_freqs: Frequencies to notch; None detects them with
+            detect_mains_hum, [60.0] is the former fixed notch
     
     Returns:
         Preprocessed audio signal
     """
-    # Step 1: Band-pass filter
-    if mode == "heart":
-        # Heart sounds: 20-2000 Hz (S1 ~30-45 Hz, S2 ~50-70 Hz, murmurs up to 500 Hz)
-        audio = bandpass_filter(audio, sr, lowcut=20.0, highcut=2000.0, order=5)
-    else:  # lung
-        # Lung sounds: 20-2000 Hz (normal breath 100-1000 Hz, crackles 100-2000 Hz, wheezes 100-1000 Hz)
-        audio = bandpass_filter(audio, sr, lowcut=20.0, highcut=2000.0, order=5)
-    
-    # Step 2: Notch filter for power line noise (60 Hz for US/Asia, 50 Hz for Europe)
-    audio = notch_filter(audio, sr, freq=60.0, quality=30.0)
-    
+    # Steps 1-2: Band-pass + notch
+    audio = filter_stage(audio, sr, mode=mode, workspace=workspace, notch_freqs=notch_freqs)
+
     # Step 3: Light denoising (spectral subtraction)
-    audio = spectral_subtraction_denoise(audio, sr, noise_duration=0.1)
+    audio = spectral_subtraction_denoise(audio, sr, noise_duration=0.1, workspace=workspace)
     
     # Normalize after preprocessing
     max_val = np.max(np.abs(audio))
+    if workspace is not None:
+        out = workspace.buffer("preprocess", len(audio), np.float32)
+        if max_val > 0:
+            return np.divide(audio, max_val + 1e-9, out=out)
+        out[...] = audio
+        return out
     if max_val > 0:
         audio = audio / (max_val + 1e-9)
     
@@ -0,0 +1,258 @@
+# THESIS/runtime/batch_dsp.py
+"""
+preprocess_audio / to_features over many recordings at once.
+
+Recordings are stacked into one zero-padded (N, samples) array plus a
+lengths vector (pad_batch). The stages that loop over short frames in the
+single path run as a few array calls over the whole batch:
+
+  * spectral subtraction: the 2048-sample windows of all rows as one
+    (rows, frames, 2048) rfft per block, with the cleaned magnitude put
+    back by scaling the spectrum (no angle/exp round trip), overlap-added
+    in the same order as the single path
+  * features: one (rows, frames, N_FFT) rfft and one mel matmul per
+    block, dB against each row's own maximum, returned as (N, H, W, 1)
+    for TFLiteRunner.predict_batch
+
+Blocks are kept small enough for the float64 temporaries to stay in
+cache; larger ones measured slower than the per-recording loop.
+
+Band-pass and notch filtering stay one filtfilt per row over that row's
+samples: the IIR recursion runs row by row inside scipy either way, and
+filtfilt's edge padding depends on each recording's length. Coefficients
+are designed once per batch (per notch set). Mains-hum detection and the
+noise estimate also stay per recording; they only read a few short
+blocks. The heart and respiratory rate estimators are not batched: their
+peak picking and segmentation differ per recording.
+
+Row i of every result equals the single-recording result for
+audio[i, :lengths[i]] within float32 rounding; samples past a row's
+length are zero.
+"""
+
+from collections import defaultdict
+from functools import lru_cache
+from typing import Optional, Sequence, Tuple
+
+import librosa
+import numpy as np
+from scipy.signal import butter, filtfilt, get_window, iirnotch, sosfiltfilt, tf2sos
+
+from .audio_preprocessing import denoise_noise_floor, detect_mains_hum, estimate_noise_magnitude
+from .features import HOP, N_FFT, SAMPLE_RATE, runner_expected_hw
+
+# frames (rows x frames) per batched FFT call: large enough to amortize the
+# per-call overhead, small enough that the float64 temporaries stay in cache
+DENOISE_BLOCK_FRAMES = 32
+FEATURE_BLOCK_FRAMES = 512
+
+
+def pad_batch(signals: Sequence[np.ndarray], dtype=np.float32) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Stack 1-D signals into a zero-padded (N, max length) array and their lengths.
+    """
+    lengths = np.array([len(s) for s in signals], dtype=np.int64)
+    batch = np.zeros((len(signals), int(lengths.max()) if len(signals) else 0), dtype=dtype)
+    for i, s in enumerate(signals):
+        batch[i, :len(s)] = s
+    return batch, lengths
+
+
+def _valid(lengths: np.ndarray, width: int) -> np.ndarray:
+    return np.arange(width)[np.newaxis, :] < lengths[:, np.newaxis]
+
+
+def bandpass_filter_batch(audio: np.ndarray, lengths: np.ndarray, sr: int, lowcut: float = 20.0,
+                          highcut: float = 2000.0, order: int = 5) -> np.ndarray:
+    """
+    bandpass_filter of every row, designed once for the batch.
+    """
+    nyquist = sr / 2.0
+    low = max(0.001, min(lowcut / nyquist, 0.999))
+    high = max(0.001, min(highcut / nyquist, 0.999))
+    if low >= high:
+        return audio
+    b, a = butter(order, [low, high], btype='band')
+    out = np.zeros(audio.shape, dtype=np.float32)
+    for i, n in enumerate(lengths):
+        out[i, :n] = filtfilt(b, a, audio[i, :n])
+    return out
+
+
+def notch_filters_batch(audio: np.ndarray, lengths: np.ndarray, sr: int,
+                        freqs: Sequence[Sequence[float]], quality: float = 30.0) -> np.ndarray:
+    """
+    notch_filters of every row at its own frequencies (freqs[i]), one
+    filter design per distinct set of frequencies.
+    """
+    nyquist = sr / 2.0
+    groups = defaultdict(list)
+    for i, row_freqs in enumerate(freqs):
+        groups[tuple(f for f in row_freqs if 0 < f / nyquist < 1)].append(i)
+
+    out = audio.copy()
+    for group_freqs, rows in groups.items():
+        if not group_freqs:
+            continue
+        if len(group_freqs) == 1:
+            b, a = iirnotch(group_freqs[0] / nyquist, quality)
+            apply = lambda x: filtfilt(b, a, x)
+        else:
+            sos = np.vstack([tf2sos(*iirnotch(f / nyquist, quality)) for f in group_freqs])
+            apply = lambda x: sosfiltfilt(sos, x)
+        for i in rows:
+            out[i, :lengths[i]] = apply(audio[i, :lengths[i]])
+    return out
+
+
+def spectral_subtraction_denoise_batch(audio: np.ndarray, lengths: np.ndarray, sr: int,
+                                       noise_duration: float = 0.1, beta: float = 0.1) -> np.ndarray:
+    """
+    spectral_subtraction_denoise of every row, each with the noise floor
+    of its own start. Rows too short for a noise estimate are returned
+    unchanged.
+    """
+    lengths = np.asarray(lengths)
+    window_size = 2048
+    hop_size = window_size // 2
+    n_bins = window_size // 2 + 1
+    n, width = audio.shape
+    valid = _valid(lengths, width)
+
+    noise_floor = np.zeros((n, n_bins))
+    active = np.zeros(n, dtype=bool)
+    for i in range(n):
+        noise_magnitude = estimate_noise_magnitude(audio[i, :lengths[i]], sr, noise_duration)
+        if noise_magnitude is not None:
+            noise_floor[i] = denoise_noise_floor(noise_magnitude, n_bins)
+            active[i] = True
+
+    n_windows = np.where(active, np.maximum((lengths - window_size) // hop_size + 1, 0), 0)
+    n_frames = int(n_windows.max()) if n else 0
+
+    padded = np.zeros((n, width + window_size), dtype=audio.dtype)
+    padded[:, :width] = np.where(valid, audio, 0)
+    frames = np.lib.stride_tricks.as_strided(
+        padded, shape=(n, n_frames, window_size),
+        strides=(padded.strides[0], hop_size * padded.strides[1], padded.strides[1]), writeable=False
+    )
+    # overlap-add accumulators as (rows, hop blocks, hop): frame f covers blocks f and f + 1
+    output = np.zeros((n, n_frames + 1, hop_size), dtype=audio.dtype)
+    window_count = np.zeros_like(output)
+    window = np.hanning(window_size)
+
+    step = max(1, DENOISE_BLOCK_FRAMES // max(n, 1))
+    for f0 in range(0, n_frames, step):
+        f1 = min(n_frames, f0 + step)
+        segment_fft = np.fft.rfft(frames[:, f0:f1] * window, axis=-1)
+        segment_magnitude = np.abs(segment_fft)
+        cleaned_magnitude = np.maximum(segment_magnitude - noise_floor[:, np.newaxis, :], beta * segment_magnitude)
+        # cleaned_magnitude at the segment's phase, without the angle/exp round trip
+        np.divide(cleaned_magnitude, segment_magnitude, out=cleaned_magnitude, where=segment_magnitude > 0)
+        segment_fft *= cleaned_magnitude
+        cleaned = np.fft.irfft(segment_fft, n=window_size, axis=-1)
+
+        in_row = (np.arange(f0, f1)[np.newaxis, :] < n_windows[:, np.newaxis])[..., np.newaxis]
+        cleaned *= window
+        cleaned *= in_row
+        weights = window * in_row
+        # a block's previous-frame half first, as the single path accumulates
+        output[:, f0 + 1:f1 + 1] += cleaned[..., hop_size:]
+        output[:, f0:f1] += cleaned[..., :hop_size]
+        window_count[:, f0 + 1:f1 + 1] += weights[..., hop_size:]
+        window_count[:, f0:f1] += weights[..., :hop_size]
+
+    output = output.reshape(n, -1)
+    window_count = np.maximum(window_count.reshape(n, -1), 1e-8)
+    covered = min(width, output.shape[1])
+    result = np.zeros((n, width), dtype=np.float32)
+    result[:, :covered] = output[:, :covered] / window_count[:, :covered]
+    result[~valid] = 0
+    result[~active] = audio[~active]
+    return result
+
+
+def preprocess_audio_batch(audio: np.ndarray, lengths: np.ndarray, sr: int, mode: str = "heart",
+                           notch_freqs: Optional[Sequence[Sequence[float]]] = None) -> np.ndarray:
+    """
+    preprocess_audio of every row: band-pass, notch at each row's
+    detected hum (or notch_freqs[i]), spectral subtraction, peak normalize.
+
+    Args:
+        audio: (N, samples) zero-padded recordings (pad_batch)
+        lengths: Samples of each recording
+        sr: Sample rate
+        mode: "heart" or "lung"
+        notch_freqs: Frequencies to notch per row; None detects them with
+            detect_mains_hum on each recording
+
+    Returns:
+        (N, samples) float32, zero past each row's length
+    """
+    lengths = np.asarray(lengths)
+    if notch_freqs is None:
+        notch_freqs = [detect_mains_hum(audio[i, :lengths[i]], sr) for i in range(len(lengths))]
+
+    # Steps 1-2: Band-pass (20-2000 Hz for both modes, as filter_stage) + notch
+    audio = bandpass_filter_batch(audio, lengths, sr, lowcut=20.0, highcut=2000.0, order=5)
+    audio = notch_filters_batch(audio, lengths, sr, notch_freqs, quality=30.0)
+
+    # Step 3: Light denoising (spectral subtraction)
+    audio = spectral_subtraction_denoise_batch(audio, lengths, sr, noise_duration=0.1)
+
+    # Normalize each row after preprocessing
+    max_val = np.max(np.abs(audio), axis=1) if audio.size else np.zeros(len(audio), np.float32)
+    scale = np.where(max_val > 0, max_val + 1e-9, 1).astype(audio.dtype)
+    return (audio / scale[:, np.newaxis]).astype(np.float32)
+
+
+@lru_cache(maxsize=None)
+def _mel_basis_t(n_mels: int) -> np.ndarray:
+    return np.ascontiguousarray(librosa.filters.mel(sr=SAMPLE_RATE, n_fft=N_FFT, n_mels=n_mels).T, dtype=np.float64)
+
+
+def to_features_batch(audio: np.ndarray, lengths: np.ndarray, runner) -> np.ndarray:
+    """
+    to_features of every row (already cropped), as one (N, H, W, 1)
+    float32 tensor: centered STFT, |X|^2, mel projection and
+    power_to_db(ref=row max, top_db=80) fitted to W frames.
+    """
+    H, W, C = runner_expected_hw(runner)
+    if C != 1:
+        raise ValueError(f"Expected channel C=1, got C={C}. Model shape mismatch.")
+
+    lengths = np.asarray(lengths)
+    n, width = audio.shape
+    pad = N_FFT // 2
+    n_frames = 1 + lengths // HOP
+    frames_max = int(n_frames.max()) if n else 0
+
+    padded = np.zeros((n, width + 2 * pad), dtype=np.float32)
+    padded[:, pad:pad + width] = np.where(_valid(lengths, width), audio, 0)
+    frames = np.lib.stride_tricks.as_strided(
+        padded, shape=(n, frames_max, N_FFT),
+        strides=(padded.strides[0], HOP * padded.strides[1], padded.strides[1]), writeable=False
+    )
+    window = get_window("hann", N_FFT, fftbins=True)
+    basis_t = _mel_basis_t(H)
+    in_row = _valid(n_frames, frames_max)
+
+    x = np.zeros((n, H, W, 1), dtype=np.float32)
+    k = min(frames_max, W)
+    step = max(1, FEATURE_BLOCK_FRAMES // max(frames_max, 1))
+    for r0 in range(0, n, step):
+        r1 = min(n, r0 + step)
+        power = np.abs(np.fft.rfft(frames[r0:r1] * window, axis=-1))
+        np.square(power, out=power)
+        # one matmul for every frame of every row in the block
+        mel = (power.reshape(-1, power.shape[-1]) @ basis_t).reshape(r1 - r0, frames_max, H)
+
+        # power_to_db(ref=np.max, amin=1e-10, top_db=80) per row, over its own frames
+        valid = in_row[r0:r1, :, np.newaxis]
+        ref_db = 10.0 * np.log10(np.maximum(1e-10, np.where(valid, mel, 0).max(axis=(1, 2))))
+        mel_db = 10.0 * np.log10(np.maximum(mel, 1e-10)) - ref_db[:, np.newaxis, np.newaxis]
+        floor = np.where(valid, mel_db, -np.inf).max(axis=(1, 2)) - 80.0
+        mel_db = np.maximum(mel_db, floor[:, np.newaxis, np.newaxis])
+
+        x[r0:r1, :, :k, 0] = np.where(valid[:, :k], mel_db[:, :k], 0).transpose(0, 2, 1)
+    return x
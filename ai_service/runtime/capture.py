@@ -0,0 +1,225 @@
+# THESIS/runtime/capture.py
+"""
+Slow-request capture for offline replay (replay.py).
+
+Requests whose analysis time is above a fixed threshold, or above a
+rolling latency percentile of recent requests, keep their input and a
+metadata/timing record in a size-capped ring directory:
+
+    <dir>/<YYYYmmdd-HHMMSS>-<ns>-<id>.wav | .pcm   input exactly as received
+    <dir>/<YYYYmmdd-HHMMSS>-<ns>-<id>.json         endpoint, mode, parameters,
+                                                   per-stage timings, result
+
+The JSON is written last, so a pair without it is an interrupted write and
+is ignored. Once the directory is over max_bytes the oldest pairs are
+deleted. Capturing never fails a request: errors are only counted.
+
+Only the decision is made under the lock every request takes. The request
+thread then pins the input (a hard link to the upload, or a copy when the
+capture directory is on another filesystem) and queues the capture; a
+background writer moves it into place, writes the JSON and prunes. When
+the queue is full the capture is dropped.
+"""
+
+import atexit
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+import uuid
+from collections import deque
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+INPUT_SUFFIXES = (".wav", ".pcm")
+
+
+class LatencyCapture:
+    """
+    threshold_ms: capture everything at least this slow.
+    percentile: capture requests slower than this percentile of the last
+    `window` requests (once min_samples have been seen).
+    Either or both may be set.
+    """
+
+    def __init__(self, directory: str, threshold_ms: Optional[float] = None, percentile: Optional[float] = None,
+                 max_bytes: int = 256 << 20, window: int = 1000, min_samples: int = 50, queue_size: int = 16):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.threshold_ms = threshold_ms
+        self.percentile = percentile
+        self.max_bytes = max_bytes
+        self.min_samples = min_samples
+
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self._observed = 0
+        self._captured = 0
+        self._errors = 0
+        self._dropped = 0
+        self._pruned = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._writer = None
+
+    # -------------------------
+    # decision
+    # -------------------------
+    def _percentile_ms(self) -> Optional[float]:
+        if self.percentile is None or len(self._latencies) < self.min_samples:
+            return None
+        return float(np.percentile(self._latencies, self.percentile))
+
+    def should_capture(self, elapsed_ms: float) -> Optional[str]:
+        """
+        Reason string when this request should be captured, else None.
+        The request is compared with the requests before it, then added.
+        """
+        with self._lock:
+            self._observed += 1
+            cutoff = self._percentile_ms()
+            self._latencies.append(elapsed_ms)
+
+        if self.threshold_ms is not None and elapsed_ms >= self.threshold_ms:
+            return f">= {self.threshold_ms:g} ms"
+        if cutoff is not None and elapsed_ms > cutoff:
+            return f"> p{self.percentile:g} ({cutoff:.1f} ms)"
+        return None
+
+    # -------------------------
+    # ring directory
+    # -------------------------
+    @staticmethod
+    def _new_stem() -> str:
+        # sortable by capture time (pruning relies on it), unique across processes
+        ns = time.time_ns()
+        return f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(ns // 10**9))}-{ns % 10**9:09d}-{uuid.uuid4().hex[:6]}"
+
+    def _write(self, stem: str, meta: dict, staged: Optional[Path], data: Optional[bytes], suffix: str):
+        input_path = self.directory / (stem + suffix)
+        if data is not None:
+            input_path.write_bytes(data)
+        else:
+            os.replace(staged, input_path)
+
+        meta = {**meta, "input": input_path.name, "input_bytes": input_path.stat().st_size}
+        tmp = self.directory / (stem + ".json.tmp")
+        tmp.write_text(json.dumps(meta, indent=2, default=str))
+        os.replace(tmp, self.directory / (stem + ".json"))
+
+    def _prune(self):
+        """
+        Delete the oldest capture pairs until the directory fits max_bytes.
+        Writer thread only.
+        """
+        sizes = {}
+        for p in self.directory.iterdir():
+            if p.is_file():
+                stem = p.name.split(".", 1)[0]
+                sizes[stem] = sizes.get(stem, 0) + p.stat().st_size
+
+        total = sum(sizes.values())
+        for stem in sorted(sizes):         # names start with the capture time
+            if total <= self.max_bytes:
+                break
+            for p in self.directory.glob(stem + ".*"):
+                p.unlink(missing_ok=True)
+            total -= sizes[stem]
+            with self._lock:
+                self._pruned += 1
+
+    def _write_loop(self):
+        while True:
+            stem, meta, staged, data, suffix = self._queue.get()
+            try:
+                self._write(stem, meta, staged, data, suffix)
+                with self._lock:
+                    self._captured += 1
+                self._prune()
+            except Exception:
+                with self._lock:
+                    self._errors += 1
+            finally:
+                self._queue.task_done()
+
+    def _ensure_writer(self):
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="latency-capture", daemon=True)
+                self._writer.start()
+                atexit.register(self.flush)
+
+    def observe(self, elapsed_ms: float, meta: dict, source_path: Optional[str] = None,
+                data: Optional[bytes] = None, suffix: str = ".wav") -> Optional[str]:
+        """
+        Record one request's latency; capture it (input from source_path or
+        data) if it is slow. Returns the capture id, or None. The capture is
+        on disk once the background writer gets to it (see flush()).
+        """
+        reason = self.should_capture(elapsed_ms)
+        if reason is None:
+            return None
+        self._ensure_writer()
+
+        stem = self._new_stem()
+        staged = None
+        try:
+            if data is None:
+                # the caller may delete source_path as soon as this returns
+                staged = self.directory / (stem + suffix + ".part")
+                try:
+                    os.link(source_path, staged)
+                except OSError:
+                    shutil.copyfile(source_path, staged)
+            self._queue.put_nowait((stem, {**meta, "elapsed_ms": round(elapsed_ms, 3), "capture_reason": reason},
+                                    staged, data, suffix))
+            return stem
+        except queue.Full:
+            with self._lock:
+                self._dropped += 1
+        except Exception:
+            with self._lock:
+                self._errors += 1
+        if staged is not None:
+            staged.unlink(missing_ok=True)
+        return None
+
+    def flush(self):
+        """
+        Wait until every queued capture has been written.
+        """
+        self._queue.join()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "directory": str(self.directory),
+                "threshold_ms": self.threshold_ms,
+                "percentile": self.percentile,
+                "percentile_ms": self._percentile_ms(),
+                "observed": self._observed,
+                "captured": self._captured,
+                "pruned": self._pruned,
+                "errors": self._errors,
+                "dropped": self._dropped,
+                "queued": self._queue.qsize(),
+                "max_bytes": self.max_bytes,
+            }
+
+
+def load_captures(directory: str) -> List[dict]:
+    """
+    Metadata of every complete capture in directory, oldest first; each
+    dict has "id" and "input_path" added.
+    """
+    captures = []
+    for meta_path in sorted(Path(directory).glob("*.json")):
+        meta = json.loads(meta_path.read_text())
+        input_path = meta_path.with_name(meta.get("input", ""))
+        if not meta.get("input") or not input_path.is_file():
+            continue
+        captures.append({**meta, "id": meta_path.stem, "input_path": str(input_path)})
+    return captures
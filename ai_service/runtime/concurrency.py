@@ -0,0 +1,189 @@
+# THESIS/runtime/concurrency.py
+"""
+One thread budget for every pool in the process.
+
+A request touches several independent thread pools: BLAS / OpenMP under
+numpy (librosa's mel projection), numba (librosa), scipy.fft and the TFLite
+interpreter. Left alone each one sizes itself to the whole machine, so a
+few concurrent requests on a 4-core box run dozens of busy threads and
+tail latency collapses. The governor instead
+
+  1. detects the CPUs this process may actually use: the affinity mask,
+     lowered by a cgroup CPU quota (v2 cpu.max, v1 cfs_quota_us), which is
+     what a container limit looks like from inside
+  2. divides them between server processes (AI_WORKERS), and within a
+     process between concurrently analysed requests (AI_REQUEST_WORKERS)
+  3. gives each request threads_per_request BLAS/OpenMP/numba threads,
+     and each shared TFLite interpreter the process's CPUs: an interpreter
+     runs one invoke at a time (TFLiteRunner's lock), so a per-request
+     share would leave the other cores idle while requests queue on it
+
+Limits reach BLAS / OpenMP / numba through their environment variables,
+so apply_thread_limits() must run before numpy / numba are imported; BLAS
+and OpenMP pools that are already loaded are limited at runtime through
+threadpoolctl (when installed). This module imports neither numpy nor
+anything that does.
+"""
+
+import math
+import os
+import sys
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Optional, Tuple
+
+# read by OpenBLAS, MKL, BLIS, Accelerate, OpenMP runtimes, numexpr and numba at import
+THREAD_ENV_VARS = (
+    "OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "BLIS_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS", "NUMEXPR_NUM_THREADS", "NUMBA_NUM_THREADS",
+)
+
+CGROUP_ROOT = Path("/sys/fs/cgroup")
+
+
+def _read(path: Path) -> Optional[str]:
+    try:
+        return path.read_text().strip()
+    except OSError:
+        return None
+
+
+def cgroup_cpu_limit(root: Path = CGROUP_ROOT) -> Optional[float]:
+    """
+    CPU quota of this process's cgroup in CPUs (e.g. 1.5), or None if unlimited.
+    """
+    root = Path(root)
+
+    # v2: "<quota> <period>" or "max <period>", in the process's own group or at the root
+    own = None
+    for line in (_read(Path("/proc/self/cgroup")) or "").splitlines():
+        if line.startswith("0::"):
+            own = line[3:].lstrip("/")
+    for path in ([root / own / "cpu.max"] if own else []) + [root / "cpu.max"]:
+        value = _read(path)
+        if value:
+            quota, _, period = value.partition(" ")
+            if quota == "max":
+                return None
+            return int(quota) / int(period or 100000)
+
+    # v1: cfs_quota_us = -1 means unlimited
+    for group in ("cpu", "cpu,cpuacct", "cpuacct,cpu"):
+        quota = _read(root / group / "cpu.cfs_quota_us")
+        period = _read(root / group / "cpu.cfs_period_us")
+        if quota is not None and period:
+            return None if int(quota) <= 0 else int(quota) / int(period)
+    return None
+
+
+def available_cpus(root: Path = CGROUP_ROOT) -> Tuple[float, str]:
+    """
+    (CPUs, source): the affinity mask, or the cgroup quota when that is lower.
+    """
+    try:
+        affinity = len(os.sched_getaffinity(0))
+    except AttributeError:
+        affinity = os.cpu_count() or 1
+    limit = cgroup_cpu_limit(root)
+    if limit is not None and limit < affinity:
+        return limit, "cgroup"
+    return float(affinity), "affinity"
+
+
+@dataclass
+class ConcurrencyPlan:
+    cpus: float                     # usable by the whole server
+    cpu_source: str                 # "affinity" | "cgroup"
+    processes: int                  # server processes sharing them (AI_WORKERS)
+    request_workers: int            # requests analysed at once per process
+    threads_per_request: int        # BLAS / OpenMP / numba threads
+    tflite_threads: int             # per shared (one invoke at a time) interpreter
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def plan_concurrency(cpus: float, cpu_source: str = "affinity", processes: int = 1,
+                     request_workers: Optional[int] = None, threads_per_request: Optional[int] = None,
+                     tflite_threads: Optional[int] = None) -> ConcurrencyPlan:
+    """
+    Split cpus between processes, then between requests in a process.
+    Defaults run one single-threaded request per CPU, which keeps every
+    core busy under load without any pool outgrowing its share; the
+    interpreters get the whole process share. Explicit values win.
+    """
+    processes = max(1, int(processes))
+    per_process = max(1, math.floor(cpus / processes))
+    request_workers = max(1, int(request_workers or per_process))
+    share = max(1, per_process // request_workers)
+    threads_per_request = max(1, int(threads_per_request or share))
+    return ConcurrencyPlan(
+        cpus=round(cpus, 3),
+        cpu_source=cpu_source,
+        processes=processes,
+        request_workers=request_workers,
+        threads_per_request=threads_per_request,
+        tflite_threads=max(1, int(tflite_threads or per_process)),
+    )
+
+
+def _env_int(name: str) -> Optional[int]:
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+
+def plan_from_env(root: Path = CGROUP_ROOT) -> ConcurrencyPlan:
+    """
+    Plan from the detected CPUs and AI_WORKERS / AI_REQUEST_WORKERS /
+    AI_BLAS_THREADS / AI_TFLITE_THREADS.
+    """
+    cpus, source = available_cpus(root)
+    return plan_concurrency(
+        cpus, source,
+        processes=_env_int("AI_WORKERS") or 1,
+        request_workers=_env_int("AI_REQUEST_WORKERS"),
+        threads_per_request=_env_int("AI_BLAS_THREADS"),
+        tflite_threads=_env_int("AI_TFLITE_THREADS"),
+    )
+
+
+def apply_thread_limits(threads: int):
+    """
+    Cap BLAS / OpenMP / numba pools at `threads`: environment variables for
+    libraries not loaded yet, runtime limits for those that are.
+    """
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(threads)
+
+    if "numpy" in sys.modules:
+        try:
+            from threadpoolctl import threadpool_limits
+        except ImportError:
+            pass
+        else:
+            threadpool_limits(limits=threads)
+
+
+def thread_report() -> dict:
+    """
+    Thread counts the loaded pools actually use (for /health).
+    """
+    report = {"env": {var: os.environ.get(var) for var in THREAD_ENV_VARS}}
+    if "numpy" in sys.modules:
+        try:
+            from threadpoolctl import threadpool_info
+        except ImportError:
+            report["native_pools"] = None
+        else:
+            report["native_pools"] = [
+                {"api": p["internal_api"], "library": Path(p["filepath"]).name, "num_threads": p["num_threads"]}
+                for p in threadpool_info()
+            ]
+    if "numba" in sys.modules:
+        # the config value, not get_num_threads(), which would start numba's pool
+        import numba
+        report["numba_threads"] = numba.config.NUMBA_NUM_THREADS
+    if "scipy.fft" in sys.modules:
+        import scipy.fft
+        report["scipy_fft_workers"] = scipy.fft.get_workers()
+    return report
@@ -0,0 +1,162 @@
+# THESIS/runtime/dsp_workspace.py
+"""
+Per-worker DSP workspace: preallocated, size-bucketed scratch buffers plus
+cached windows, filter coefficients and mel filterbanks.
+
+Pass a workspace to preprocess_audio() / to_features() and the large
+temporaries (padding, overlap-add accumulators, STFT frames, mel and dB
+matrices, the final feature tensor) are reused across requests instead of
+being allocated each time. Capacities are rounded up to a power of two, so
+recordings of similar length share buffers and steady-state requests do no
+large allocations.
+
+Arrays returned by a function that was given a workspace are views into
+its buffers: they stay valid until the next call that uses the same
+workspace. Use one workspace per thread (get_workspace()).
+
+Buffers live as long as their thread, so only recordings up to
+MAX_SAMPLES use one (workspace_for()); longer ones take the allocating
+path and free their temporaries when done. trim() drops buffers past
+MAX_RETAINED_BYTES that a direct caller may have grown.
+"""
+
+import threading
+import weakref
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+import numpy as np
+
+_MIN_CAPACITY = 4096
+# 2x the service's 10 s single clip at 16 kHz; such a recording leaves ~20 MB
+# of preprocessing and feature buffers behind
+MAX_SAMPLES = 2 * 10 * 16000
+MAX_RETAINED_BYTES = 32 << 20
+
+
+def _bucket(n: int) -> int:
+    cap = _MIN_CAPACITY
+    while cap < n:
+        cap <<= 1
+    return cap
+
+
+class DSPWorkspace:
+    def __init__(self):
+        self._buffers: Dict[Tuple[str, np.dtype], np.ndarray] = {}
+        self._memo: Dict[Hashable, object] = {}
+        self.allocations = 0      # buffers created or grown
+        self.allocated_bytes = 0
+        self.reuses = 0           # requests served from an existing buffer
+        self.released = 0         # buffers dropped by trim()
+        self.released_bytes = 0
+
+    def buffer(self, name: str, shape, dtype=np.float32, zero: bool = False) -> np.ndarray:
+        """
+        Scratch array of the given shape, backed by a named buffer whose
+        capacity only ever grows (in power-of-two buckets).
+        """
+        shape = (shape,) if np.isscalar(shape) else tuple(shape)
+        dtype = np.dtype(dtype)
+        n = int(np.prod(shape)) if shape else 1
+
+        key = (name, dtype)
+        buf = self._buffers.get(key)
+        if buf is None or buf.size < n:
+            buf = np.empty(_bucket(n), dtype=dtype)
+            self._buffers[key] = buf
+            self.allocations += 1
+            self.allocated_bytes += buf.nbytes
+        else:
+            self.reuses += 1
+
+        view = buf[:n].reshape(shape)
+        if zero:
+            view.fill(0)
+        return view
+
+    def trim(self, max_bytes: int = MAX_RETAINED_BYTES) -> int:
+        """
+        Drop the largest buffers until at most max_bytes are kept.
+        Returns the bytes released.
+        """
+        released = 0
+        kept = sum(b.nbytes for b in self._buffers.values())
+        for key, buf in sorted(self._buffers.items(), key=lambda kv: kv[1].nbytes, reverse=True):
+            if kept <= max_bytes:
+                break
+            del self._buffers[key]
+            kept -= buf.nbytes
+            released += buf.nbytes
+            self.released += 1
+        self.released_bytes += released
+        return released
+
+    def memo(self, key: Hashable, factory: Callable[[], object]):
+        """
+        Cache for immutable helpers (windows, filter coefficients, mel bases).
+        """
+        value = self._memo.get(key)
+        if value is None:
+            value = factory()
+            if isinstance(value, np.ndarray):
+                value.setflags(write=False)
+            self._memo[key] = value
+        return value
+
+    def hann(self, n: int) -> np.ndarray:
+        """
+        Symmetric Hann window, same as np.hanning(n).
+        """
+        return self.memo(("hanning", n), lambda: np.hanning(n))
+
+    def stats(self) -> dict:
+        return {
+            "buffers": len(self._buffers),
+            "buffer_bytes": int(sum(b.nbytes for b in self._buffers.values())),
+            "allocations": self.allocations,
+            "allocated_bytes": self.allocated_bytes,
+            "reuses": self.reuses,
+            "released": self.released,
+            "released_bytes": self.released_bytes,
+            "cached": len(self._memo),
+        }
+
+
+_local = threading.local()
+_registry = weakref.WeakSet()   # buffers go away with their thread
+_registry_lock = threading.Lock()
+
+
+def get_workspace() -> DSPWorkspace:
+    """
+    The calling thread's workspace (request threads and job workers each get one).
+    """
+    ws = getattr(_local, "workspace", None)
+    if ws is None:
+        ws = DSPWorkspace()
+        _local.workspace = ws
+        with _registry_lock:
+            _registry.add(ws)
+    return ws
+
+
+def workspace_for(n_samples: int) -> Optional[DSPWorkspace]:
+    """
+    The calling thread's workspace for a recording of n_samples, or None
+    (allocating path) when it is longer than MAX_SAMPLES.
+    """
+    return get_workspace() if n_samples <= MAX_SAMPLES else None
+
+
+def workspace_stats() -> dict:
+    """
+    Totals over every thread's workspace, for /metrics.
+    """
+    with _registry_lock:
+        workspaces = list(_registry)
+    totals = {"workspaces": len(workspaces), "buffer_bytes": 0, "max_samples": MAX_SAMPLES,
+              "max_retained_bytes_per_workspace": MAX_RETAINED_BYTES}
+    for ws in workspaces:
+        for k, v in ws.stats().items():
+            totals[k] = totals.get(k, 0) + v
+    return totals
@@ -0,0 +1,180 @@
+# THESIS/runtime/features.py
+"""
+Decode + log-mel feature extraction shared by the API endpoints,
+windowed analysis and offline tools.
+"""
+
+import numpy as np
+import librosa
+from scipy.signal import get_window
+
+# -------------------------
+# Audio / Feature params
+# -------------------------
+SAMPLE_RATE = 16000
+N_FFT = 1024
+HOP = 512
+
+
+def runner_expected_hw(runner):
+    """
+    Expect model input shape like (1, H, W, C)
+    Returns (H, W, C) as ints.
+    """
+    shape = tuple(int(v) for v in runner.input_shape)
+    if len(shape) != 4:
+        raise ValueError(f"Model input shape must be rank-4 (1,H,W,C). Got: {shape}")
+    _, H, W, C = shape
+    return H, W, C
+
+
+def normalize_peak(y: np.ndarray) -> np.ndarray:
+    # normalize safely
+    y = y / (np.max(np.abs(y)) + 1e-9)
+    return y.astype(np.float32)
+
+
+def load_wav_mono_16k(path: str, normalize: bool = True, max_seconds: float = None) -> np.ndarray:
+    """
+    normalize=False keeps the original level (full scale = 1.0), which the
+    signal-quality gate needs. max_seconds decodes only the start.
+    """
+    y, _ = librosa.load(path, sr=SAMPLE_RATE, mono=True, duration=max_seconds)
+    if not normalize:
+        return y.astype(np.float32, copy=False)
+    return normalize_peak(y)
+
+
+def mel_power(audio: np.ndarray, n_mels: int, center: bool = True) -> np.ndarray:
+    """
+    Mel power spectrogram (n_mels, frames) with the service's STFT params.
+    center=False: frames start at sample 0 (caller supplies the padding).
+    """
+    return librosa.feature.melspectrogram(
+        y=audio,
+        sr=SAMPLE_RATE,
+        n_mels=n_mels,   # <- match model height
+        n_fft=N_FFT,
+        hop_length=HOP,
+        power=2.0,
+        center=center,
+    )
+
+
+def fit_frames(mel_db: np.ndarray, W: int) -> np.ndarray:
+    """
+    Pad/crop time axis to match model width.
+    """
+    if mel_db.shape[1] < W:
+        return np.pad(mel_db, ((0, 0), (0, W - mel_db.shape[1])))
+    return mel_db[:, :W]
+
+
+def _mel_db_workspace(audio: np.ndarray, n_mels: int, W: int, workspace) -> np.ndarray:
+    """
+    Same as power_to_db(mel_power(audio), ref=np.max) fitted to W frames,
+    computed in workspace buffers: centered zero-padded frames, periodic Hann,
+    rfft, |X|^2 and the cached mel basis as one matmul, then dB in place.
+    Returns the (1, n_mels, W, 1) float32 feature buffer.
+    """
+    pad = N_FFT // 2
+    n_frames = 1 + len(audio) // HOP
+
+    padded = workspace.buffer("stft_padded", len(audio) + 2 * pad, np.float32)
+    padded[:pad] = 0
+    padded[pad:pad + len(audio)] = audio
+    padded[pad + len(audio):] = 0
+
+    window = workspace.memo(("hann_periodic", N_FFT), lambda: get_window("hann", N_FFT, fftbins=True))
+    # (n_mels, bins) -> (bins, n_mels) so the product lands as (frames, n_mels)
+    basis_t = workspace.memo(
+        ("mel_basis_t", SAMPLE_RATE, N_FFT, n_mels),
+        lambda: np.ascontiguousarray(librosa.filters.mel(sr=SAMPLE_RATE, n_fft=N_FFT, n_mels=n_mels).T, dtype=np.float64),
+    )
+
+    frames = np.lib.stride_tricks.as_strided(
+        padded, shape=(n_frames, N_FFT), strides=(HOP * padded.strides[0], padded.strides[0]), writeable=False
+    )
+    windowed = workspace.buffer("stft_frames", (n_frames, N_FFT), np.float64)
+    np.multiply(frames, window, out=windowed)
+
+    spec = np.fft.rfft(windowed, axis=1)
+    power = workspace.buffer("stft_power", spec.shape, np.float64)
+    np.abs(spec, out=power)
+    np.square(power, out=power)
+
+    mel = workspace.buffer("mel", (n_frames, n_mels), np.float64)
+    np.dot(power, basis_t, out=mel)
+
+    # power_to_db(ref=np.max, amin=1e-10, top_db=80)
+    ref_db = 10.0 * np.log10(max(1e-10, float(mel.max())))
+    np.maximum(mel, 1e-10, out=mel)
+    np.log10(mel, out=mel)
+    mel *= 10.0
+    mel -= ref_db
+    np.maximum(mel, mel.max() - 80.0, out=mel)
+
+    x = workspace.buffer("features", (1, n_mels, W, 1), np.float32)
+    k = min(n_frames, W)
+    x[0, :, :k, 0] = mel[:k].T
+    x[0, :, k:, 0] = 0
+    return x
+
+
+def to_features(audio: np.ndarray, runner, workspace=None) -> np.ndarray:
+    """
+    Build log-mel features that MATCH the model's expected H (n_mels) and W (frames).
+    This is the #1 fix for heart working but lung crashing.
+
+    With a DSPWorkspace (runtime.dsp_workspace) the STFT/mel/dB temporaries
+    and the returned tensor are reused workspace buffers (equal to the
+    librosa path within float32 rounding); the result is valid until the
+    workspace's next use.
+    """
+    H, W, C = runner_expected_hw(runner)
+
+    if C != 1:
+        raise ValueError(f"Expected channel C=1, got C={C}. Model shape mismatch.")
+
+    if workspace is not None:
+        return _mel_db_workspace(audio, H, W, workspace)
+
+    mel = mel_power(audio, H)
+    mel_db = librosa.power_to_db(mel, ref=np.max)
+
+    mel_db = fit_frames(mel_db, W)
+
+    # keep features in float32; TFLiteRunner quantizes for int8/uint8 models
+    x = mel_db[np.newaxis, ..., np.newaxis].astype(np.float32)
+
+    expected_shape = (1, H, W, 1)
+    if x.shape != expected_shape:
+        raise ValueError(f"Feature shape {x.shape} != expected {expected_shape}")
+
+    return x
+
+
+def predict(runner, x):
+    """
+    Supports different runner method names.
+    """
+    if hasattr(runner, "predict_proba"):
+        return runner.predict_proba(x)
+    if hasattr(runner, "predict"):
+        return runner.predict(x)
+    if hasattr(runner, "run"):
+        return runner.run(x)
+    raise AttributeError("TFLiteRunner missing predict method (predict_proba/predict/run)")
+
+
+def sigmoid_to_result(p, threshold=0.30):
+    """
+    Convert scalar probability to (detected, confidence_pct, prob)
+    confidence_pct is "model confidence", not medical certainty.
+    Expects a dequantized probability; quantized outputs can land a step
+    outside [0, 1], so clip before computing confidence.
+    """
+    p = float(np.clip(np.asarray(p, dtype=np.float32).reshape(-1)[0], 0.0, 1.0))
+    detected = p > threshold
+    conf = p if detected else 1.0 - p
+    return detected, int(round(conf * 100)), p
@@ -0,0 +1,159 @@
+# THESIS/runtime/heart_rate.py
+"""
+Heart rate from a decimated Shannon-energy envelope.
+
+preprocess_audio band-limits the signal to 20-2000 Hz, and S1/S2 energy
+sits well below 1 kHz, so the envelope is computed at ENVELOPE_SR (2 kHz)
+after polyphase decimation instead of from a 16 kHz mel spectrogram:
+
+1. decimate, peak-normalize, Shannon energy -x^2 log x^2, 60 ms moving
+   average, standardize
+2. cardiac cycle length from the envelope autocorrelation (40-200 bpm)
+3. envelope peaks -> S1/S2: a peak followed by a short gap (systole) that
+   is shorter than the next gap (diastole) is S1 and its partner S2;
+   unpaired peaks count as S1
+4. S1-to-S1 intervals close to the cycle length -> bpm (median) and
+   HRV (SDNN, RMSSD)
+"""
+
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+import numpy as np
+from scipy.signal import find_peaks, resample_poly
+
+ENVELOPE_SR = 2000
+MIN_BPM, MAX_BPM = 40, 200
+
+
+@dataclass
+class HeartSoundAnalysis:
+    bpm: Optional[int]
+    cycle_seconds: Optional[float]               # autocorrelation estimate
+    s1_times: List[float] = field(default_factory=list)
+    s2_times: List[float] = field(default_factory=list)
+    beat_intervals: List[float] = field(default_factory=list)   # seconds, S1 to S1
+    sdnn_ms: Optional[float] = None
+    rmssd_ms: Optional[float] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "bpm": self.bpm,
+            "cycle_seconds": None if self.cycle_seconds is None else round(self.cycle_seconds, 3),
+            "s1_count": len(self.s1_times),
+            "s2_count": len(self.s2_times),
+            "beat_intervals": [round(v, 3) for v in self.beat_intervals],
+            "sdnn_ms": None if self.sdnn_ms is None else round(self.sdnn_ms, 1),
+            "rmssd_ms": None if self.rmssd_ms is None else round(self.rmssd_ms, 1),
+        }
+
+
+def shannon_envelope(audio: np.ndarray, sr: int, envelope_sr: int = ENVELOPE_SR,
+                     smooth_seconds: float = 0.06) -> Tuple[np.ndarray, float]:
+    """
+    Standardized Shannon-energy envelope at ~envelope_sr.
+    The smoothing spans a few periods of S1/S2's 30-60 Hz content, so each
+    sound gives one peak instead of one per carrier cycle.
+    Returns (envelope, actual envelope rate).
+    """
+    q = max(1, int(round(sr / envelope_sr)))
+    x = resample_poly(audio, 1, q) if q > 1 else np.asarray(audio, dtype=np.float64)
+    env_sr = sr / q
+
+    peak = np.max(np.abs(x)) if len(x) else 0.0
+    if peak <= 0:
+        return np.zeros(len(x)), env_sr
+
+    x2 = np.square(x / peak)
+    e = -x2 * np.log(x2 + 1e-12)
+
+    win = max(1, int(round(smooth_seconds * env_sr)))
+    e = np.convolve(e, np.full(win, 1.0 / win), mode="same")
+
+    std = np.std(e)
+    if std <= 0:
+        return np.zeros(len(e)), env_sr
+    return (e - np.mean(e)) / std, env_sr
+
+
+def cycle_length(envelope: np.ndarray, env_sr: float) -> Optional[float]:
+    """
+    Cardiac cycle (seconds) from the strongest autocorrelation peak in the
+    MIN_BPM..MAX_BPM lag range. Biased ACF, so shorter lags win ties with
+    their multiples.
+    """
+    min_lag = int(env_sr * 60.0 / MAX_BPM)
+    max_lag = int(env_sr * 60.0 / MIN_BPM)
+    if len(envelope) <= max_lag + 1:
+        return None
+
+    n = len(envelope)
+    spec = np.fft.rfft(envelope, 2 * n)
+    ac = np.fft.irfft(spec.real ** 2 + spec.imag ** 2)[:max_lag + 1]
+
+    peaks, _ = find_peaks(ac[min_lag:max_lag + 1])
+    if len(peaks) == 0:
+        return None
+    lag = min_lag + peaks[np.argmax(ac[min_lag + peaks])]
+    return lag / env_sr
+
+
+def segment_s1_s2(peak_times: np.ndarray, cycle: float) -> Tuple[List[float], List[float]]:
+    """
+    Split envelope peak times into S1 and S2 using the systole < diastole rule.
+    """
+    s1, s2 = [], []
+    i = 0
+    n = len(peak_times)
+    while i < n:
+        if i + 1 < n:
+            gap = peak_times[i + 1] - peak_times[i]
+            next_gap = peak_times[i + 2] - peak_times[i + 1] if i + 2 < n else cycle - gap
+            if gap < 0.6 * cycle and gap < next_gap:
+                s1.append(float(peak_times[i]))
+                s2.append(float(peak_times[i + 1]))
+                i += 2
+                continue
+        s1.append(float(peak_times[i]))
+        i += 1
+    return s1, s2
+
+
+def analyze_heart_sounds(audio: np.ndarray, sr: int) -> HeartSoundAnalysis:
+    """
+    Heart rate, S1/S2 events and HRV from preprocessed (band-limited) audio.
+    bpm is None when no rhythm can be found.
+    """
+    envelope, env_sr = shannon_envelope(audio, sr)
+    cycle = cycle_length(envelope, env_sr)
+    if cycle is None:
+        return HeartSoundAnalysis(bpm=None, cycle_seconds=None)
+
+    # S1 and S2 are >= ~100 ms apart; a peak must stand out of the envelope
+    peaks, _ = find_peaks(envelope, height=0.5, distance=max(1, int(0.1 * env_sr)), prominence=0.5)
+    s1, s2 = segment_s1_s2(peaks / env_sr, cycle)
+
+    intervals = np.diff(s1)
+    lo = max(60.0 / MAX_BPM, 0.7 * cycle)
+    hi = min(60.0 / MIN_BPM, 1.3 * cycle)
+    intervals = intervals[(intervals >= lo) & (intervals <= hi)]
+
+    if len(intervals) >= 2:
+        bpm = 60.0 / float(np.median(intervals))
+    else:
+        bpm = 60.0 / cycle
+
+    sdnn = rmssd = None
+    if len(intervals) >= 3:
+        sdnn = float(np.std(intervals, ddof=1) * 1000.0)
+        rmssd = float(np.sqrt(np.mean(np.square(np.diff(intervals)))) * 1000.0)
+
+    return HeartSoundAnalysis(
+        bpm=int(round(bpm)),
+        cycle_seconds=cycle,
+        s1_times=s1,
+        s2_times=s2,
+        beat_intervals=[float(v) for v in intervals],
+        sdnn_ms=sdnn,
+        rmssd_ms=rmssd,
+    )
@@ -0,0 +1,231 @@
+# THESIS/runtime/jobs.py
+"""
+In-process job queue for asynchronous inference.
+
+A bounded queue feeds a fixed set of worker threads. When the queue is
+full, submit() raises QueueFull with a Retry-After estimate instead of
+letting work pile up until the process runs out of memory. No external
+broker: jobs and results live in this process and are dropped after
+result_ttl seconds. Long-polls from the event loop (wait_async) are woken
+by the worker through the loop, without holding a thread while they wait.
+"""
+
+import asyncio
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional
+
+
+class QueueFull(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"Inference queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+@dataclass
+class Job:
+    id: str
+    mode: str
+    payload: Any
+    status: str = "queued"          # queued | running | completed | error
+    submitted_at: float = field(default_factory=time.monotonic)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    done: threading.Event = field(default_factory=threading.Event, repr=False)
+    waiters: list = field(default_factory=list, repr=False)     # (loop, asyncio.Event) of async long-polls
+
+    def to_dict(self) -> dict:
+        d = {"job_id": self.id, "mode": self.mode, "status": self.status}
+        if self.started_at is not None:
+            d["queue_wait_ms"] = round((self.started_at - self.submitted_at) * 1000.0, 1)
+        if self.finished_at is not None and self.started_at is not None:
+            d["run_ms"] = round((self.finished_at - self.started_at) * 1000.0, 1)
+        if self.result is not None:
+            d["result"] = self.result
+        if self.error is not None:
+            d["detail"] = self.error
+        return d
+
+
+class JobQueue:
+    def __init__(self, handler: Callable[[Job], dict], workers: int = 1, max_depth: int = 8,
+                 result_ttl: float = 600.0):
+        """
+        handler(job) -> result dict, run on a worker thread.
+        """
+        self.handler = handler
+        self.workers = max(1, int(workers))
+        self.max_depth = max(1, int(max_depth))
+        self.result_ttl = result_ttl
+
+        self._queue = queue.Queue(maxsize=self.max_depth)
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._threads = []
+        self._running = 0
+        self._counters = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0}
+        self._waits = deque(maxlen=200)      # recent queue waits (s)
+        self._run_times = deque(maxlen=200)  # recent handler times (s)
+
+    # -------------------------
+    # lifecycle
+    # -------------------------
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f"inference-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                self._queue.task_done()
+                return
+
+            with self._lock:
+                self._running += 1
+            job.status = "running"
+            job.started_at = time.monotonic()
+            self._waits.append(job.started_at - job.submitted_at)
+
+            try:
+                job.result = self.handler(job)
+                job.status = "completed"
+            except Exception as e:
+                job.error = str(e)
+                job.status = "error"
+            finally:
+                job.finished_at = time.monotonic()
+                self._run_times.append(job.finished_at - job.started_at)
+                with self._lock:
+                    self._running -= 1
+                    self._counters["completed" if job.status == "completed" else "failed"] += 1
+                    job.done.set()
+                    waiters, job.waiters = job.waiters, []
+                for loop, event in waiters:
+                    try:
+                        loop.call_soon_threadsafe(event.set)
+                    except RuntimeError:        # loop already closed
+                        pass
+                self._queue.task_done()
+
+    def shutdown(self):
+        for _ in self._threads:
+            self._queue.put(None)
+        for t in self._threads:
+            t.join()
+        self._threads = []
+
+    # -------------------------
+    # API
+    # -------------------------
+    def full(self) -> bool:
+        return self._queue.full()
+
+    def retry_after(self) -> int:
+        """
+        Seconds until a queue slot is likely free: one queue's worth of
+        recent average run time spread over the workers.
+        """
+        avg = (sum(self._run_times) / len(self._run_times)) if self._run_times else 1.0
+        return max(1, int(round(avg * self._queue.qsize() / self.workers)))
+
+    def shed(self) -> int:
+        """
+        Count a request turned away before submit() (queue already full)
+        and return its Retry-After.
+        """
+        with self._lock:
+            self._counters["rejected"] += 1
+        return self.retry_after()
+
+    def submit(self, mode: str, payload: Any) -> Job:
+        self._evict_expired()
+        job = Job(id=uuid.uuid4().hex, mode=mode, payload=payload)
+
+        # register before enqueueing so a fast worker cannot finish an unknown job
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job.id]
+                self._counters["rejected"] += 1
+            raise QueueFull(self.retry_after())
+
+        with self._lock:
+            self._counters["submitted"] += 1
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self._evict_expired()
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def wait(self, job_id: str, timeout: float) -> Optional[Job]:
+        """
+        Long-poll: block up to timeout seconds for the job to finish.
+        """
+        job = self.get(job_id)
+        if job is not None and timeout > 0:
+            job.done.wait(timeout)
+        return job
+
+    async def wait_async(self, job_id: str, timeout: float) -> Optional[Job]:
+        """
+        wait() for async handlers: suspends the caller's coroutine, not a thread.
+        """
+        job = self.get(job_id)
+        if job is None or timeout <= 0:
+            return job
+
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            if job.done.is_set():
+                return job
+            job.waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter[1].wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._lock:
+                if waiter in job.waiters:
+                    job.waiters.remove(waiter)
+        return job
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        with self._lock:
+            expired = [
+                jid for jid, j in self._jobs.items()
+                if j.finished_at is not None and now - j.finished_at > self.result_ttl
+            ]
+            for jid in expired:
+                del self._jobs[jid]
+
+    def stats(self) -> dict:
+        waits = sorted(self._waits)
+        with self._lock:
+            running = self._running
+            counters = dict(self._counters)
+        return {
+            "queue_depth": self._queue.qsize(),
+            "max_depth": self.max_depth,
+            "workers": self.workers,
+            "running": running,
+            **counters,
+            "wait_ms_avg": round(sum(waits) / len(waits) * 1000.0, 1) if waits else 0.0,
+            "wait_ms_p95": round(waits[int(0.95 * (len(waits) - 1))] * 1000.0, 1) if waits else 0.0,
+        }
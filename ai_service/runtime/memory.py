@@ -0,0 +1,196 @@
+# THESIS/runtime/memory.py
+"""
+Per-stage peak-memory tracing and per-request memory budgets.
+
+Tracing (opt-in) uses tracemalloc, which sees numpy/scipy array buffers:
+each stage records its peak allocation above what was live when it
+started. tracemalloc is process-wide, so the numbers are exact with one
+request in flight (a sizing run) and include other requests' allocations
+under concurrency. It also slows allocation-heavy code down noticeably.
+
+Budgets work from the container header only (soundfile.info: rate,
+channels, frames), before anything is decoded. The estimate is calibrated
+against the traced pipeline:
+
+  decode    float32 interleaved + mono mixdown + 16 kHz resample output
+  pipeline  ~40 bytes per 16 kHz sample while preprocess_audio runs
+            (raw + peak-normalized copies, float64 filtfilt intermediates,
+            spectral-subtraction padding/accumulators)
+
+The first decode in a process also pays one-time resampler setup that
+the estimate leaves out.
+"""
+
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import soundfile as sf
+
+from .features import SAMPLE_RATE
+
+DECODE_BYTES_PER_SAMPLE = 4          # float32
+PIPELINE_BYTES_PER_SAMPLE = 40       # per 16 kHz sample, peak during preprocessing
+FIXED_OVERHEAD_BYTES = 8 << 20       # features, interpreter I/O, response
+CROP_MARGIN_SECONDS = 1.0            # decoded past the analysed span so filter edges stay outside it
+
+
+# -------------------------
+# tracing
+# -------------------------
+def start_tracing():
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+class StageMemoryTrace:
+    """
+    with trace.stage("preprocess"): ...  -> trace.stages["preprocess"] = peak bytes,
+    and with timed=True trace.timings_ms["preprocess"] = wall time (slow-request
+    capture / replay). Disabled traces cost one flag check per stage.
+    """
+
+    def __init__(self, enabled: bool, timed: bool = False):
+        self.enabled = enabled and tracemalloc.is_tracing()
+        self.timed = timed
+        self.stages: Dict[str, int] = {}
+        self.timings_ms: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        if not self.enabled and not self.timed:
+            yield
+            return
+        if self.enabled:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self.timed:
+                elapsed = (time.perf_counter() - start) * 1000.0
+                self.timings_ms[name] = round(self.timings_ms.get(name, 0.0) + elapsed, 3)
+            if self.enabled:
+                peak = tracemalloc.get_traced_memory()[1] - base
+                self.stages[name] = max(self.stages.get(name, 0), peak)
+
+    def to_dict(self) -> Dict[str, int]:
+        return dict(self.stages)
+
+
+NO_TRACE = StageMemoryTrace(False)
+
+
+class MemoryStats:
+    """
+    Process-wide per-stage peaks and budget decisions, for /metrics.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: Dict[str, dict] = {}
+        self._paths: Dict[str, int] = {}
+
+    def record_trace(self, trace: StageMemoryTrace):
+        with self._lock:
+            for name, peak in trace.stages.items():
+                s = self._stages.setdefault(name, {"count": 0, "last_bytes": 0, "max_bytes": 0})
+                s["count"] += 1
+                s["last_bytes"] = peak
+                s["max_bytes"] = max(s["max_bytes"], peak)
+
+    def record_path(self, path: str):
+        with self._lock:
+            self._paths[path] = self._paths.get(path, 0) + 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "stages": {k: dict(v) for k, v in self._stages.items()},
+                "budget_paths": dict(self._paths),
+            }
+
+
+# -------------------------
+# budgets
+# -------------------------
+@dataclass
+class RecordingInfo:
+    sample_rate: int
+    channels: int
+    frames: int
+
+    @property
+    def seconds(self) -> float:
+        return self.frames / float(self.sample_rate) if self.sample_rate else 0.0
+
+
+def probe_recording(path: str) -> Optional[RecordingInfo]:
+    """
+    Header-only probe; None when soundfile cannot read the container.
+    """
+    try:
+        info = sf.info(path)
+    except Exception:
+        return None
+    return RecordingInfo(int(info.samplerate), int(info.channels), int(info.frames))
+
+
+def estimate_request_bytes(info: RecordingInfo, max_seconds: Optional[float] = None) -> int:
+    """
+    Peak bytes to decode and run the in-memory pipeline on the recording
+    (or only its first max_seconds).
+    """
+    frames = info.frames
+    if max_seconds is not None:
+        frames = min(frames, int(max_seconds * info.sample_rate))
+    n16 = int(frames * SAMPLE_RATE / max(1, info.sample_rate)) + 1
+
+    decode = DECODE_BYTES_PER_SAMPLE * (frames * info.channels + (frames if info.channels > 1 else 0) + n16)
+    pipeline = PIPELINE_BYTES_PER_SAMPLE * n16
+    return max(decode, pipeline) + FIXED_OVERHEAD_BYTES
+
+
+class MemoryBudgetExceeded(Exception):
+    def __init__(self, estimate_bytes: int, budget_bytes: int):
+        super().__init__(
+            f"Recording needs about {estimate_bytes / (1 << 20):.0f} MB to analyse, "
+            f"over the {budget_bytes / (1 << 20):.0f} MB per-request budget"
+        )
+        self.estimate_bytes = estimate_bytes
+        self.budget_bytes = budget_bytes
+
+
+def plan_request(info: Optional[RecordingInfo], budget_bytes: Optional[int], windowed: bool,
+                 crop_seconds: float, streaming_ok: bool) -> dict:
+    """
+    Pick how to analyse a recording within budget_bytes:
+      "full"       whole recording in memory (as without a budget)
+      "cropped"    single-clip mode: decode only crop_seconds (+ margin)
+      "streaming"  windowed mode: bounded-memory streaming path
+    Raises MemoryBudgetExceeded when none fits.
+    info=None (unknown container) or budget_bytes=None always gives "full".
+    """
+    if info is None or budget_bytes is None:
+        return {"path": "full"}
+
+    full = estimate_request_bytes(info)
+    plan = {"estimate_bytes": full, "budget_bytes": budget_bytes}
+    if full <= budget_bytes:
+        return {"path": "full", **plan}
+
+    cropped = estimate_request_bytes(info, crop_seconds + CROP_MARGIN_SECONDS)
+    if cropped <= budget_bytes:
+        if not windowed:
+            return {"path": "cropped", "max_seconds": crop_seconds + CROP_MARGIN_SECONDS,
+                    "reduced_estimate_bytes": cropped, **plan}
+        if streaming_ok:
+            # streaming holds a few blocks; the rate estimate decodes the cropped span
+            return {"path": "streaming", "max_seconds": crop_seconds + CROP_MARGIN_SECONDS,
+                    "reduced_estimate_bytes": cropped, **plan}
+
+    raise MemoryBudgetExceeded(full, budget_bytes)
@@ -8,6 +8,8 @@ class WindowPrediction:
     label: str           # "normal" | "murmur" | "crackles" | "wheeze"
     confidence: float    # 0..1
     window_seconds: float
+    start_seconds: float = 0.0   # offset of the window in the recording
+    probability: float = 0.0     # raw model probability for the abnormal class
 
 @dataclass
 class RecommendationOutput:
@@ -34,19 +36,21 @@ def build_recommendation(
             return label == "murmur"
         return label in ("crackles", "wheeze")
 
-    # take recent windows covering lookback_seconds
+    # take recent windows covering lookback_seconds; the oldest one only
+    # counts for its part inside the lookback
     recent = []
     covered = 0.0
     for w in reversed(history):
         if covered >= lookback_seconds:
             break
-        recent.append(w)
-        covered += w.window_seconds
+        seconds = min(w.window_seconds, lookback_seconds - covered)
+        recent.append((w, seconds))
+        covered += seconds
 
-    abnormal_seconds = sum(w.window_seconds for w in recent if is_abnormal(w.label))
-    last_seconds = min(lookback_seconds, covered)
+    abnormal_seconds = sum(seconds for w, seconds in recent if is_abnormal(w.label))
+    last_seconds = covered
 
-    abnormal_conf = [w.confidence for w in recent if is_abnormal(w.label)]
+    abnormal_conf = [w.confidence for w, _ in recent if is_abnormal(w.label)]
     peak_conf = max(abnormal_conf) if abnormal_conf else history[-1].confidence
 
     latest = history[-1]
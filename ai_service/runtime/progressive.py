@@ -0,0 +1,203 @@
+# THESIS/runtime/progressive.py
+"""
+Progressive (early-exit) single-clip inference.
+
+The default path preprocesses and scores the first MAX_SECONDS of every
+recording. Here the clip is scored on a short initial span first; if the
+probability is at least `margin` away from the decision threshold the
+answer is returned, otherwise the span grows by one step and the model
+runs again, up to the same MAX_SECONDS.
+
+The initial span is at least one model window (W frames). A shorter one
+would be padded by fit_frames, and the model never sees such input on
+the default path for clips that fill a window, so the answer is never
+taken from a padded window unless the whole clip is that short.
+
+Extending reuses what earlier steps computed:
+  * band-pass + notch (filtfilt) run only over the new samples, with
+    FILTER_CONTEXT_SECONDS of context each side so the zero-phase edges
+    settle before the kept part
+  * spectral subtraction overlap-adds only the new denoise windows into
+    accumulators kept across steps (same windows and noise profile as
+    spectral_subtraction_denoise on the whole span)
+  * mel frames whose input is final are cached; only new frames and the
+    few at the zero-padded end are computed per step
+so a clip that runs to the last step costs about one default pass plus
+one feature/inference per step. The global peak normalization of
+preprocess_audio is skipped: log-mel dB is relative to the clip's max.
+"""
+
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+import librosa
+
+from .audio_preprocessing import (
+    denoise_noise_floor, denoise_windows, detect_mains_hum, estimate_noise_magnitude, filter_stage,
+)
+from .features import SAMPLE_RATE, N_FFT, HOP, fit_frames, mel_power, predict, runner_expected_hw
+
+FILTER_CONTEXT_SECONDS = 1.0
+DENOISE_WINDOW = 2048
+DENOISE_HOP = DENOISE_WINDOW // 2
+
+
+@dataclass
+class ProgressiveResult:
+    probability: float
+    windows: int                    # model invocations
+    seconds: float                  # span the answer is based on
+    early_exit: bool                # stopped before the full span
+    probabilities: List[float] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        return {
+            "windows": self.windows,
+            "seconds": round(self.seconds, 3),
+            "early_exit": self.early_exit,
+            "probabilities": [round(p, 4) for p in self.probabilities],
+        }
+
+
+class ProgressiveClip:
+    """
+    Incremental preprocess + log-mel state for the first max_samples of y.
+    extend(n) brings the features up to the first n samples.
+    notch_freqs: mains hum to notch (None: detect_mains_hum on the clip,
+    once, so every step filters the same way).
+    """
+
+    def __init__(self, y: np.ndarray, runner, mode: str, max_samples: int,
+                 notch_freqs: Optional[Sequence[float]] = None):
+        self.mode = mode
+        self.runner = runner
+        self.H, self.W, C = runner_expected_hw(runner)
+        if C != 1:
+            raise ValueError(f"Expected channel C=1, got C={C}. Model shape mismatch.")
+
+        self.total = min(len(y), max_samples)
+        context = int(FILTER_CONTEXT_SECONDS * SAMPLE_RATE)
+        raw = y[:self.total + context]
+        self.raw = raw / (np.max(np.abs(raw)) + 1e-9)
+        self.context = context
+        self.notch_freqs = detect_mains_hum(self.raw, SAMPLE_RATE) if notch_freqs is None else list(notch_freqs)
+
+        self.filtered = np.zeros(self.total, dtype=np.float32)
+        self.n = 0                      # samples filtered so far
+
+        # denoise accumulators (spectral_subtraction_denoise's output / window_count)
+        self.noise_floor = None
+        self.window = np.hanning(DENOISE_WINDOW)
+        self.segment_buf = np.empty(DENOISE_WINDOW)
+        self.output = np.zeros(self.total + DENOISE_WINDOW)
+        self.window_count = np.zeros(self.total + DENOISE_WINDOW)
+        self.next_window = 0            # start of the next denoise window
+
+        # centered STFT input: N_FFT // 2 zeros, denoised audio, zeros
+        self.padded = np.zeros(self.total + N_FFT, dtype=np.float32)
+        self.mel = np.empty((self.H, self.W))
+        self.mel_final = 0              # cached mel frames that no extension can change
+
+    @property
+    def complete(self) -> bool:
+        return self.n >= self.total or self.mel_final >= self.W
+
+    def _filter_to(self, n: int):
+        a = self.n
+        lo = max(0, a - self.context)
+        hi = min(len(self.raw), n + self.context)
+        seg = filter_stage(self.raw[lo:hi], SAMPLE_RATE, mode=self.mode, notch_freqs=self.notch_freqs)
+        self.filtered[a:n] = seg[a - lo:n - lo]
+        self.n = n
+
+    def _denoise_to(self, n: int) -> int:
+        """
+        Denoised samples [0, n) written into self.padded; returns how many
+        of them are final (covered by every window that will ever touch them).
+        """
+        if self.noise_floor is None:
+            noise_magnitude = estimate_noise_magnitude(self.filtered[:n], SAMPLE_RATE, noise_duration=0.1)
+            if noise_magnitude is not None:
+                self.noise_floor = denoise_noise_floor(noise_magnitude, DENOISE_WINDOW // 2 + 1)
+
+        pad = N_FFT // 2
+        if self.noise_floor is None:
+            self.padded[pad:pad + n] = self.filtered[:n]
+        else:
+            starts = range(self.next_window, n - DENOISE_WINDOW + 1, DENOISE_HOP)
+            denoise_windows(self.filtered, starts, self.window, self.noise_floor,
+                            self.output, self.window_count, self.segment_buf)
+            if len(starts):
+                self.next_window = starts[-1] + DENOISE_HOP
+            np.divide(self.output[:n], np.maximum(self.window_count[:n], 1e-8), out=self.padded[pad:pad + n],
+                      casting="unsafe")
+        self.padded[pad + n:] = 0
+        return n if n >= self.total else min(n, self.next_window)
+
+    def extend(self, n: int) -> np.ndarray:
+        """
+        Model input (1, H, W, 1) for the first n samples.
+        """
+        n = min(n, self.total)
+        if n > self.n:
+            self._filter_to(n)
+        final = self._denoise_to(n)
+
+        n_frames = min(1 + n // HOP, self.W)
+        # frame i reads padded[i*HOP : i*HOP + N_FFT], i.e. samples up to i*HOP + N_FFT//2
+        new_final = min(n_frames, max(0, (final - N_FFT // 2) // HOP + 1))
+        if final >= self.total:
+            new_final = n_frames
+
+        first = self.mel_final
+        if n_frames > first:
+            seg = self.padded[first * HOP:(n_frames - 1) * HOP + N_FFT]
+            self.mel[:, first:n_frames] = mel_power(seg, self.H, center=False)
+        self.mel_final = max(self.mel_final, new_final)
+
+        mel_db = librosa.power_to_db(self.mel[:, :n_frames], ref=np.max)
+        return fit_frames(mel_db, self.W)[np.newaxis, ..., np.newaxis].astype(np.float32)
+
+    def audio(self) -> np.ndarray:
+        """
+        Preprocessed (peak-normalized) audio analysed so far.
+        """
+        y = self.padded[N_FFT // 2:N_FFT // 2 + self.n]
+        return (y / (np.max(np.abs(y)) + 1e-9)).astype(np.float32)
+
+
+def progressive_predict(y: np.ndarray, runner, mode: str, max_samples: int, threshold: float = 0.30,
+                        margin: float = 0.15, initial_seconds: float = 4.0,
+                        step_seconds: float = 2.0,
+                        notch_freqs: Optional[Sequence[float]] = None) -> Tuple[ProgressiveResult, np.ndarray]:
+    """
+    Score growing spans of y (raw 16 kHz mono), the first at least one
+    model window long, until the probability is at least `margin` from
+    `threshold` or the full span is reached.
+    Returns (result, preprocessed audio of the analysed span).
+    margin=0 answers from the initial span; margin >= 1 always runs to the
+    full span (same work as the default path, close to its probability).
+    """
+    clip = ProgressiveClip(y, runner, mode, max_samples, notch_freqs=notch_freqs)
+    # (W - 1) * HOP samples give W centered frames: no padding
+    span = max(int(initial_seconds * SAMPLE_RATE), (clip.W - 1) * HOP)
+    step = max(HOP, int(step_seconds * SAMPLE_RATE))
+
+    probabilities = []
+    while True:
+        x = clip.extend(span)
+        p = float(np.clip(np.asarray(predict(runner, x)).reshape(-1)[0], 0.0, 1.0))
+        probabilities.append(p)
+        if abs(p - threshold) >= margin or clip.complete:
+            break
+        span = clip.n + step
+
+    result = ProgressiveResult(
+        probability=p,
+        windows=len(probabilities),
+        seconds=clip.n / SAMPLE_RATE,
+        early_exit=not clip.complete,
+        probabilities=probabilities,
+    )
+    return result, clip.audio()
@@ -0,0 +1,166 @@
+# THESIS/runtime/routing.py
+"""
+Instance selection for the scale-out gateway (gateway.py).
+
+Requests that carry audio are routed by content: a consistent-hash ring
+(virtual nodes per instance) maps the recording to a preferred instance,
+so repeats of the same recording land where its per-instance state
+(caches, tuned interpreters, warm pages) already is, and adding or
+removing an instance only moves ~1/N of the keys. To keep one hot key or
+one slow instance from piling up work, the ring uses bounded loads: an
+instance is skipped while its in-flight requests are above
+(1 + load_factor) x the average, and the walk continues to the next
+instance on the ring. Requests without a key go to the instance with the
+fewest outstanding requests.
+
+Instances are taken out of rotation on a failed request or health check
+and come back on the next successful health check.
+"""
+
+import bisect
+import hashlib
+import math
+import threading
+import time
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Optional, Sequence
+
+
+def _hash(data: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big")
+
+
+def content_key(path: str, content_type: str, body: bytes) -> Optional[bytes]:
+    """
+    Routing key of one request: the audio it carries plus the endpoint path.
+    For multipart uploads only the part payloads count (the boundary and
+    part headers change between clients sending the same file).
+    """
+    if not body:
+        return None
+    h = hashlib.blake2b(path.encode(), digest_size=16)
+    ctype = content_type.lower()
+    if ctype.startswith("multipart/") and "boundary=" in ctype:
+        boundary = content_type.split("boundary=", 1)[1].split(";")[0].strip().strip('"').encode()
+        for part in body.split(b"--" + boundary):
+            _, sep, payload = part.partition(b"\r\n\r\n")
+            if sep:
+                h.update(payload)
+    else:
+        h.update(body)
+    return h.digest()
+
+
+class HashRing:
+    def __init__(self, nodes: Iterable[str], vnodes: int = 100):
+        points = sorted((_hash(f"{node}#{i}".encode()), node) for node in nodes for i in range(vnodes))
+        self._keys = [p for p, _ in points]
+        self._nodes = [n for _, n in points]
+
+    def walk(self, key: bytes) -> Iterator[str]:
+        """
+        Distinct nodes in ring order starting at key's position.
+        """
+        if not self._nodes:
+            return
+        start = bisect.bisect(self._keys, _hash(key))
+        seen = set()
+        for i in range(len(self._nodes)):
+            node = self._nodes[(start + i) % len(self._nodes)]
+            if node not in seen:
+                seen.add(node)
+                yield node
+
+
+@dataclass
+class Instance:
+    url: str
+    healthy: bool = True
+    outstanding: int = 0
+    requests: int = 0
+    failures: int = 0
+    last_error: Optional[str] = None
+    last_check: Optional[float] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
+
+
+class InstancePool:
+    def __init__(self, urls: Sequence[str], load_factor: float = 0.25, vnodes: int = 100):
+        if not urls:
+            raise ValueError("At least one instance URL is required")
+        self.instances = [Instance(url.rstrip("/")) for url in urls]
+        self._by_url = {inst.url: inst for inst in self.instances}
+        self.ring = HashRing(self._by_url, vnodes=vnodes)
+        self.load_factor = load_factor
+        self._lock = threading.Lock()
+
+    def index(self, inst: Instance) -> int:
+        return self.instances.index(inst)
+
+    def acquire(self, key: Optional[bytes] = None, exclude: Sequence[Instance] = ()) -> Optional[Instance]:
+        """
+        Pick an instance (see module docstring) and count the request as
+        outstanding on it; None when every instance has been excluded.
+        Down instances are used only when no healthy one is left.
+        """
+        with self._lock:
+            pool = [i for i in self.instances if i not in exclude]
+            if not pool:
+                return None
+            live = [i for i in pool if i.healthy] or pool
+
+            inst = None
+            if key is not None:
+                total = sum(i.outstanding for i in self.instances)
+                cap = math.ceil((total + 1) * (1.0 + self.load_factor) / len(live))
+                for url in self.ring.walk(key):
+                    candidate = self._by_url[url]
+                    if candidate in live and candidate.outstanding + 1 <= cap:
+                        inst = candidate
+                        break
+            if inst is None:
+                inst = min(live, key=lambda i: (i.outstanding, i.requests))
+
+            inst.outstanding += 1
+            inst.requests += 1
+            return inst
+
+    def acquire_index(self, index: int) -> Instance:
+        """
+        A specific instance (e.g. the one holding a job), healthy or not.
+        """
+        with self._lock:
+            inst = self.instances[index]
+            inst.outstanding += 1
+            inst.requests += 1
+            return inst
+
+    def release(self, inst: Instance):
+        with self._lock:
+            inst.outstanding -= 1
+
+    def mark_failed(self, inst: Instance, error: str):
+        with self._lock:
+            inst.healthy = False
+            inst.failures += 1
+            inst.last_error = error
+
+    def mark_checked(self, inst: Instance, healthy: bool, error: Optional[str] = None):
+        with self._lock:
+            inst.healthy = healthy
+            inst.last_check = time.time()
+            if not healthy:
+                inst.last_error = error
+
+    def stats(self) -> List[dict]:
+        with self._lock:
+            return [i.to_dict() for i in self.instances]
@@ -0,0 +1,122 @@
+# THESIS/runtime/signal_quality.py
+"""
+Cheap signal-quality gate run on the raw decoded signal, before
+preprocess_audio and the interpreter.
+
+Silence, heavy clipping and a disconnected-sensor hum are common from
+handheld devices; they are rejected with a "retake" result instead of
+going through filtering, denoising, features and inference.
+
+Everything is computed on a strided (decimated) view of the signal, so
+the gate costs one pass over len(audio) / decimate samples and no copy of
+the full recording.
+"""
+
+import os
+from dataclasses import dataclass, field, asdict
+from typing import List
+
+import numpy as np
+
+
+@dataclass
+class QualityThresholds:
+    min_rms_db: float = -55.0        # overall level (dBFS) below this = silence / no contact
+    max_silence_ratio: float = 0.90  # share of frames below silence_db
+    silence_db: float = -60.0        # frame level (dBFS) counted as silent
+    max_clip_ratio: float = 0.02     # share of samples at full scale
+    clip_level: float = 0.99         # |x| counted as clipped (full scale = 1.0)
+    min_snr_db: float = 3.0          # loud-frame vs quiet-frame level; steady hum/noise ~0 dB
+    frame_seconds: float = 0.05
+    decimate: int = 4
+
+
+@dataclass
+class SignalQuality:
+    ok: bool
+    rms_db: float
+    silence_ratio: float
+    clip_ratio: float
+    snr_db: float
+    reasons: List[str] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        d = asdict(self)
+        for k in ("rms_db", "silence_ratio", "clip_ratio", "snr_db"):
+            d[k] = round(float(d[k]), 4)
+        return d
+
+
+def qc_enabled_from_env() -> bool:
+    """
+    AI_QC_ENABLED (default 1); 0 turns the gate off.
+    """
+    return os.environ.get("AI_QC_ENABLED", "1") != "0"
+
+
+def thresholds_from_env() -> QualityThresholds:
+    """
+    QualityThresholds with the AI_QC_MIN_RMS_DB / AI_QC_MAX_SILENCE_RATIO /
+    AI_QC_MAX_CLIP_RATIO / AI_QC_MIN_SNR_DB overrides, as the service and
+    reanalyze.py use them.
+    """
+    return QualityThresholds(
+        min_rms_db=float(os.environ.get("AI_QC_MIN_RMS_DB", QualityThresholds.min_rms_db)),
+        max_silence_ratio=float(os.environ.get("AI_QC_MAX_SILENCE_RATIO", QualityThresholds.max_silence_ratio)),
+        max_clip_ratio=float(os.environ.get("AI_QC_MAX_CLIP_RATIO", QualityThresholds.max_clip_ratio)),
+        min_snr_db=float(os.environ.get("AI_QC_MIN_SNR_DB", QualityThresholds.min_snr_db)),
+    )
+
+
+def _db(x: float) -> float:
+    return float(20.0 * np.log10(max(x, 1e-12)))
+
+
+def assess_signal_quality(audio: np.ndarray, sr: int, thresholds: QualityThresholds = None) -> SignalQuality:
+    """
+    audio: decoded mono signal at its original level (NOT peak-normalized),
+    full scale = 1.0. Returns the metrics and why the recording was rejected.
+    """
+    t = thresholds or QualityThresholds()
+
+    y = audio[::max(1, int(t.decimate))]
+    if len(y) == 0:
+        return SignalQuality(False, -240.0, 1.0, 0.0, 0.0, ["empty recording"])
+
+    y_sr = sr / max(1, int(t.decimate))
+    clip_ratio = float(np.count_nonzero(np.abs(y) >= t.clip_level)) / len(y)
+
+    # DC offset (common on cheap ADCs) would otherwise read as signal level
+    y = y - np.mean(y, dtype=np.float64)
+    rms_db = _db(float(np.sqrt(np.mean(np.square(y, dtype=np.float64)))))
+
+    frame = max(1, int(t.frame_seconds * y_sr))
+    n_frames = len(y) // frame
+    if n_frames >= 2:
+        frames = y[:n_frames * frame].reshape(n_frames, frame)
+        frame_rms = np.sqrt(np.mean(np.square(frames, dtype=np.float64), axis=1))
+        silence_ratio = float(np.mean(frame_rms < 10 ** (t.silence_db / 20.0)))
+        loud, quiet = np.percentile(frame_rms, [90, 10])
+        snr_db = _db(float(loud)) - _db(float(quiet))
+    else:
+        silence_ratio = 1.0 if rms_db < t.silence_db else 0.0
+        snr_db = 0.0
+
+    reasons = []
+    if rms_db < t.min_rms_db:
+        reasons.append("signal too quiet")
+    if silence_ratio > t.max_silence_ratio:
+        reasons.append("mostly silence")
+    if clip_ratio > t.max_clip_ratio:
+        reasons.append("heavy clipping")
+    if n_frames >= 2 and snr_db < t.min_snr_db:
+        reasons.append("no distinguishable sounds (constant noise or hum)")
+
+    return SignalQuality(
+        ok=not reasons,
+        rms_db=rms_db,
+        silence_ratio=silence_ratio,
+        clip_ratio=clip_ratio,
+        snr_db=snr_db,
+        reasons=reasons,
+    )
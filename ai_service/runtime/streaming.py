@@ -0,0 +1,239 @@
+# THESIS/runtime/streaming.py
+"""
+Bounded-memory streaming pipeline for very long recordings
+(e.g. hour-long continuous-monitoring captures).
+
+    WAV file --blocks--> mono --resample--> band-pass + notch (sosfilt, carried state)
+             --> window ring buffer --> denoise + log-mel --> TFLiteRunner --> WindowPrediction
+
+Nothing ever holds the whole recording. Peak memory per stream is roughly
+
+    block_seconds * native_sr * channels * 4 B   (one decoded block, float32)
+  + 2 * window_samples * 4 B                     (window ring buffer + denoised copy)
+  + one window of mel / STFT temporaries         (~n_fft/2 * W * 8 B for the STFT)
+
+With the defaults (1 s blocks, 44.1 kHz stereo input, heart model: 256 frames
+* 512 hop = 131072 samples per window) that is about 0.35 MB + 1 MB + ~1 MB,
+independent of recording length.
+
+Differences from the in-memory path (preprocess_audio + to_features):
+  * filtering is causal (sosfilt with carried state) instead of zero-phase
+    filtfilt, which would need the whole signal
+  * the spectral-subtraction noise profile comes from the first 0.1 s of the
+    stream and is reused for every window
+  * there is no global peak normalization; log-mel dB is relative to each
+    window's max anyway, so features are unaffected
+"""
+
+from math import gcd
+from typing import Iterator, Optional, Sequence
+
+import numpy as np
+import soundfile as sf
+from scipy.signal import butter, iirnotch, resample_poly, sosfilt, sosfilt_zi, tf2sos
+
+from .audio_preprocessing import estimate_noise_magnitude, spectral_subtraction_denoise
+from .features import SAMPLE_RATE, HOP, mel_power, fit_frames, runner_expected_hw
+from .postprocess.recommendation import WindowPrediction
+from .windowing import ABNORMAL_LABELS
+
+import librosa
+
+
+def iter_wav_blocks(path: str, block_seconds: float = 1.0) -> Iterator:
+    """
+    Yield (mono float32 block, native sample rate) without loading the file.
+    """
+    with sf.SoundFile(path) as f:
+        blocksize = max(1, int(block_seconds * f.samplerate))
+        for block in f.blocks(blocksize=blocksize, dtype="float32", always_2d=True):
+            # same downmix as librosa.load(mono=True)
+            yield block.mean(axis=1, dtype=np.float32) if block.shape[1] > 1 else block[:, 0], f.samplerate
+
+
+class BlockResampler:
+    """
+    Streaming polyphase resampler. Each push() resamples the new block
+    together with carried left context, and holds back a right margin until
+    the next block arrives, so block edges do not show FIR edge effects.
+    """
+
+    def __init__(self, sr_in: int, sr_out: int = SAMPLE_RATE):
+        g = gcd(int(sr_in), int(sr_out))
+        self.up = int(sr_out) // g
+        self.down = int(sr_in) // g
+        self.passthrough = self.up == self.down
+
+        # resample_poly's FIR reaches 10 * max(up, down) upsampled samples each side;
+        # context / margin are kept on multiples of `down` so output indices stay integral
+        reach = 10 * max(self.up, self.down) // self.up + 1
+        self.context = ((reach + self.down - 1) // self.down) * self.down
+        self.margin = self.context
+        self._left = np.zeros(0, dtype=np.float32)
+        self._pending = np.zeros(0, dtype=np.float32)
+
+    def _run(self, flush: bool) -> np.ndarray:
+        buf = np.concatenate([self._left, self._pending])
+        c = len(self._left)
+        if flush:
+            end = len(buf)
+        else:
+            avail = len(buf) - c - self.margin
+            end = c + (avail // self.down) * self.down if avail > 0 else c
+        if end <= c:
+            return np.zeros(0, dtype=np.float32)
+
+        y = resample_poly(buf, self.up, self.down).astype(np.float32)
+        out = y[c * self.up // self.down:len(y) if flush else end * self.up // self.down]
+
+        keep = (min(self.context, end) // self.down) * self.down
+        self._left = buf[end - keep:end]
+        self._pending = buf[end:]
+        return out
+
+    def push(self, block: np.ndarray) -> np.ndarray:
+        if self.passthrough:
+            return block.astype(np.float32, copy=False)
+        self._pending = np.concatenate([self._pending, block.astype(np.float32, copy=False)])
+        return self._run(flush=False)
+
+    def flush(self) -> np.ndarray:
+        if self.passthrough or len(self._pending) == 0:
+            return np.zeros(0, dtype=np.float32)
+        return self._run(flush=True)
+
+
+class StreamingFilter:
+    """
+    Band-pass (same Butterworth design as bandpass_filter) followed by an
+    optional notch, as one SOS cascade with state carried across blocks.
+    notch_freqs (e.g. from detect_mains_hum) replaces the single notch_freq.
+    """
+
+    def __init__(self, sr: int = SAMPLE_RATE, lowcut: float = 20.0, highcut: float = 2000.0,
+                 order: int = 5, notch_freq: Optional[float] = 60.0, quality: float = 30.0,
+                 notch_freqs: Optional[Sequence[float]] = None):
+        nyquist = sr / 2.0
+        low = max(0.001, min(lowcut / nyquist, 0.999))
+        high = max(0.001, min(highcut / nyquist, 0.999))
+
+        sections = []
+        if low < high:
+            sections.append(butter(order, [low, high], btype="band", output="sos"))
+        if notch_freqs is None:
+            notch_freqs = [] if notch_freq is None else [notch_freq]
+        for freq in notch_freqs:
+            if 0 < freq / nyquist < 1:
+                b, a = iirnotch(freq / nyquist, quality)
+                sections.append(tf2sos(b, a))
+
+        self.sos = np.vstack(sections) if sections else None
+        self._zi = None
+
+    def push(self, block: np.ndarray) -> np.ndarray:
+        if self.sos is None or len(block) == 0:
+            return block
+        if self._zi is None:
+            # start from steady state for the first sample, like filtfilt's edge handling
+            self._zi = sosfilt_zi(self.sos) * block[0]
+        out, self._zi = sosfilt(self.sos, block, zi=self._zi)
+        return out.astype(np.float32)
+
+
+def stream_predictions(path: str, runner, mode: str, threshold: float = 0.30,
+                       hop_seconds: Optional[float] = None, block_seconds: float = 1.0,
+                       notch_freq: Optional[float] = 60.0,
+                       notch_freqs: Optional[Sequence[float]] = None) -> Iterator[WindowPrediction]:
+    """
+    Yield one WindowPrediction per analysis window as soon as it is complete.
+
+    Windows are W model frames long (W * HOP samples) and advance by
+    hop_seconds (default: half a window), matching runtime.windowing.
+    window_seconds is the new audio each window adds (the first window its
+    full length, later ones one hop, the tail whatever is left), so the
+    timeline sums to the recording duration.
+    """
+    H, W, C = runner_expected_hw(runner)
+    if C != 1:
+        raise ValueError(f"Expected channel C=1, got C={C}. Model shape mismatch.")
+
+    window_samples = W * HOP
+    if hop_seconds is None:
+        hop_samples = (W // 2) * HOP
+    else:
+        hop_samples = max(HOP, int(round(hop_seconds * SAMPLE_RATE / HOP)) * HOP)
+    hop_samples = min(hop_samples, window_samples)
+
+    abnormal = ABNORMAL_LABELS[mode]
+    filt = StreamingFilter(SAMPLE_RATE, notch_freq=notch_freq, notch_freqs=notch_freqs)
+    resampler = None
+
+    ring = np.zeros(window_samples, dtype=np.float32)
+    filled = 0                 # valid samples in ring
+    consumed = 0               # samples (at 16 kHz) that have left the ring
+    noise_magnitude = None
+    noise_seed = []            # first samples, only until the noise profile exists
+    emitted_any = False
+
+    def emit(valid: int):
+        window = ring[:valid]
+        # denoise at stream scale: the noise profile was measured before any normalization
+        if noise_magnitude is not None:
+            window = spectral_subtraction_denoise(window, SAMPLE_RATE, noise_magnitude=noise_magnitude)
+
+        mel_db = librosa.power_to_db(mel_power(window, H), ref=np.max)
+        x = fit_frames(mel_db, W)[np.newaxis, ..., np.newaxis].astype(np.float32)
+        p = float(np.clip(np.asarray(runner.predict(x)).reshape(-1)[0], 0.0, 1.0))
+
+        detected = p > threshold
+        return WindowPrediction(
+            label=abnormal if detected else "normal",
+            confidence=float(p if detected else 1.0 - p),
+            window_seconds=0.0,      # filled in by the caller once the span is known
+            start_seconds=consumed / SAMPLE_RATE,
+            probability=p,
+        )
+
+    def feed(samples: np.ndarray):
+        nonlocal filled, consumed, noise_magnitude, emitted_any
+        samples = filt.push(samples)
+
+        if noise_magnitude is None:
+            noise_seed.append(samples)
+            seed = np.concatenate(noise_seed)
+            if len(seed) >= int(0.1 * SAMPLE_RATE) * 4:
+                noise_magnitude = estimate_noise_magnitude(seed, SAMPLE_RATE, noise_duration=0.1)
+                noise_seed.clear()
+
+        pos = 0
+        while pos < len(samples):
+            take = min(window_samples - filled, len(samples) - pos)
+            ring[filled:filled + take] = samples[pos:pos + take]
+            filled += take
+            pos += take
+            if filled == window_samples:
+                pred = emit(filled)
+                pred.window_seconds = (hop_samples if emitted_any else window_samples) / SAMPLE_RATE
+                emitted_any = True
+                yield pred
+                # slide by one hop
+                ring[:window_samples - hop_samples] = ring[hop_samples:]
+                filled -= hop_samples
+                consumed += hop_samples
+
+    for block, sr in iter_wav_blocks(path, block_seconds):
+        if resampler is None:
+            resampler = BlockResampler(sr, SAMPLE_RATE)
+        yield from feed(resampler.push(block))
+
+    if resampler is not None:
+        yield from feed(resampler.flush())
+
+    # tail: samples after the last full hop, or a recording shorter than one window
+    tail = filled - (window_samples - hop_samples) if emitted_any else filled
+    if tail > 0:
+        if noise_magnitude is None and noise_seed:
+            noise_magnitude = estimate_noise_magnitude(np.concatenate(noise_seed), SAMPLE_RATE)
+        pred = emit(filled)
+        pred.window_seconds = tail / SAMPLE_RATE
+        yield pred
@@ -0,0 +1,234 @@
+# THESIS/runtime/supervisor.py
+"""
+Pre-fork supervisor for running the API in several worker processes.
+
+The parent imports the heavy libraries (TensorFlow / tflite_runtime,
+librosa, scipy) and runs the DSP path once, so their module state and
+numba-compiled kernels are inherited copy-on-write instead of being
+rebuilt in every worker. It then binds the listening socket and forks
+the workers, which import the app and build their interpreters.
+
+Interpreters are deliberately NOT created before the fork: TFLite thread
+pools do not survive fork(). The model flatbuffers are memory-mapped by
+the interpreter, so every worker shares one copy through the page cache.
+
+The supervisor restarts workers that exit unexpectedly (with backoff when
+they keep crashing) and periodically reports RSS / PSS / USS per worker.
+"""
+
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+
+def process_memory(pid="self") -> Dict[str, int]:
+    """
+    Resident (rss), proportional (pss) and unique (uss) memory in bytes,
+    from /proc/<pid>/smaps_rollup. uss = private clean + private dirty.
+    Empty dict when /proc is unavailable.
+    """
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 3 and parts[-1] == "kB":
+                    fields[parts[0].rstrip(":")] = int(parts[1]) * 1024
+    except OSError:
+        return {}
+    return {
+        "rss": fields.get("Rss", 0),
+        "pss": fields.get("Pss", 0),
+        "uss": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+    }
+
+
+def preload():
+    """
+    Import and exercise everything a request touches except the interpreters.
+    """
+    import tempfile
+    import librosa
+    import soundfile as sf
+    from .audio_preprocessing import preprocess_audio
+    from .features import SAMPLE_RATE, HOP, load_wav_mono_16k, mel_power
+    from .warmup import synthetic_recording
+    from . import tflite_runner  # noqa: F401  (imports TensorFlow / tflite_runtime)
+
+    # the first librosa.load (lazy imports, numba, resampler) takes seconds; do it once here
+    with tempfile.TemporaryDirectory() as tmp:
+        path = f"{tmp}/preload.wav"
+        sf.write(path, synthetic_recording(2.0), 44100, subtype="PCM_16")
+        load_wav_mono_16k(path)
+
+    y = np.random.default_rng(0).normal(0, 0.1, SAMPLE_RATE * 2).astype(np.float32)
+    y = preprocess_audio(y, SAMPLE_RATE)
+    librosa.power_to_db(mel_power(y, 64), ref=np.max)
+    librosa.onset.onset_strength(y=y, sr=SAMPLE_RATE, hop_length=HOP)
+
+    # keep the collector from touching (and so un-sharing) preloaded objects
+    gc.collect()
+    gc.freeze()
+
+
+def _mb(n: int) -> str:
+    return f"{n / (1 << 20):.1f}MB"
+
+
+class Supervisor:
+    def __init__(self, serve: Callable[[socket.socket], None], host: str = "0.0.0.0", port: int = 8001,
+                 workers: int = 2, report_interval: float = 60.0, stop_timeout: float = 10.0,
+                 warmup: Optional[Callable[[], None]] = preload):
+        """
+        serve(sock) runs one worker's server on the inherited listening
+        socket and returns when it shuts down. warmup() runs once in the
+        supervisor before the first fork.
+        """
+        self.serve = serve
+        self.warmup = warmup
+        self.host = host
+        self.port = port
+        self.workers = max(1, int(workers))
+        self.report_interval = report_interval
+        self.stop_timeout = stop_timeout
+
+        self.sock: Optional[socket.socket] = None
+        self._children: Dict[int, dict] = {}   # pid -> {"slot", "started"}
+        self._backoff = [0.0] * self.workers
+        self._stopping = False
+
+    # -------------------------
+    # workers
+    # -------------------------
+    def _spawn(self, slot: int):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                signal.signal(signal.SIGINT, signal.SIG_DFL)
+                self.serve(self.sock)
+            except BaseException:
+                import traceback
+                traceback.print_exc()
+                code = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code)
+
+        self._children[pid] = {"slot": slot, "started": time.monotonic()}
+        print(f"[supervisor] worker {slot} started (pid {pid})", flush=True)
+
+    def _reap(self):
+        while self._children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            info = self._children.pop(pid, None)
+            if info is None:
+                continue
+
+            slot = info["slot"]
+            uptime = time.monotonic() - info["started"]
+            if self._stopping:
+                continue
+
+            print(f"[supervisor] worker {slot} (pid {pid}) exited with "
+                  f"{_exit_description(status)} after {uptime:.1f}s; restarting", flush=True)
+
+            # quick repeated crashes back off up to 30 s; a worker that ran a while resets it
+            self._backoff[slot] = 0.0 if uptime > 30.0 else min(30.0, max(1.0, self._backoff[slot] * 2))
+            if self._backoff[slot]:
+                time.sleep(self._backoff[slot])
+            self._spawn(slot)
+
+    def memory_report(self) -> list:
+        rows = []
+        for pid, info in sorted(self._children.items(), key=lambda kv: kv[1]["slot"]):
+            rows.append({"worker": info["slot"], "pid": pid, **process_memory(pid)})
+        return rows
+
+    def _print_report(self):
+        rows = self.memory_report()
+        parent = process_memory()
+        print(f"[supervisor] memory: supervisor rss={_mb(parent.get('rss', 0))} uss={_mb(parent.get('uss', 0))}", flush=True)
+        for r in rows:
+            print(f"[supervisor]   worker {r['worker']} pid {r['pid']}: rss={_mb(r.get('rss', 0))} "
+                  f"pss={_mb(r.get('pss', 0))} uss={_mb(r.get('uss', 0))}", flush=True)
+        total_pss = parent.get("pss", 0) + sum(r.get("pss", 0) for r in rows)
+        print(f"[supervisor]   total pss={_mb(total_pss)} (sum of rss={_mb(parent.get('rss', 0) + sum(r.get('rss', 0) for r in rows))})", flush=True)
+
+    # -------------------------
+    # lifecycle
+    # -------------------------
+    def _on_signal(self, signum, frame):
+        self._stopping = True
+
+    def run(self):
+        if self.warmup is not None:
+            self.warmup()
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((self.host, self.port))
+        self.sock.listen(2048)
+        self.sock.set_inheritable(True)
+        print(f"[supervisor] listening on {self.host}:{self.port} with {self.workers} workers", flush=True)
+
+        signal.signal(signal.SIGTERM, self._on_signal)
+        signal.signal(signal.SIGINT, self._on_signal)
+
+        for slot in range(self.workers):
+            self._spawn(slot)
+
+        next_report = time.monotonic() + self.report_interval
+        try:
+            while not self._stopping:
+                self._reap()
+                if self.report_interval > 0 and time.monotonic() >= next_report:
+                    self._print_report()
+                    next_report = time.monotonic() + self.report_interval
+                time.sleep(0.5)
+        finally:
+            self.stop()
+
+    def stop(self):
+        self._stopping = True
+        for pid in list(self._children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+        deadline = time.monotonic() + self.stop_timeout
+        while self._children and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.1)
+
+        for pid in list(self._children):
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+            self._children.pop(pid, None)
+
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+
+def _exit_description(status: int) -> str:
+    if os.WIFSIGNALED(status):
+        return f"signal {os.WTERMSIG(status)}"
+    return f"code {os.WEXITSTATUS(status)}"
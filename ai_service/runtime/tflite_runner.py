@@ -1,19 +1,91 @@
 # THESIS/runtime/tflite_runner.py
 
+import threading
+
 import numpy as np
 
 # Prefer tflite_runtime (best for Raspberry Pi)
 # Fallback to TensorFlow (best for Windows dev)
 try:
-    from tflite_runtime.interpreter import Interpreter  # type: ignore
+    from tflite_runtime.interpreter import Interpreter, OpResolverType, load_delegate  # type: ignore
 except Exception:
     import tensorflow as tf  # type: ignore
     Interpreter = tf.lite.Interpreter  # ✅ this is the reliable path
+    OpResolverType = tf.lite.experimental.OpResolverType
+    load_delegate = tf.lite.experimental.load_delegate
+
+# Delegate choices for TFLiteRunner:
+#   "default" / "xnnpack" -> builtin ops, XNNPACK CPU delegate applied by the runtime
+#   "none"                -> builtin ops without default delegates (reference CPU kernels)
+#   "<path>.so|.dll"      -> external delegate library loaded with load_delegate()
+DELEGATES = ("default", "xnnpack", "none")
+
+
+def _interpreter_kwargs(num_threads=None, delegate: str = "default") -> dict:
+    kwargs = {}
+    if num_threads is not None:
+        kwargs["num_threads"] = int(num_threads)
+
+    delegate = (delegate or "default").strip()
+    if delegate in ("default", "xnnpack"):
+        return kwargs
+    if delegate == "none":
+        kwargs["experimental_op_resolver_type"] = OpResolverType.BUILTIN_WITHOUT_DEFAULT_DELEGATES
+        return kwargs
+    if delegate.endswith((".so", ".dll", ".dylib")):
+        kwargs["experimental_delegates"] = [load_delegate(delegate)]
+        return kwargs
+
+    raise ValueError(f"Unknown delegate: {delegate!r}. Expected one of {DELEGATES} or a delegate library path")
+
+
+def _quant_params(details: dict):
+    """
+    Read (scale, zero_point) for a tensor.
+    Float tensors report scale 0.0, which we return as None.
+    """
+    params = details.get("quantization_parameters") or {}
+    scales = np.asarray(params.get("scales", []), dtype=np.float32)
+    zero_points = np.asarray(params.get("zero_points", []), dtype=np.int64)
+
+    if scales.size == 0:
+        # older runtimes only fill the legacy tuple
+        scale, zero_point = details.get("quantization", (0.0, 0))
+        if not scale:
+            return None
+        return float(scale), int(zero_point)
+
+    if scales.size > 1:
+        raise ValueError("Per-channel quantized input/output tensors are not supported")
+
+    return float(scales[0]), int(zero_points[0])
+
+
+def quantize(x: np.ndarray, dtype, scale: float, zero_point: int) -> np.ndarray:
+    """
+    Map real values onto an integer tensor: q = round(x / scale) + zero_point,
+    saturated to the range of dtype.
+    """
+    info = np.iinfo(dtype)
+    q = np.round(np.asarray(x, dtype=np.float32) / scale) + zero_point
+    return np.clip(q, info.min, info.max).astype(dtype)
+
+
+def dequantize(q: np.ndarray, scale: float, zero_point: int) -> np.ndarray:
+    """
+    Map an integer tensor back to real values: x = (q - zero_point) * scale.
+    """
+    return (np.asarray(q, dtype=np.float32) - zero_point) * np.float32(scale)
 
 
 class TFLiteRunner:
-    def __init__(self, model_path: str):
-        self.interpreter = Interpreter(model_path=model_path)
+    def __init__(self, model_path: str, num_threads=None, delegate: str = "default"):
+        self.model_path = model_path
+        self.num_threads = num_threads
+        self.delegate = delegate or "default"
+
+        self._interpreter_kwargs = _interpreter_kwargs(num_threads, self.delegate)
+        self.interpreter = Interpreter(model_path=model_path, **self._interpreter_kwargs)
         self.interpreter.allocate_tensors()
 
         self.input_details = self.interpreter.get_input_details()
@@ -24,19 +96,139 @@ class TFLiteRunner:
 
         self.input_shape = tuple(self.input_details[0]["shape"])
         self.input_dtype = self.input_details[0]["dtype"]
+        self.output_dtype = self.output_details[0]["dtype"]
+
+        # (scale, zero_point) or None for float tensors
+        self.input_quant = _quant_params(self.input_details[0])
+        self.output_quant = _quant_params(self.output_details[0])
+
+        self.is_quantized = np.issubdtype(self.input_dtype, np.integer)
+        if self.is_quantized and self.input_quant is None:
+            raise ValueError(
+                f"Integer input tensor ({np.dtype(self.input_dtype).name}) has no quantization parameters"
+            )
+
+        # batch dim of -1 in the signature means the input can be resized to (B, H, W, C)
+        signature = self.input_details[0].get("shape_signature")
+        self.supports_batch = signature is not None and len(signature) > 0 and int(signature[0]) == -1
+
+        # interpreters are not thread-safe; request threads and job workers share runners
+        self._lock = threading.Lock()
+
+        # separate interpreter resized to a fixed batch, built on first predict_batch()
+        self._batch_interpreter = None
+        self._batch_size = 0
+
+    def quantize_input(self, x: np.ndarray) -> np.ndarray:
+        """
+        Features are always built as float32 (log-mel dB).
+        For int8/uint8 models apply the input scale and zero point;
+        arrays that already have the model's integer dtype are passed through.
+        """
+        if x.dtype == self.input_dtype:
+            return x
+        if self.is_quantized:
+            scale, zero_point = self.input_quant
+            return quantize(x, self.input_dtype, scale, zero_point)
+        return x.astype(self.input_dtype)
+
+    def dequantize_output(self, y: np.ndarray) -> np.ndarray:
+        """
+        Return model output as float32, undoing output quantization if present.
+        """
+        if np.issubdtype(self.output_dtype, np.integer) and self.output_quant is not None:
+            scale, zero_point = self.output_quant
+            return dequantize(y, scale, zero_point)
+        return y.astype(np.float32, copy=False)
 
     def predict(self, x: np.ndarray) -> np.ndarray:
-        if x.dtype != self.input_dtype:
-            x = x.astype(self.input_dtype)
+        x = self.quantize_input(x)
 
         if tuple(x.shape) != self.input_shape:
             raise ValueError(
                 f"Input shape mismatch: got {x.shape}, expected {self.input_shape}"
             )
 
-        self.interpreter.set_tensor(self.input_index, x)
-        self.interpreter.invoke()
-        y = self.interpreter.get_tensor(self.output_index)
+        with self._lock:
+            self.interpreter.set_tensor(self.input_index, x)
+            self.interpreter.invoke()
+            y = self.dequantize_output(self.interpreter.get_tensor(self.output_index))
 
         # usually (1, num_classes)
         return y[0]
+
+    def _get_batch_interpreter(self, batch_size: int):
+        if self._batch_interpreter is None or self._batch_size != batch_size:
+            interp = Interpreter(model_path=self.model_path, **self._interpreter_kwargs)
+            interp.resize_tensor_input(self.input_index, [batch_size, *self.input_shape[1:]])
+            interp.allocate_tensors()
+            self._batch_interpreter = interp
+            self._batch_size = batch_size
+        return self._batch_interpreter
+
+    def predict_batch(self, xs: np.ndarray, batch_size: int = 8) -> np.ndarray:
+        """
+        Run (N, H, W, C) features in invokes of batch_size rows.
+        The last partial batch is zero-padded. Returns (N, num_classes).
+        Models without a dynamic batch dim fall back to one invoke per row.
+        """
+        xs = np.asarray(xs)
+        if tuple(xs.shape[1:]) != tuple(self.input_shape[1:]):
+            raise ValueError(
+                f"Input shape mismatch: got {xs.shape}, expected (N, {', '.join(str(v) for v in self.input_shape[1:])})"
+            )
+
+        n = xs.shape[0]
+        if n == 0:
+            return np.zeros((0,) + tuple(self.output_details[0]["shape"][1:]), dtype=np.float32)
+
+        if not self.supports_batch or batch_size <= 1 or n == 1:
+            return np.stack([self.predict(x[np.newaxis]) for x in xs])
+
+        batch_size = min(batch_size, n)
+        xs = self.quantize_input(xs)
+        outputs = []
+        with self._lock:
+            interp = self._get_batch_interpreter(batch_size)
+            out_index = interp.get_output_details()[0]["index"]
+
+            for start in range(0, n, batch_size):
+                chunk = xs[start:start + batch_size]
+                rows = chunk.shape[0]
+                if rows < batch_size:
+                    pad = np.zeros((batch_size - rows,) + chunk.shape[1:], dtype=chunk.dtype)
+                    chunk = np.concatenate([chunk, pad])
+
+                interp.set_tensor(self.input_index, np.ascontiguousarray(chunk))
+                interp.invoke()
+                y = self.dequantize_output(interp.get_tensor(out_index))
+                outputs.append(y[:rows])
+
+        return np.concatenate(outputs)
+
+
+def compare_runners(reference: TFLiteRunner, candidate: TFLiteRunner, inputs, threshold: float = 0.30) -> dict:
+    """
+    Parity check between a float model and its quantized build.
+    Runs the same float feature tensors through both runners and reports
+    probability error and how often the thresholded decision agrees.
+    """
+    ref_p = []
+    cand_p = []
+    for x in inputs:
+        ref_p.append(float(np.asarray(reference.predict(x)).reshape(-1)[0]))
+        cand_p.append(float(np.asarray(candidate.predict(x)).reshape(-1)[0]))
+
+    if not ref_p:
+        raise ValueError("compare_runners needs at least one input")
+
+    ref_p = np.asarray(ref_p)
+    cand_p = np.asarray(cand_p)
+    diff = np.abs(ref_p - cand_p)
+
+    return {
+        "samples": int(ref_p.size),
+        "max_abs_diff": float(diff.max()),
+        "mean_abs_diff": float(diff.mean()),
+        "decision_agreement": float(np.mean((ref_p > threshold) == (cand_p > threshold))),
+    }
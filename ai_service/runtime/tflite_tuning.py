@@ -0,0 +1,194 @@
+# THESIS/runtime/tflite_tuning.py
+"""
+Interpreter option autotuning for TFLiteRunner.
+
+Benchmarks (delegate, num_threads) candidates on the current host with a
+synthetic input of the model's own shape and stores the fastest config per
+model in a small JSON cache. Heart and lung models have different input
+shapes, so each one gets its own entry.
+
+Offline:
+    python -m runtime.tflite_tuning models/heart_model.tflite models/lung_model.tflite
+"""
+
+import json
+import os
+import platform
+import statistics
+import time
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+from .tflite_runner import TFLiteRunner
+
+DEFAULT_CACHE = Path(__file__).resolve().parent.parent / "models" / "tflite_tuning.json"
+
+
+def _cpu_count() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def host_fingerprint() -> dict:
+    return {"machine": platform.machine(), "cpus": _cpu_count()}
+
+
+def model_fingerprint(model_path: str) -> dict:
+    st = os.stat(model_path)
+    return {"size": st.st_size, "mtime": int(st.st_mtime)}
+
+
+def candidate_configs(max_threads: Optional[int] = None) -> List[dict]:
+    """
+    Thread counts 1, 2, 4, ... up to the CPU count, with and without XNNPACK.
+    """
+    max_threads = max_threads or _cpu_count()
+    threads = []
+    n = 1
+    while n <= max_threads:
+        threads.append(n)
+        n *= 2
+    if threads[-1] != max_threads:
+        threads.append(max_threads)
+
+    configs = [{"delegate": "xnnpack", "num_threads": t} for t in threads]
+    configs.append({"delegate": "none", "num_threads": 1})
+    return configs
+
+
+def benchmark(model_path: str, delegate: str = "default", num_threads=None,
+              warmup: int = 3, runs: int = 20, seed: int = 0) -> float:
+    """
+    Median invoke latency (ms) for one interpreter config.
+    """
+    runner = TFLiteRunner(model_path, num_threads=num_threads, delegate=delegate)
+
+    rng = np.random.default_rng(seed)
+    x = rng.uniform(-80.0, 0.0, size=runner.input_shape).astype(np.float32)
+
+    for _ in range(warmup):
+        runner.predict(x)
+
+    times = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        runner.predict(x)
+        times.append((time.perf_counter() - t0) * 1000.0)
+
+    return statistics.median(times)
+
+
+def autotune(model_path: str, candidates: Optional[List[dict]] = None,
+             warmup: int = 3, runs: int = 20) -> dict:
+    """
+    Benchmark every candidate and return the fastest one plus the full table.
+    Candidates that fail to build (e.g. missing delegate library) are skipped.
+    """
+    results = []
+    for cfg in candidates or candidate_configs():
+        try:
+            ms = benchmark(model_path, cfg["delegate"], cfg["num_threads"], warmup=warmup, runs=runs)
+        except Exception as e:
+            results.append({**cfg, "error": str(e)})
+            continue
+        results.append({**cfg, "median_ms": round(ms, 3)})
+
+    timed = [r for r in results if "median_ms" in r]
+    if not timed:
+        raise RuntimeError(f"No interpreter config could run {model_path}")
+
+    best = min(timed, key=lambda r: r["median_ms"])
+    return {
+        "delegate": best["delegate"],
+        "num_threads": best["num_threads"],
+        "median_ms": best["median_ms"],
+        "candidates": results,
+    }
+
+
+def _read_cache(cache_path: Path) -> dict:
+    try:
+        return json.loads(Path(cache_path).read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def load_tuned(model_path: str, cache_path: Path = DEFAULT_CACHE) -> Optional[dict]:
+    """
+    Cached config for this model, or None if missing or tuned on a
+    different host / different model file.
+    """
+    entry = _read_cache(cache_path).get(Path(model_path).name)
+    if not entry:
+        return None
+    if entry.get("host") != host_fingerprint() or entry.get("model") != model_fingerprint(model_path):
+        return None
+    return {"delegate": entry["delegate"], "num_threads": entry["num_threads"]}
+
+
+def save_tuned(model_path: str, result: dict, cache_path: Path = DEFAULT_CACHE):
+    cache = _read_cache(cache_path)
+    cache[Path(model_path).name] = {
+        "delegate": result["delegate"],
+        "num_threads": result["num_threads"],
+        "median_ms": result.get("median_ms"),
+        "host": host_fingerprint(),
+        "model": model_fingerprint(model_path),
+    }
+    Path(cache_path).write_text(json.dumps(cache, indent=2))
+
+
+def resolve_runner_options(model_path: str, autotune_mode: str = "cache",
+                           num_threads=None, delegate: Optional[str] = None,
+                           cache_path: Path = DEFAULT_CACHE) -> dict:
+    """
+    Decide TFLiteRunner options for one model.
+
+    Explicit num_threads / delegate always win. Otherwise:
+      "off"     -> runtime defaults
+      "cache"   -> use the cached tuned config if it matches this host/model
+      "startup" -> use the cache, or benchmark now and store the result
+    """
+    opts = {"delegate": "default", "num_threads": None, "source": "default"}
+
+    if autotune_mode in ("cache", "startup"):
+        tuned = load_tuned(model_path, cache_path)
+        if tuned is None and autotune_mode == "startup":
+            result = autotune(model_path)
+            save_tuned(model_path, result, cache_path)
+            tuned = {"delegate": result["delegate"], "num_threads": result["num_threads"]}
+        if tuned is not None:
+            opts = {**tuned, "source": "autotune"}
+    elif autotune_mode != "off":
+        raise ValueError(f"Unknown autotune mode: {autotune_mode!r}. Expected 'off', 'cache' or 'startup'")
+
+    if delegate:
+        opts["delegate"] = delegate
+        opts["source"] = "config"
+    if num_threads is not None:
+        opts["num_threads"] = int(num_threads)
+        opts["source"] = "config"
+
+    return opts
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Autotune TFLite interpreter options per model")
+    parser.add_argument("models", nargs="+")
+    parser.add_argument("--cache", type=Path, default=DEFAULT_CACHE)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    for model in args.models:
+        result = autotune(model, runs=args.runs)
+        save_tuned(model, result, args.cache)
+        print(f"{Path(model).name}: delegate={result['delegate']} num_threads={result['num_threads']} "
+              f"({result['median_ms']} ms)")
+        for row in result["candidates"]:
+            print(f"    {row}")
@@ -0,0 +1,90 @@
+# THESIS/runtime/warmup.py
+"""
+Startup warm-up and first-request latency tracking.
+
+Much of the request path initializes lazily on first use: librosa's
+lazily imported submodules and numba-compiled kernels (the first
+librosa.load alone takes seconds), the soxr resampler, scipy filter
+design, the batched interpreter behind predict_windows and the first
+invoke of each TFLite model. Without a warm-up the first real request
+pays all of it.
+
+run_warmup() runs named steps (the service passes its own pipeline on a
+synthetic recording) and times each one; LatencyTracker keeps the first
+and recent request latencies per key so the effect shows in /metrics.
+"""
+
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+
+def synthetic_recording(seconds: float = 12.0, sr: int = 44100, channels: int = 2, seed: int = 0) -> np.ndarray:
+    """
+    Heart-sound-like test signal: 50 Hz bursts at ~75 bpm over low noise,
+    shaped (samples, channels) so decoding exercises downmix and resampling.
+    It passes the signal-quality gate, so warm-up reaches every stage.
+    """
+    t = np.arange(int(seconds * sr)) / sr
+    env = sum(np.exp(-((t - b) / 0.03) ** 2) for b in np.arange(0.1, seconds, 0.8))
+    y = 0.3 * env * np.sin(2 * np.pi * 50 * t) + np.random.default_rng(seed).normal(0, 0.01, len(t))
+    return np.repeat(y[:, np.newaxis], channels, axis=1).astype(np.float32)
+
+
+def run_warmup(steps: Dict[str, Callable[[], object]]) -> dict:
+    """
+    Run each step once, in order. A failing step is reported, not raised:
+    the service can still start, only its first request stays slow.
+    """
+    report = {"steps_ms": {}, "errors": {}}
+    start = time.perf_counter()
+    for name, step in steps.items():
+        t0 = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            report["errors"][name] = f"{type(e).__name__}: {e}"
+            print(f"=== WARM-UP STEP FAILED: {name} ===")
+            print(traceback.format_exc())
+        report["steps_ms"][name] = round((time.perf_counter() - t0) * 1000.0, 1)
+    report["total_ms"] = round((time.perf_counter() - start) * 1000.0, 1)
+    return report
+
+
+class LatencyTracker:
+    """
+    Per key (e.g. "heart", "lung"): the first request's latency and the
+    median of the last `window` ones.
+    """
+
+    def __init__(self, window: int = 100):
+        self.window = window
+        self._lock = threading.Lock()
+        self._first: Dict[str, float] = {}
+        self._count: Dict[str, int] = {}
+        self._recent: Dict[str, deque] = {}
+
+    def record(self, key: str, elapsed_ms: float):
+        with self._lock:
+            self._first.setdefault(key, elapsed_ms)
+            self._count[key] = self._count.get(key, 0) + 1
+            self._recent.setdefault(key, deque(maxlen=self.window)).append(elapsed_ms)
+
+    def first_ms(self, key: str) -> Optional[float]:
+        with self._lock:
+            return self._first.get(key)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                key: {
+                    "requests": self._count[key],
+                    "first_ms": round(self._first[key], 1),
+                    "median_ms": round(float(np.median(self._recent[key])), 1),
+                }
+                for key in self._first
+            }
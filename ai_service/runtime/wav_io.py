@@ -0,0 +1,172 @@
+# THESIS/runtime/wav_io.py
+"""
+Zero-copy WAV / raw PCM access for recordings on shared storage and
+application/octet-stream request bodies.
+
+The RIFF header is parsed directly and the sample data is memory-mapped,
+so decoding reads straight from the page cache instead of going through
+upload body -> temp file -> decoder copies. Formats the parser does not
+handle (8/24-bit PCM, compressed WAV, other containers) fall back to
+librosa.load.
+"""
+
+import mmap
+import struct
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+import librosa
+
+from .features import SAMPLE_RATE, load_wav_mono_16k, normalize_peak
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# raw PCM sample formats accepted by pcm_from_bytes (little-endian, interleaved)
+PCM_FORMATS = {
+    "int16": np.dtype("<i2"),
+    "float32": np.dtype("<f4"),
+}
+
+
+def _sample_dtype(format_tag: int, bits: int) -> Optional[np.dtype]:
+    if format_tag == WAVE_FORMAT_PCM and bits == 16:
+        return np.dtype("<i2")
+    if format_tag == WAVE_FORMAT_PCM and bits == 32:
+        return np.dtype("<i4")
+    if format_tag == WAVE_FORMAT_IEEE_FLOAT and bits == 32:
+        return np.dtype("<f4")
+    return None
+
+
+def read_wav_header(buf) -> Tuple[int, int, Optional[np.dtype], int, int]:
+    """
+    Parse RIFF/WAVE chunks from a bytes-like buffer.
+    Returns (sample_rate, channels, dtype or None if unsupported, data_offset, data_bytes).
+    """
+    if len(buf) < 12 or bytes(buf[0:4]) != b"RIFF" or bytes(buf[8:12]) != b"WAVE":
+        raise ValueError("Not a RIFF/WAVE file")
+
+    fmt = None
+    pos = 12
+    while pos + 8 <= len(buf):
+        chunk_id = bytes(buf[pos:pos + 4])
+        size = struct.unpack_from("<I", buf, pos + 4)[0]
+        body = pos + 8
+
+        if chunk_id == b"fmt ":
+            format_tag, channels, sr, _, _, bits = struct.unpack_from("<HHIIHH", buf, body)
+            if format_tag == WAVE_FORMAT_EXTENSIBLE and size >= 40:
+                # first two bytes of the sub-format GUID carry the real format tag
+                format_tag = struct.unpack_from("<H", buf, body + 24)[0]
+            fmt = (sr, channels, _sample_dtype(format_tag, bits))
+
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise ValueError("WAV data chunk before fmt chunk")
+            sr, channels, dtype = fmt
+            # some writers leave size as 0/0xFFFFFFFF for streamed files: data runs to the end
+            if size in (0, 0xFFFFFFFF):
+                size = len(buf) - body
+            size = min(size, len(buf) - body)
+            return sr, channels, dtype, body, size
+
+        # chunks are word-aligned
+        pos = body + size + (size & 1)
+
+    raise ValueError("WAV file has no data chunk")
+
+
+def mmap_wav(path: str):
+    """
+    Memory-map a PCM16/PCM32/float32 WAV.
+    Returns (samples (frames, channels) view, sample_rate), or None when the
+    format needs a real decoder. The view keeps the mapping alive.
+    """
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    try:
+        sr, channels, dtype, offset, nbytes = read_wav_header(mm)
+    except Exception:
+        mm.close()
+        raise
+    if dtype is None or channels < 1:
+        mm.close()
+        return None
+
+    frames = nbytes // (dtype.itemsize * channels)
+    data = np.frombuffer(mm, dtype=dtype, count=frames * channels, offset=offset)
+    return data.reshape(frames, channels), sr
+
+
+def pcm_from_bytes(buf, sample_format: str = "int16", channels: int = 1) -> np.ndarray:
+    """
+    Raw interleaved little-endian PCM -> (frames, channels) view of buf
+    (no copy). Raises ValueError for unknown formats or a partial frame.
+    """
+    dtype = PCM_FORMATS.get(str(sample_format).lower())
+    if dtype is None:
+        raise ValueError(f"Unsupported sample format: {sample_format} (use one of {', '.join(PCM_FORMATS)})")
+    if channels < 1:
+        raise ValueError(f"Invalid channel count: {channels}")
+
+    frame_bytes = dtype.itemsize * channels
+    if len(buf) == 0 or len(buf) % frame_bytes:
+        raise ValueError(f"PCM body of {len(buf)} bytes is not a whole number of {frame_bytes}-byte frames")
+
+    return np.frombuffer(buf, dtype=dtype).reshape(-1, channels)
+
+
+def pcm_to_mono_16k(samples: np.ndarray, sr: int, normalize: bool = True) -> np.ndarray:
+    """
+    (frames, channels) integer or float samples -> normalized mono float32 at
+    16 kHz, with the same scaling, downmix and resampler as librosa.load, so
+    results match load_wav_mono_16k() on the same file.
+    """
+    if np.issubdtype(samples.dtype, np.integer):
+        scale = np.float32(1.0 / (1 << (8 * samples.dtype.itemsize - 1)))
+        if samples.shape[1] == 1:
+            y = samples[:, 0] * scale
+        else:
+            y = (samples * scale).mean(axis=1, dtype=np.float32)
+    else:
+        y = samples[:, 0].astype(np.float32) if samples.shape[1] == 1 else samples.mean(axis=1, dtype=np.float32)
+
+    if sr != SAMPLE_RATE:
+        y = librosa.resample(y, orig_sr=sr, target_sr=SAMPLE_RATE)
+
+    if not normalize:
+        return y.astype(np.float32, copy=False)
+    return normalize_peak(y)
+
+
+def load_wav_mmap_mono_16k(path: str, normalize: bool = True, max_seconds: Optional[float] = None) -> np.ndarray:
+    mapped = mmap_wav(path)
+    if mapped is None:
+        return load_wav_mono_16k(path, normalize=normalize, max_seconds=max_seconds)
+    samples, sr = mapped
+    if max_seconds is not None:
+        samples = samples[:int(max_seconds * sr)]
+    return pcm_to_mono_16k(samples, sr, normalize=normalize)
+
+
+def resolve_storage_path(root: Path, key: str) -> Path:
+    """
+    Resolve a storage key (relative path, or absolute path inside root) and
+    make sure it cannot escape root via '..' or symlinks.
+    """
+    root = Path(root).resolve()
+    if not key or "\x00" in key:
+        raise ValueError("Empty or invalid storage path")
+
+    candidate = Path(key)
+    if not candidate.is_absolute():
+        candidate = root / candidate
+    candidate = candidate.resolve()
+
+    if candidate != root and root not in candidate.parents:
+        raise PermissionError(f"Path is outside the shared storage root: {key}")
+    return candidate
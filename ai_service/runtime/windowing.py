@@ -0,0 +1,95 @@
+# THESIS/runtime/windowing.py
+"""
+Sliding-window analysis of full-length recordings.
+
+The mel power spectrogram is computed once for the whole recording and
+sliced into overlapping model-sized windows (W frames each), so the cost
+grows linearly with recording length. Each window is converted to dB
+against its own max, the same as to_features() does for a single clip,
+and all windows go through the interpreter in batched invokes.
+"""
+
+from typing import List, Optional
+
+import numpy as np
+import librosa
+
+from .features import SAMPLE_RATE, HOP, mel_power, fit_frames, runner_expected_hw
+from .postprocess.recommendation import WindowPrediction
+
+ABNORMAL_LABELS = {"heart": "murmur", "lung": "crackles"}
+
+
+def window_starts(total_frames: int, W: int, hop_frames: int) -> List[int]:
+    """
+    Start frames of overlapping windows covering every frame.
+    A recording shorter than one window gives a single (padded) window.
+    """
+    if total_frames <= W:
+        return [0]
+    starts = list(range(0, total_frames - W + 1, hop_frames))
+    if starts[-1] + W < total_frames:
+        # last window flush with the end so the tail is not dropped
+        starts.append(total_frames - W)
+    return starts
+
+
+def windowed_features(audio: np.ndarray, runner, hop_seconds: Optional[float] = None):
+    """
+    Returns (X, starts, hop_frames): X is (N, H, W, 1) float32, starts are
+    window start frames. hop_seconds defaults to half a window.
+    """
+    H, W, C = runner_expected_hw(runner)
+    if C != 1:
+        raise ValueError(f"Expected channel C=1, got C={C}. Model shape mismatch.")
+
+    if hop_seconds is None:
+        hop_frames = max(1, W // 2)
+    else:
+        hop_frames = max(1, int(round(hop_seconds * SAMPLE_RATE / HOP)))
+
+    mel = mel_power(audio, H)
+    starts = window_starts(mel.shape[1], W, hop_frames)
+
+    X = np.empty((len(starts), H, W, 1), dtype=np.float32)
+    for i, s in enumerate(starts):
+        mel_db = librosa.power_to_db(mel[:, s:s + W], ref=np.max)
+        X[i, ..., 0] = fit_frames(mel_db, W)
+
+    return X, starts, hop_frames
+
+
+def predict_windows(audio: np.ndarray, runner, mode: str, threshold: float = 0.30,
+                    hop_seconds: Optional[float] = None, batch_size: int = 8) -> List[WindowPrediction]:
+    """
+    Timeline of WindowPredictions for the whole recording.
+
+    window_seconds is the hop (the part of the recording a window adds on
+    top of the previous one), so build_recommendation() sums to the real
+    recording duration instead of double-counting overlap.
+    """
+    X, starts, hop_frames = windowed_features(audio, runner, hop_seconds)
+    probs = runner.predict_batch(X, batch_size=batch_size).reshape(len(starts), -1)[:, 0]
+    probs = np.clip(probs, 0.0, 1.0)
+
+    frame_seconds = HOP / SAMPLE_RATE
+    duration = len(audio) / SAMPLE_RATE
+    abnormal = ABNORMAL_LABELS[mode]
+
+    timeline = []
+    for i, (s, p) in enumerate(zip(starts, probs)):
+        start_s = s * frame_seconds
+        if i + 1 < len(starts):
+            span = (starts[i + 1] - s) * frame_seconds
+        else:
+            span = max(duration - start_s, 0.0)
+        detected = p > threshold
+        timeline.append(WindowPrediction(
+            label=abnormal if detected else "normal",
+            confidence=float(p if detected else 1.0 - p),
+            window_seconds=float(span),
+            start_seconds=float(start_s),
+            probability=float(p),
+        ))
+
+    return timeline
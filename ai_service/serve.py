@@ -0,0 +1,54 @@
+"""
+Multi-process server: a supervisor preloads the heavy libraries, binds the
+port and forks N uvicorn workers that share those pages copy-on-write.
+Crashed workers are restarted; per-worker RSS/PSS/USS is printed every
+--report-interval seconds (and each worker reports its own under /metrics).
+
+Usage:
+  python serve.py --workers 4
+  AI_WORKERS=4 python serve.py
+
+The default worker count is the detected CPU quota (cgroup limit or
+affinity mask); each worker's thread pools get its share of it
+(runtime/concurrency.py).
+
+Linux only (fork + /proc). `python app.py` still runs a single process.
+"""
+
+import argparse
+import math
+import os
+
+from runtime.concurrency import apply_thread_limits, available_cpus, plan_from_env
+
+
+def _serve(sock):
+    # imported after fork: each worker builds its own interpreters
+    import uvicorn
+    from app import app
+
+    uvicorn.Server(uvicorn.Config(app, log_level="info")).run(sockets=[sock])
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--workers", type=int,
+                    default=int(os.environ.get("AI_WORKERS") or max(1, math.floor(available_cpus()[0]))))
+    ap.add_argument("--host", default="0.0.0.0")
+    ap.add_argument("--port", type=int, default=8001)
+    ap.add_argument("--report-interval", type=float, default=60.0,
+                    help="Seconds between memory reports (0 = off)")
+    args = ap.parse_args()
+
+    # workers inherit the environment: each plans for its share of the CPUs,
+    # and the preloaded BLAS pools start at the per-request cap
+    os.environ["AI_WORKERS"] = str(args.workers)
+    apply_thread_limits(plan_from_env().threads_per_request)
+    from runtime.supervisor import Supervisor
+
+    Supervisor(_serve, host=args.host, port=args.port, workers=args.workers,
+               report_interval=args.report_interval).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -18,36 +18,15 @@ public function infer(string $mode, Request $request, AiService $ai)
         $mode = strtolower(trim($mode));
 
         if (!in_array($mode, ['heart', 'lung'], true)) {
-            return response()->json([
-                'status' => 'error',
-                'message' => "Invalid mode: {$mode}. Use 'heart' or 'lung'.",
-            ], 422);
+            return $this->invalidMode($mode);
         }
 
-        // Validate upload
-        $request->validate([
-            'file' => ['required', 'file', 'mimes:wav', 'max:2048'], // Only accept .wav files up to 2MB
-        ]);
-
-        $uploaded = $request->file('file');
-
-        // Ensure temp folder exists (storage/app/temp_audio)
-        Storage::disk('local')->makeDirectory('temp_audio');
+        $fullPath = $this->storeUpload($request);
 
-        // Store with unique filename to avoid collisions
-        $filename = uniqid('rec_', true) . '_' . preg_replace('/\s+/', '_', $uploaded->getClientOriginalName());
-
-        // Save on local disk (storage/app/temp_audio/...)
-        $relativePath = $uploaded->storeAs('temp_audio', $filename, 'local');
-
-        // Convert to absolute OS path (Windows-safe)
-        $fullPath = Storage::disk('local')->path($relativePath);
-
-        if (!file_exists($fullPath)) {
+        if ($fullPath === null) {
             return response()->json([
                 'status' => 'error',
                 'message' => 'Stored audio file not found.',
-                'path' => $fullPath,
             ], 500);
         }
 
@@ -71,4 +50,107 @@ public function infer(string $mode, Request $request, AiService $ai)
             ], 500);
         }
     }
+
+    /**
+     * POST /api/infer/{mode}/jobs
+     * Same body as infer(). Queues the analysis and answers 202 with a
+     * job_id for GET /api/infer/jobs/{jobId}; 429 + Retry-After when the
+     * AI service queue is full.
+     */
+    public function submit(string $mode, Request $request, AiService $ai)
+    {
+        $mode = strtolower(trim($mode));
+
+        if (!in_array($mode, ['heart', 'lung'], true)) {
+            return $this->invalidMode($mode);
+        }
+
+        $fullPath = $this->storeUpload($request);
+
+        if ($fullPath === null) {
+            return response()->json([
+                'status' => 'error',
+                'message' => 'Stored audio file not found.',
+            ], 500);
+        }
+
+        try {
+            $job = $ai->submitJob($mode, $fullPath);
+        } catch (\Throwable $e) {
+            return response()->json([
+                'status' => 'error',
+                'message' => 'AI job submission failed.',
+                'error' => $e->getMessage(),
+            ], 500);
+        } finally {
+            // the AI service keeps its own copy of the upload
+            @unlink($fullPath);
+        }
+
+        if (($job['status'] ?? null) === 'busy') {
+            return response()->json([
+                'status' => 'busy',
+                'message' => 'AI service is busy, retry later.',
+                'retry_after' => $job['retry_after'],
+            ], 429)->header('Retry-After', (string) $job['retry_after']);
+        }
+
+        return response()->json($job, 202);
+    }
+
+    /**
+     * GET /api/infer/jobs/{jobId}?wait=N
+     * Job status, long-polling up to N seconds (max 60); 'result' holds the
+     * infer() payload once completed.
+     */
+    public function job(string $jobId, Request $request, AiService $ai)
+    {
+        try {
+            $job = $ai->jobResult($jobId, (int) $request->query('wait', 0));
+        } catch (\Throwable $e) {
+            return response()->json([
+                'status' => 'error',
+                'message' => 'AI job lookup failed.',
+                'error' => $e->getMessage(),
+            ], 500);
+        }
+
+        return response()->json($job, $job['status'] === 'not_found' ? 404 : 200);
+    }
+
+    private function invalidMode(string $mode)
+    {
+        return response()->json([
+            'status' => 'error',
+            'message' => "Invalid mode: {$mode}. Use 'heart' or 'lung'.",
+        ], 422);
+    }
+
+    /**
+     * Validate the "file" upload and store it under storage/app/temp_audio.
+     * Returns its absolute path, or null if the stored file is missing.
+     */
+    private function storeUpload(Request $request): ?string
+    {
+        // Validate upload
+        $request->validate([
+            'file' => ['required', 'file', 'mimes:wav', 'max:2048'], // Only accept .wav files up to 2MB
+        ]);
+
+        $uploaded = $request->file('file');
+
+        // Ensure temp folder exists (storage/app/temp_audio)
+        Storage::disk('local')->makeDirectory('temp_audio');
+
+        // Store with unique filename to avoid collisions
+        $filename = uniqid('rec_', true) . '_' . preg_replace('/\s+/', '_', $uploaded->getClientOriginalName());
+
+        // Save on local disk (storage/app/temp_audio/...)
+        $relativePath = $uploaded->storeAs('temp_audio', $filename, 'local');
+
+        // Convert to absolute OS path (Windows-safe)
+        $fullPath = Storage::disk('local')->path($relativePath);
+
+        return file_exists($fullPath) ? $fullPath : null;
+    }
 }
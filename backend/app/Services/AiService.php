@@ -10,6 +10,8 @@ class AiService
 {
     private string $baseUrl;
 
+    private ?string $sharedRoot;
+
     public function __construct()
     {
         // backend/config/services.php must contain:
@@ -21,6 +23,9 @@ public function __construct()
                 'AI service URL is not configured. Set AI_SERVICE_URL in backend/.env'
             );
         }
+
+        $sharedRoot = (string) config('services.ai_service.shared_root');
+        $this->sharedRoot = $sharedRoot !== '' ? (realpath($sharedRoot) ?: null) : null;
     }
 
     /**
@@ -29,6 +34,8 @@ public function __construct()
      * Your FastAPI endpoints are:
      *  - POST {baseUrl}/infer/heart  (multipart field name: "file")
      *  - POST {baseUrl}/infer/lung   (multipart field name: "file")
+     *  - POST {baseUrl}/infer/{mode}/path  (JSON {"path": key}) when the file is
+     *    under services.ai_service.shared_root
      *
      * @param string $mode     'heart' or 'lung'
      * @param string $audioPath full path to wav
@@ -46,19 +53,28 @@ public function infer(string $mode, string $audioPath): array
             throw new \RuntimeException("Audio file not found: {$audioPath}");
         }
 
-        $endpoint = "{$this->baseUrl}/infer/{$mode}";
+        $storageKey = $this->sharedStorageKey($audioPath);
+        $endpoint = $storageKey !== null
+            ? "{$this->baseUrl}/infer/{$mode}/path"
+            : "{$this->baseUrl}/infer/{$mode}";
 
         try {
-            /** @var Response $response */
-            $response = Http::timeout(300)
-                ->asMultipart()
-                ->attach(
-                    // IMPORTANT: FastAPI expects UploadFile param named "file"
-                    'file',
-                    file_get_contents($audioPath),
-                    basename($audioPath)
-                )
-                ->post($endpoint);
+            if ($storageKey !== null) {
+                // Shared volume: AI service memory-maps the file, no re-upload
+                /** @var Response $response */
+                $response = Http::timeout(300)->post($endpoint, ['path' => $storageKey]);
+            } else {
+                /** @var Response $response */
+                $response = Http::timeout(300)
+                    ->asMultipart()
+                    ->attach(
+                        // IMPORTANT: FastAPI expects UploadFile param named "file"
+                        'file',
+                        fopen($audioPath, 'r'),
+                        basename($audioPath)
+                    )
+                    ->post($endpoint);
+            }
 
             if (!$response->successful()) {
                 Log::error('AI Service HTTP error', [
@@ -102,6 +118,100 @@ public function infer(string $mode, string $audioPath): array
         }
     }
 
+    /**
+     * Queue an analysis on the AI service instead of waiting for it.
+     *
+     * FastAPI: POST {baseUrl}/jobs/{mode} (multipart field "file")
+     * Returns ['job_id' => ..., 'status' => 'queued', ...]. When the AI
+     * service is saturated (HTTP 429) it returns
+     * ['status' => 'busy', 'retry_after' => seconds] instead.
+     */
+    public function submitJob(string $mode, string $audioPath): array
+    {
+        $mode = strtolower(trim($mode));
+
+        if (!in_array($mode, ['heart', 'lung'], true)) {
+            throw new \InvalidArgumentException("Invalid mode: {$mode}. Expected 'heart' or 'lung'.");
+        }
+
+        if (!is_file($audioPath)) {
+            throw new \RuntimeException("Audio file not found: {$audioPath}");
+        }
+
+        $endpoint = "{$this->baseUrl}/jobs/{$mode}";
+
+        /** @var Response $response */
+        $response = Http::timeout(30)
+            ->asMultipart()
+            ->attach('file', fopen($audioPath, 'r'), basename($audioPath))
+            ->post($endpoint);
+
+        if ($response->status() === 429) {
+            return ['status' => 'busy', 'retry_after' => (int) ($response->header('Retry-After') ?: 1)];
+        }
+
+        if (!$response->successful() || !is_array($response->json())) {
+            Log::error('AI Service job submit failed', [
+                'endpoint' => $endpoint,
+                'mode' => $mode,
+                'status' => $response->status(),
+                'body' => $response->body(),
+            ]);
+
+            throw new \RuntimeException("AI service error (HTTP {$response->status()}).");
+        }
+
+        return $response->json();
+    }
+
+    /**
+     * Fetch a queued analysis, long-polling up to $waitSeconds (max 60).
+     *
+     * FastAPI: GET {baseUrl}/jobs/{jobId}?wait=N
+     * 'status' is queued | running | completed | error, or not_found for
+     * an unknown (or expired) job; 'result' holds the same payload infer()
+     * returns once completed.
+     */
+    public function jobResult(string $jobId, int $waitSeconds = 0): array
+    {
+        $waitSeconds = max(0, min(60, $waitSeconds));
+        $endpoint = "{$this->baseUrl}/jobs/" . rawurlencode($jobId);
+
+        /** @var Response $response */
+        $response = Http::timeout($waitSeconds + 10)->get($endpoint, ['wait' => $waitSeconds]);
+
+        if ($response->status() === 404) {
+            return ['job_id' => $jobId, 'status' => 'not_found'];
+        }
+
+        if (!$response->successful() || !is_array($response->json())) {
+            throw new \RuntimeException("AI service job lookup failed (HTTP {$response->status()}).");
+        }
+
+        return $response->json();
+    }
+
+    /**
+     * Path of $audioPath relative to the shared storage root, or null if
+     * sharing is not configured or the file lives elsewhere.
+     */
+    private function sharedStorageKey(string $audioPath): ?string
+    {
+        if ($this->sharedRoot === null) {
+            return null;
+        }
+
+        $real = realpath($audioPath);
+        $prefix = rtrim($this->sharedRoot, DIRECTORY_SEPARATOR) . DIRECTORY_SEPARATOR;
+
+        if ($real === false || !str_starts_with($real, $prefix)) {
+            return null;
+        }
+
+        // FastAPI side expects forward slashes
+        return str_replace(DIRECTORY_SEPARATOR, '/', substr($real, strlen($prefix)));
+    }
+
     /**
      * Optional: Add a /health endpoint in FastAPI, then use this.
      */
@@ -50,6 +50,10 @@
 
     'ai_service' => [
         'url' => env('AI_SERVICE_URL', 'http://127.0.0.1:8001'),
+
+        // Directory the AI service can also read (its AI_SHARED_STORAGE_ROOT).
+        // When set, recordings below it are sent by path instead of re-uploaded.
+        'shared_root' => env('AI_SERVICE_SHARED_ROOT'),
     ],
 
 ];
@@ -8,6 +8,8 @@
 
 // AI inference (already ok)
 Route::post('/infer/{mode}', [InferenceController::class, 'infer']);
+Route::post('/infer/{mode}/jobs', [InferenceController::class, 'submit']);
+Route::get('/infer/jobs/{jobId}', [InferenceController::class, 'job']);
 
 // Athletes (patients)
 Route::post('/athletes', [PatientController::class, 'store']);
@@ -1,18 +1,23 @@
+import math
 import wave
 import struct
 import random
 import time
 
-def create_test_wav(file_name, duration=2, sample_rate=16000, frequency=440):
+def create_test_wav(file_name, duration=2, sample_rate=16000, frequency=40):
     """
-    Create a simple test WAV file
+    Create a simple heart-like test WAV file: short tone bursts at 75 bpm
+    over low noise and a DC offset. It passes the service's signal-quality
+    gate (steady noise would be rejected as "retake"), so requests with it
+    reach the model.
     
     Args:
         file_name: Output file name
         duration: Duration in seconds
         sample_rate: Sample rate
-        frequency: Frequency in Hz
+        frequency: Burst frequency in Hz
     """
+    beat_period = 0.8   # 75 bpm
     with wave.open(file_name, 'w') as wav_file:
         wav_file.setnchannels(1)  # Mono
         wav_file.setsampwidth(2)  # 16-bit
@@ -21,10 +26,13 @@ def create_test_wav(file_name, duration=2, sample_rate=16000, frequency=440):
         num_samples = int(duration * sample_rate)
         
         for i in range(num_samples):
-            # Generate a simple sine wave
-            value = int(32767 * (0.3 * random.random() + 0.2) * 
-                      (1 + 0.5 * random.random() * 
-                      (i / (duration * sample_rate))))
+            t = i / sample_rate
+            # Gaussian-enveloped sine burst at the start of every beat
+            beat_t = (t % beat_period) - 0.1
+            envelope = math.exp(-(beat_t / 0.03) ** 2)
+            sample = 0.5 * envelope * math.sin(2 * math.pi * frequency * t)
+            sample += 0.2 + 0.02 * (random.random() - 0.5)
+            value = int(32767 * sample)
             data = struct.pack('<h', value)
             wav_file.writeframes(data)
             
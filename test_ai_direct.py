@@ -37,13 +37,17 @@ def test_ai_service(file_path, mode='heart'):
                 print(f"Result: {result}")
             else:
                 print(f"❌ Error: {response.text}")
-                
-            return response.status_code == 200
             
     except Exception as e:
         print(f"❌ Error: {e}")
         return False
 
+    if response.status_code != 200:
+        return False
+    # a retake means the recording never reached the model
+    assert result.get("result") != "retake", f"{file_path} rejected by the signal-quality gate: {result}"
+    return True
+
 # Test with your WAV file
 if __name__ == "__main__":
     # Replace with your test WAV file path
@@ -21,12 +21,15 @@ def test_heart_analysis():
             print(f"Status code: {response.status_code}")
             print(f"Response: {response.text}")
             
-            return response
-    
     except Exception as e:
         print(f"Error: {e}")
         return None
 
+    # the fixture (create_test_wav.py) must reach the model, not stop at the signal-quality gate
+    if response.status_code == 200:
+        assert response.json().get("result") != "retake", f"Test file rejected as retake: {response.text}"
+    return response
+
 # Test the AI service
 if __name__ == "__main__":
     print("Testing AI service...")
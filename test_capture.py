@@ -0,0 +1,148 @@
+"""
+Test slow-request capture and offline replay
+Verifies the capture rules, the size-capped ring and that replay reproduces captures
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+import soundfile as sf
+from ai_service.runtime.capture import LatencyCapture, load_captures
+
+AI_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ai_service")
+SAMPLE_RATE = 16000
+
+# captures one upload-path and one PCM request through the service's own helpers
+CAPTURE_SCRIPT = """
+import sys
+import numpy as np
+import app
+from runtime.wav_io import pcm_from_bytes
+
+wav, pcm = sys.argv[1], sys.argv[2]
+app._analyze_file("heart", wav, False, None, endpoint="upload")
+body = open(pcm, "rb").read()
+samples = pcm_from_bytes(body, "int16", 1)
+plan = {"path": "full"}
+params = {"windowed": True, "hop_seconds": None, "progressive_margin": None,
+          "sample_rate": 16000, "channels": 1, "sample_format": "int16", "plan": plan}
+app._captured(lambda trace: app._run_pcm("lung", samples, 16000, True, None, plan, None, trace),
+              "lung", "pcm", params, data=body, suffix=".pcm")
+"""
+
+
+def _recording(seconds=4, seed=0):
+    t = np.arange(SAMPLE_RATE * seconds) / SAMPLE_RATE
+    env = sum(np.exp(-((t - b) / 0.03) ** 2) for b in np.arange(0.1, seconds, 0.8))
+    return 0.3 * env * np.sin(2 * np.pi * 50 * t) + np.random.default_rng(seed).normal(0, 0.002, len(t))
+
+
+def test_capture_rules_and_ring():
+    """Test threshold / percentile decisions and pruning of the oldest captures"""
+    print("=== Capture Rules Test ===")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        by_percentile = LatencyCapture(os.path.join(tmp, "p"), percentile=90, min_samples=20)
+        assert all(by_percentile.should_capture(10.0 + i % 5) is None for i in range(20)), \
+            "Captured before min_samples were seen"
+        assert by_percentile.should_capture(12.0) is None
+        assert by_percentile.should_capture(50.0) is not None
+
+        ring = LatencyCapture(os.path.join(tmp, "ring"), threshold_ms=100, max_bytes=3000)
+        assert ring.observe(99.0, {"mode": "heart"}, data=b"x" * 10) is None
+        stems = [ring.observe(150.0 + i, {"mode": "heart", "i": i}, data=bytes(800), suffix=".pcm")
+                 for i in range(6)]
+        ring.flush()
+        captures = load_captures(ring.directory)
+        stats = ring.stats()
+        print(f"  kept {len(captures)} of {len(stems)} captures, stats {stats}")
+
+        assert all(stems) and stats["captured"] == 6 and stats["errors"] == 0
+        assert stats["pruned"] == 6 - len(captures) > 0
+        assert sum(p.stat().st_size for p in ring.directory.iterdir()) <= 3000
+        assert [c["id"] for c in captures] == sorted(stems)[-len(captures):], "Pruned the wrong captures"
+        assert captures[-1]["i"] == 5 and captures[-1]["capture_reason"] == ">= 100 ms"
+        assert open(captures[-1]["input_path"], "rb").read() == bytes(800)
+
+        # the caller deletes its upload as soon as observe returns
+        upload = os.path.join(tmp, "upload.wav")
+        with open(upload, "wb") as f:
+            f.write(b"RIFF" + bytes(796))
+        stem = ring.observe(200.0, {"mode": "lung"}, source_path=upload)
+        os.remove(upload)
+        ring.flush()
+        latest = load_captures(ring.directory)[-1]
+        assert latest["id"] == stem and open(latest["input_path"], "rb").read() == b"RIFF" + bytes(796)
+        assert not list(ring.directory.glob("*.part")) and ring.stats()["captured"] == 7
+        captures = load_captures(ring.directory)
+
+        # an interrupted write (input without metadata) is not listed
+        (ring.directory / "20000101-000000-000000000-deadbe.pcm").write_bytes(b"")
+        assert len(load_captures(ring.directory)) == len(captures)
+
+    print("✅ Capture rules test passed")
+
+
+def test_capture_and_replay():
+    """Test requests captured by the service replay to the same results"""
+    print("\n=== Capture + Replay Test ===")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        wav = os.path.join(tmp, "rec.wav")
+        sf.write(wav, _recording(), SAMPLE_RATE, subtype="PCM_16")
+        pcm = os.path.join(tmp, "rec.pcm")
+        with open(pcm, "wb") as f:
+            f.write((np.clip(_recording(12, seed=1), -1, 1) * 32767).astype("<i2").tobytes())
+
+        captures_dir = os.path.join(tmp, "captures")
+        env = {**os.environ, "AI_CAPTURE_DIR": captures_dir, "AI_CAPTURE_THRESHOLD_MS": "0"}
+        proc = subprocess.run([sys.executable, "-c", CAPTURE_SCRIPT, wav, pcm], cwd=AI_DIR, env=env,
+                              capture_output=True, text=True, timeout=300)
+        assert proc.returncode == 0, proc.stderr
+
+        captures = load_captures(captures_dir)
+        assert [c["endpoint"] for c in captures] == ["upload", "pcm"]
+        assert all("decode" in c["timings_ms"] and c["elapsed_ms"] > 0 for c in captures)
+        assert captures[1]["params"]["windowed"] and captures[1]["input_bytes"] == os.path.getsize(pcm)
+
+        out = os.path.join(tmp, "replay.jsonl")
+        proc = subprocess.run([sys.executable, "replay.py", captures_dir, "--repeat", "2", "--out", out],
+                              cwd=AI_DIR, capture_output=True, text=True, timeout=300)
+        print("  " + proc.stdout.strip().replace("\n", "\n  "))
+        assert proc.returncode == 0, proc.stderr
+
+        rows = [json.loads(line) for line in open(out)]
+        assert len(rows) == 2 and not any(r["changed"] for r in rows), "Replay changed a captured result"
+        assert "windows" in rows[1]["replay_stages_ms"] and rows[0]["replay_ms_min"] > 0
+        assert not os.path.exists(os.path.join(captures_dir, "replay.jsonl"))
+        assert len(load_captures(captures_dir)) == 2, "Replay captured into the replayed directory"
+
+    print("✅ Capture + replay test passed")
+
+
+def main():
+    print("🔍 Slow-request Capture Tests")
+    print("=" * 50)
+
+    try:
+        test_capture_rules_and_ring()
+        test_capture_and_replay()
+
+        print("\n" + "=" * 50)
+        print("✅ All capture tests passed!")
+
+    except Exception as e:
+        print(f"\n❌ Test failed: {e}")
+        import traceback
+        print(traceback.format_exc())
+        return False
+
+    return True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Test the thread-oversubscription governor
+Verifies cgroup quota detection, the thread plan and the limits the service applies
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+from ai_service.runtime.concurrency import cgroup_cpu_limit, plan_concurrency
+
+AI_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ai_service")
+
+HEALTH_SCRIPT = """
+import json
+import app
+print(json.dumps(app.health()["concurrency"] | {"interpreter": app.health()["interpreter"]}))
+"""
+
+# a /stream response in progress, then closed early by the client
+STREAM_SLOT_SCRIPT = """
+import json, sys
+import app
+
+lines = app._stream_lines("heart", sys.argv[1], None, 30.0)
+next(lines)
+held = not app.analysis_slots.acquire(blocking=False)
+lines.close()
+released = app.analysis_slots.acquire(blocking=False)
+print(json.dumps({"held": held, "released": released}))
+"""
+
+
+def _cgroup(root: Path, files: dict) -> Path:
+    for name, value in files.items():
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(value + "\n")
+    return root
+
+
+def test_cgroup_quota():
+    """Test v2 / v1 CPU quotas are read and unlimited groups give None"""
+    print("=== cgroup Quota Test ===")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        assert cgroup_cpu_limit(_cgroup(tmp / "v2", {"cpu.max": "150000 100000"})) == 1.5
+        assert cgroup_cpu_limit(_cgroup(tmp / "v2max", {"cpu.max": "max 100000"})) is None
+        v1 = _cgroup(tmp / "v1", {"cpu/cpu.cfs_quota_us": "200000", "cpu/cpu.cfs_period_us": "100000"})
+        assert cgroup_cpu_limit(v1) == 2.0
+        v1 = _cgroup(tmp / "v1max", {"cpu,cpuacct/cpu.cfs_quota_us": "-1", "cpu,cpuacct/cpu.cfs_period_us": "100000"})
+        assert cgroup_cpu_limit(v1) is None
+        assert cgroup_cpu_limit(tmp / "empty") is None
+
+    print("✅ cgroup quota test passed")
+
+
+def test_plan():
+    """Test the CPUs are split between processes and requests without oversubscribing"""
+    print("\n=== Concurrency Plan Test ===")
+
+    for cpus, kwargs in [(4, {}), (8, {"processes": 2}), (8, {"request_workers": 2}), (1.5, {}),
+                         (4, {"processes": 8}), (16, {"processes": 2, "request_workers": 3})]:
+        plan = plan_concurrency(cpus, **kwargs)
+        busy = plan.processes * plan.request_workers * plan.threads_per_request
+        print(f"  {cpus} CPUs {kwargs} -> {plan.to_dict()}")
+        assert plan.request_workers >= 1 and plan.threads_per_request >= 1
+        assert busy <= max(cpus, plan.processes), "Plan oversubscribes the CPUs"
+        assert plan.tflite_threads == max(1, int(cpus // plan.processes)), "Interpreters not sized to the process"
+
+    assert plan_concurrency(8, request_workers=2).threads_per_request == 4
+    assert plan_concurrency(8).tflite_threads == 8
+    explicit = plan_concurrency(4, request_workers=1, threads_per_request=2, tflite_threads=3)
+    assert (explicit.threads_per_request, explicit.tflite_threads) == (2, 3)
+
+    print("✅ Concurrency plan test passed")
+
+
+def test_service_applies_limits():
+    """Test the service caps the loaded pools and interpreters and reports it in /health"""
+    print("\n=== Applied Limits Test ===")
+
+    def health(**extra):
+        env = {**os.environ, "AI_REQUEST_WORKERS": "1", "AI_BLAS_THREADS": "2", "OPENBLAS_NUM_THREADS": "7",
+               "AI_TFLITE_AUTOTUNE": "off", "AI_WARMUP": "0", **extra}
+        if "AI_TFLITE_THREADS" not in extra:
+            env.pop("AI_TFLITE_THREADS", None)
+        proc = subprocess.run([sys.executable, "-c", HEALTH_SCRIPT], cwd=AI_DIR, env=env,
+                              capture_output=True, text=True, timeout=300)
+        assert proc.returncode == 0, proc.stderr
+        return json.loads(proc.stdout.strip().splitlines()[-1])
+
+    report = health()
+    print(f"  {report}")
+
+    assert report["request_workers"] == 1 and report["threads_per_request"] == 2
+    threads = report["threads"]
+    assert set(threads["env"].values()) == {"2"}, "Governor did not override the thread variables"
+    assert threads["native_pools"] and all(p["num_threads"] <= 2 for p in threads["native_pools"])
+    cpus = max(1, int(report["cpus"]))
+    assert all(r["num_threads"] == cpus and r["source"] == "governor" for r in report["interpreter"].values())
+
+    # an explicit interpreter thread count is kept even above the per-request share
+    explicit = health(AI_TFLITE_THREADS="3")["interpreter"]
+    print(f"  AI_TFLITE_THREADS=3: {explicit}")
+    assert all(r["num_threads"] == 3 and r["source"] == "config" for r in explicit.values())
+
+    print("✅ Applied limits test passed")
+
+
+def test_stream_takes_a_slot():
+    """Test a /stream response holds an analysis slot until it ends"""
+    print("\n=== Stream Slot Test ===")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "long.wav")
+        t = np.arange(16000 * 30) / 16000
+        env = sum(np.exp(-((t - b) / 0.03) ** 2) for b in np.arange(0.1, 30, 0.8))
+        sf.write(path, 0.3 * env * np.sin(2 * np.pi * 35 * t) + np.random.default_rng(0).normal(0, 0.01, len(t)),
+                 16000, subtype="PCM_16")
+        proc = subprocess.run([sys.executable, "-c", STREAM_SLOT_SCRIPT, path], cwd=AI_DIR,
+                              env={**os.environ, "AI_REQUEST_WORKERS": "1", "AI_WARMUP": "0"},
+                              capture_output=True, text=True, timeout=300)
+    assert proc.returncode == 0, proc.stderr
+    report = json.loads(proc.stdout.strip().splitlines()[-1])
+    print(f"  {report}")
+    assert report["held"], "Stream analysed without an analysis slot"
+    assert report["released"], "Slot not released when the stream was closed"
+
+    print("✅ Stream slot test passed")
+
+
+def main():
+    print("🔍 Thread Governor Tests")
+    print("=" * 50)
+
+    try:
+        test_cgroup_quota()
+        test_plan()
+        test_service_applies_limits()
+        test_stream_takes_a_slot()
+
+        print("\n" + "=" * 50)
+        print("✅ All thread governor tests passed!")
+
+    except Exception as e:
+        print(f"\n❌ Test failed: {e}")
+        import traceback
+        print(traceback.format_exc())
+        return False
+
+    return True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Test the per-worker DSP workspace
+Verifies results match the allocating path and steady-state requests reuse buffers
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+
+import numpy as np
+import soundfile as sf
+from ai_service.runtime.audio_preprocessing import preprocess_audio
+from ai_service.runtime.dsp_workspace import MAX_RETAINED_BYTES, MAX_SAMPLES, DSPWorkspace, workspace_for
+from ai_service.runtime.features import SAMPLE_RATE, to_features
+
+
+AI_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ai_service")
+
+# one long recording through the service, single clip and windowed, in this thread
+LONG_RECORDING_SCRIPT = """
+import sys
+import app
+from runtime.dsp_workspace import get_workspace
+
+for windowed in (False, True):
+    app._run_file("heart", sys.argv[1], windowed, None)
+    print(get_workspace().stats()["buffer_bytes"])
+"""
+
+
+class _Runner:
+    input_shape = (1, 64, 256, 1)
+
+
+def _audio(seconds, seed=0):
+    return (np.random.default_rng(seed).normal(0, 0.1, int(SAMPLE_RATE * seconds))).astype(np.float32)
+
+
+def test_results_match():
+    """Test workspace path matches the plain path"""
+    print("=== Results Match Test ===")
+
+    ws = DSPWorkspace()
+    for seconds in (10, 3.2, 0.4):
+        y = _audio(seconds)
+        for mode in ("heart", "lung"):
+            plain = preprocess_audio(y, SAMPLE_RATE, mode=mode)
+            reused = preprocess_audio(y, SAMPLE_RATE, mode=mode, workspace=ws)
+            assert np.array_equal(plain, reused), f"preprocess differs ({seconds}s, {mode})"
+
+        x_plain = to_features(plain, _Runner())
+        x_reused = to_features(reused, _Runner(), workspace=ws)
+        diff = float(np.max(np.abs(x_plain - x_reused)))
+        print(f"  {seconds}s: max feature diff {diff:.2e} dB")
+        assert x_reused.shape == x_plain.shape and x_reused.dtype == np.float32
+        assert diff < 1e-3, f"Features differ by {diff} dB"
+
+    print("✅ Results match test passed")
+
+
+def test_several_hum_frequencies():
+    """Test the workspace path with a multi-frequency notch (memoized SOS cascade)"""
+    print("\n=== Several Hum Frequencies Test ===")
+
+    ws = DSPWorkspace()
+    t = np.arange(SAMPLE_RATE * 5) / SAMPLE_RATE
+    y = _audio(5) + 0.2 * np.sin(2 * np.pi * 60 * t) + 0.1 * np.sin(2 * np.pi * 120 * t)
+    y = y.astype(np.float32)
+    plain = preprocess_audio(y, SAMPLE_RATE, notch_freqs=[60.0, 120.0])
+    for _ in range(2):      # second call reuses the memoized cascade
+        reused = preprocess_audio(y, SAMPLE_RATE, workspace=ws, notch_freqs=[60.0, 120.0])
+        assert np.array_equal(plain, reused), "Multi-notch workspace path differs"
+
+    print("✅ Several hum frequencies test passed")
+
+
+def test_steady_state_reuses_buffers():
+    """Test repeated requests of similar length allocate no new buffers"""
+    print("\n=== Steady State Test ===")
+
+    ws = DSPWorkspace()
+
+    def request(y, workspace):
+        return to_features(preprocess_audio(y, SAMPLE_RATE, workspace=workspace), _Runner(), workspace=workspace)
+
+    request(_audio(10), ws)
+    first = ws.stats()["allocations"]
+
+    for i, seconds in enumerate((10, 9.5, 8.7)):
+        request(_audio(seconds, seed=i + 1), ws)
+    stats = ws.stats()
+    print(f"  {stats}")
+    assert stats["allocations"] == first, "Steady-state request allocated new buffers"
+    assert stats["reuses"] > 0
+
+    def peak(workspace):
+        y = _audio(10, seed=7)
+        tracemalloc.start()
+        request(y, workspace)
+        _, p = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return p
+
+    plain_peak, ws_peak = peak(None), peak(ws)
+    print(f"  traced peak per request: plain {plain_peak / 1e6:.1f} MB, workspace {ws_peak / 1e6:.1f} MB")
+    assert ws_peak < plain_peak
+
+    print("✅ Steady state test passed")
+
+
+def test_long_recordings_are_not_retained():
+    """Test long recordings bypass the workspace and trim() bounds what is kept"""
+    print("\n=== Retained Buffers Test ===")
+
+    assert workspace_for(MAX_SAMPLES) is not None and workspace_for(MAX_SAMPLES + 1) is None
+
+    ws = DSPWorkspace()
+    preprocess_audio(_audio(60), SAMPLE_RATE, workspace=ws)
+    grown = ws.stats()["buffer_bytes"]
+    released = ws.trim(8 << 20)
+    stats = ws.stats()
+    print(f"  60 s through a workspace: {grown / 1e6:.1f} MB, trimmed to {stats['buffer_bytes'] / 1e6:.1f} MB")
+    assert stats["buffer_bytes"] <= 8 << 20 and released == grown - stats["buffer_bytes"] > 0
+    assert stats["released"] > 0 and stats["released_bytes"] == released
+    assert np.array_equal(preprocess_audio(_audio(3), SAMPLE_RATE, workspace=ws),
+                          preprocess_audio(_audio(3), SAMPLE_RATE)), "Trimmed workspace gives different results"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "long.wav")
+        t = np.arange(SAMPLE_RATE * 180) / SAMPLE_RATE
+        env = sum(np.exp(-((t - b) / 0.03) ** 2) for b in np.arange(0.1, 180, 0.8))
+        sf.write(path, 0.3 * env * np.sin(2 * np.pi * 40 * t) + 0.002 * np.sin(2 * np.pi * 7 * t), SAMPLE_RATE,
+                 subtype="PCM_16")
+        proc = subprocess.run([sys.executable, "-c", LONG_RECORDING_SCRIPT, path], cwd=AI_DIR,
+                              env={**os.environ, "AI_WARMUP": "0"}, capture_output=True, text=True, timeout=300)
+        assert proc.returncode == 0, proc.stderr
+        single, windowed = map(int, proc.stdout.split()[-2:])
+        print(f"  180 s in the service: {single / 1e6:.1f} MB kept after single clip, {windowed / 1e6:.1f} MB "
+              f"after windowed")
+        assert single <= MAX_RETAINED_BYTES and windowed <= MAX_RETAINED_BYTES
+
+    print("✅ Retained buffers test passed")
+
+
+def main():
+    print("🔍 DSP Workspace Tests")
+    print("=" * 50)
+
+    try:
+        test_results_match()
+        test_several_hum_frequencies()
+        test_steady_state_reuses_buffers()
+        test_long_recordings_are_not_retained()
+
+        print("\n" + "=" * 50)
+        print("✅ All DSP workspace tests passed!")
+
+    except Exception as e:
+        print(f"\n❌ Test failed: {e}")
+        import traceback
+        print(traceback.format_exc())
+        return False
+
+    return True
+
+
+if __name__ == "__main__":
+    main()
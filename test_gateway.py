@@ -0,0 +1,171 @@
+"""
+Test the scale-out gateway
+Verifies routing (consistent hashing, bounded loads) and a gateway in front of local instances
+"""
+
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import numpy as np
+import requests
+import soundfile as sf
+from ai_service.runtime.routing import HashRing, InstancePool, content_key
+
+AI_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ai_service")
+SAMPLE_RATE = 16000
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_healthy(url, proc, timeout=120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        assert proc.poll() is None, f"{url} exited with {proc.returncode}"
+        try:
+            if requests.get(f"{url}/health", timeout=2).status_code == 200:
+                return
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"{url} did not become healthy")
+
+
+def _recording(path, seed):
+    t = np.arange(SAMPLE_RATE * 3) / SAMPLE_RATE
+    env = sum(np.exp(-((t - b) / 0.03) ** 2) for b in np.arange(0.1, 3, 0.8))
+    y = 0.3 * env * np.sin(2 * np.pi * 50 * t) + np.random.default_rng(seed).normal(0, 0.002, len(t))
+    sf.write(path, y, SAMPLE_RATE, subtype="PCM_16")
+
+
+def test_routing():
+    """Test keys stay put when instances change and bounded loads spill hot keys"""
+    print("=== Routing Test ===")
+
+    keys = [f"recording-{i}".encode() for i in range(2000)]
+    three = HashRing(["a", "b", "c"])
+    four = HashRing(["a", "b", "c", "d"])
+    owners3 = [next(three.walk(k)) for k in keys]
+    owners4 = [next(four.walk(k)) for k in keys]
+    moved = sum(o3 != o4 for o3, o4 in zip(owners3, owners4))
+    print(f"  spread over 3: {dict(Counter(owners3))}, moved when adding a 4th: {moved}")
+    assert all(o4 in (o3, "d") for o3, o4 in zip(owners3, owners4)), "Keys moved between surviving instances"
+    assert 0.15 < moved / len(keys) < 0.35
+    assert min(Counter(owners3).values()) > len(keys) / 3 * 0.7
+
+    # multipart boundaries do not change the key; the payload does
+    part = b'--%s\r\nContent-Disposition: form-data; name="file"; filename="x.wav"\r\n\r\nAUDIO\r\n--%s--\r\n'
+    k1 = content_key("/infer/heart", "multipart/form-data; boundary=aaa", part % (b"aaa", b"aaa"))
+    k2 = content_key("/infer/heart", "multipart/form-data; boundary=bbb", part % (b"bbb", b"bbb"))
+    assert k1 == k2 and k1 != content_key("/infer/lung", "multipart/form-data; boundary=aaa", part % (b"aaa", b"aaa"))
+    assert content_key("/health", "", b"") is None
+
+    pool = InstancePool(["http://a", "http://b", "http://c"], load_factor=0.25)
+    held = [pool.acquire(b"hot") for _ in range(9)]
+    per_instance = Counter(i.url for i in held)
+    print(f"  9 in-flight requests for one key: {dict(per_instance)}")
+    assert max(per_instance.values()) <= 4 and len(per_instance) == 3
+    for inst in held:
+        pool.release(inst)
+
+    pool.mark_failed(pool.instances[0], "down")
+    assert all(pool.acquire(f"k{i}".encode()).url != "http://a" for i in range(50))
+    assert pool.acquire(None, exclude=pool.instances[1:]).url == "http://a", "Down instance not used as last resort"
+
+    print("✅ Routing test passed")
+
+
+def test_gateway_with_instances():
+    """Test a gateway over two local instances: affinity, jobs and failover"""
+    print("\n=== Gateway Test ===")
+
+    ports = [_free_port() for _ in range(2)]
+    urls = [f"http://127.0.0.1:{p}" for p in ports]
+    gateway_url = f"http://127.0.0.1:{_free_port()}"
+    procs = []
+    try:
+        for port in ports:
+            procs.append(subprocess.Popen([sys.executable, "-m", "uvicorn", "app:app", "--port", str(port),
+                                           "--log-level", "warning"], cwd=AI_DIR,
+                                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+        procs.append(subprocess.Popen([sys.executable, "gateway.py", "--port", gateway_url.rsplit(":", 1)[1],
+                                       "--health-interval", "0.5", "--instance", urls[0], "--instance", urls[1]],
+                                      cwd=AI_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+        for url, proc in zip(urls + [gateway_url], procs):
+            _wait_healthy(url, proc)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = []
+            for i in range(6):
+                paths.append(os.path.join(tmp, f"rec{i}.wav"))
+                _recording(paths[-1], i)
+
+            def infer(path):
+                with open(path, "rb") as f:
+                    r = requests.post(f"{gateway_url}/infer/heart", files={"file": (os.path.basename(path), f)},
+                                      timeout=120)
+                assert r.status_code == 200, r.text
+                return r.headers["X-Gateway-Instance"], r.json()
+
+            served = [infer(p)[0] for p in paths]
+            again = [infer(p)[0] for p in paths]
+            print(f"  served by {dict(Counter(served))}")
+            assert served == again, "Same recording went to a different instance"
+
+            with open(paths[0], "rb") as f:
+                r = requests.post(f"{gateway_url}/jobs/heart", files={"file": ("a.wav", f)}, timeout=60)
+            assert r.status_code == 202, r.text
+            job_id = r.json()["job_id"]
+            job = requests.get(f"{gateway_url}/jobs/{job_id}", params={"wait": 30}, timeout=60).json()
+            assert job["status"] == "completed" and job["job_id"] == job_id, job
+
+            # stop the instance serving the first recording: requests fail over to the other one
+            victim = served[0]
+            procs[urls.index(victim)].terminate()
+            procs[urls.index(victim)].wait(timeout=30)
+            instance, result = infer(paths[0])
+            assert instance != victim and result["status"] == "completed"
+
+            health = requests.get(f"{gateway_url}/health", timeout=5).json()
+            print(f"  after failover: {[(i['url'], i['healthy']) for i in health['instances']]}")
+            assert health["healthy_instances"] == 1
+            assert not next(i for i in health["instances"] if i["url"] == victim)["healthy"]
+    finally:
+        for proc in procs:
+            if proc.poll() is None:
+                proc.terminate()
+                proc.wait(timeout=30)
+
+    print("✅ Gateway test passed")
+
+
+def main():
+    print("🔍 Gateway Tests")
+    print("=" * 50)
+
+    try:
+        test_routing()
+        test_gateway_with_instances()
+
+        print("\n" + "=" * 50)
+        print("✅ All gateway tests passed!")
+
+    except Exception as e:
+        print(f"\n❌ Test failed: {e}")
+        import traceback
+        print(traceback.format_exc())
+        return False
+
+    return True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Test the in-process job queue
+Verifies results, load shedding and queue metrics
+"""
+
+import asyncio
+import threading
+import time
+from ai_service.runtime.jobs import JobQueue, QueueFull
+
+
+def test_jobs_complete():
+    """Test submitted jobs run and can be long-polled"""
+    print("=== Job Completion Test ===")
+
+    q = JobQueue(lambda job: {"echo": job.payload}, workers=2, max_depth=4)
+    q.start()
+
+    jobs = [q.submit("heart", i) for i in range(4)]
+    for i, job in enumerate(jobs):
+        done = q.wait(job.id, timeout=5)
+        assert done.status == "completed", f"Job {i} did not complete"
+        assert done.to_dict()["result"] == {"echo": i}
+
+    stats = q.stats()
+    print(f"  Stats: {stats}")
+    assert stats["completed"] == 4 and stats["queue_depth"] == 0
+
+    q.shutdown()
+    print("✅ Job completion test passed")
+
+
+def test_load_shedding():
+    """Test a full queue rejects with a Retry-After instead of growing"""
+    print("\n=== Load Shedding Test ===")
+
+    release = threading.Event()
+    q = JobQueue(lambda job: release.wait(5) and {}, workers=1, max_depth=2)
+    q.start()
+
+    running = q.submit("lung", None)
+    deadline = time.monotonic() + 5
+    while running.status != "running" and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    q.submit("lung", None)
+    q.submit("lung", None)
+    try:
+        q.submit("lung", None)
+    except QueueFull as e:
+        print(f"  Rejected, retry after {e.retry_after}s")
+        assert e.retry_after >= 1
+    else:
+        raise AssertionError("Queue accepted more than max_depth waiting jobs")
+
+    assert q.stats()["rejected"] == 1
+    release.set()
+    q.shutdown()
+    print("✅ Load shedding test passed")
+
+
+def test_errors_and_expiry():
+    """Test handler errors are reported and finished jobs expire"""
+    print("\n=== Errors and Expiry Test ===")
+
+    def fail(job):
+        raise ValueError("bad audio")
+
+    q = JobQueue(fail, workers=1, max_depth=2, result_ttl=0.05)
+    q.start()
+    job = q.submit("heart", None)
+    done = q.wait(job.id, timeout=5)
+    assert done.status == "error" and done.to_dict()["detail"] == "bad audio"
+
+    time.sleep(0.1)
+    assert q.get(job.id) is None, "Finished job did not expire"
+
+    q.shutdown()
+    print("✅ Errors and expiry test passed")
+
+
+def test_async_long_poll():
+    """Test async long-polls wake on completion without a thread each"""
+    print("\n=== Async Long-poll Test ===")
+
+    release = threading.Event()
+    q = JobQueue(lambda job: release.wait(5) and {"ok": True}, workers=1, max_depth=2)
+    q.start()
+    job = q.submit("heart", None)
+
+    async def poll():
+        threads = threading.active_count()
+        start = time.monotonic()
+        waits = [asyncio.ensure_future(q.wait_async(job.id, 10)) for _ in range(200)]
+        timed_out = await q.wait_async(job.id, 0.1)
+        assert timed_out.status in ("queued", "running") and threading.active_count() == threads, "Long-polls used threads"
+        release.set()
+        done = await asyncio.gather(*waits)
+        return done, time.monotonic() - start
+
+    done, elapsed = asyncio.run(poll())
+    print(f"  200 concurrent long-polls answered in {elapsed * 1000:.0f} ms")
+    assert all(d.status == "completed" for d in done) and elapsed < 5
+    assert not job.waiters, "Finished long-polls left waiters behind"
+    assert asyncio.run(q.wait_async("missing", 1)) is None
+
+    q.shutdown()
+    print("✅ Async long-poll test passed")
+
+
+def main():
+    print("🔍 Job Queue Tests")
+    print("=" * 50)
+
+    try:
+        test_jobs_complete()
+        test_load_shedding()
+        test_errors_and_expiry()
+        test_async_long_poll()
+
+        print("\n" + "=" * 50)
+        print("✅ All job queue tests passed!")
+
+    except Exception as e:
+        print(f"\n❌ Test failed: {e}")
+        import traceback
+        print(traceback.format_exc())
+        return False
+
+    return True
+
+
+if __name__ == "__main__":
+    main()
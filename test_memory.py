@@ -0,0 +1,123 @@
+"""
+Test per-stage memory tracing and per-request memory budgets
+Verifies the header estimate covers the traced pipeline and budget decisions
+"""
+
+import os
+import tempfile
+import tracemalloc
+
+import numpy as np
+import soundfile as sf
+from ai_service.runtime.audio_preprocessing import preprocess_audio
+from ai_service.runtime.features import SAMPLE_RATE, load_wav_mono_16k, normalize_peak
+from ai_service.runtime.memory import (
+    MemoryBudgetExceeded, RecordingInfo, StageMemoryTrace,
+    estimate_request_bytes, plan_request, probe_recording, start_tracing,
+)
+
+
+def test_stage_trace():
+    """Test stages record their own peak and disabled traces record nothing"""
+    print("=== Stage Trace Test ===")
+
+    start_tracing()
+    trace = StageMemoryTrace(True)
+    with trace.stage("small"):
+        a = np.ones(1 << 18)
+    with trace.stage("large"):
+        b = np.ones(1 << 22)
+        del b
+    print(f"  {trace.to_dict()}")
+    assert 2 << 20 <= trace.stages["small"] < 4 << 20
+    assert 32 << 20 <= trace.stages["large"] < 40 << 20
+
+    off = StageMemoryTrace(False)
+    with off.stage("x"):
+        np.ones(1 << 20)
+    assert off.to_dict() == {}
+    del a
+    tracemalloc.stop()
+
+    print("✅ Stage trace test passed")
+
+
+def test_estimate_covers_pipeline():
+    """Test the header-only estimate is not below the traced decode + preprocess peak"""
+    print("\n=== Estimate Test ===")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for sr, channels, subtype in ((16000, 1, "PCM_16"), (44100, 2, "PCM_16"), (48000, 1, "FLOAT")):
+            path = os.path.join(tmp, "rec.wav")
+            data = np.random.default_rng(0).normal(0, 0.1, (sr * 20, channels))
+            sf.write(path, data, sr, subtype=subtype)
+
+            info = probe_recording(path)
+            assert (info.sample_rate, info.channels, info.frames) == (sr, channels, sr * 20)
+
+            load_wav_mono_16k(path, normalize=False)    # one-time resampler setup
+            tracemalloc.start()
+            y = load_wav_mono_16k(path, normalize=False)
+            preprocess_audio(normalize_peak(y), SAMPLE_RATE)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            estimate = estimate_request_bytes(info)
+            print(f"  {sr} Hz x{channels}: traced {peak / 2**20:.1f} MB, estimated {estimate / 2**20:.1f} MB")
+            assert peak <= estimate <= 2 * peak + (8 << 20), "Estimate is off"
+
+        assert probe_recording(os.path.join(tmp, "missing.wav")) is None
+
+    print("✅ Estimate test passed")
+
+
+def test_budget_plan():
+    """Test full / cropped / streaming / reject decisions"""
+    print("\n=== Budget Plan Test ===")
+
+    long = RecordingInfo(44100, 2, 44100 * 300)     # 5 min stereo
+    full = estimate_request_bytes(long)
+    cropped = estimate_request_bytes(long, 11.0)
+
+    assert plan_request(long, None, False, 10, True)["path"] == "full"
+    assert plan_request(None, 1, False, 10, True)["path"] == "full"
+    assert plan_request(long, full, False, 10, True)["path"] == "full"
+
+    plan = plan_request(long, cropped, False, 10, True)
+    assert plan["path"] == "cropped" and plan["max_seconds"] == 11.0
+    assert plan_request(long, cropped, True, 10, True)["path"] == "streaming"
+
+    for windowed, streaming_ok, budget in ((True, False, cropped), (False, True, cropped - 1)):
+        try:
+            plan_request(long, budget, windowed, 10, streaming_ok)
+        except MemoryBudgetExceeded as e:
+            print(f"  rejected: {e}")
+            continue
+        raise AssertionError("Over-budget request was not rejected")
+
+    print("✅ Budget plan test passed")
+
+
+def main():
+    print("🔍 Memory Budget Tests")
+    print("=" * 50)
+
+    try:
+        test_stage_trace()
+        test_estimate_covers_pipeline()
+        test_budget_plan()
+
+        print("\n" + "=" * 50)
+        print("✅ All memory budget tests passed!")
+
+    except Exception as e:
+        print(f"\n❌ Test failed: {e}")
+        import traceback
+        print(traceback.format_exc())
+        return False
+
+    return True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Test progressive early-exit inference
+Verifies the early-exit rule and that the full span matches the default path
+"""
+
+import numpy as np
+from pathlib import Path
+from ai_service.runtime.tflite_runner import TFLiteRunner
+from ai_service.runtime.audio_preprocessing import preprocess_audio
+from ai_service.runtime.features import HOP, SAMPLE_RATE, normalize_peak, predict, runner_expected_hw, to_features
+from ai_service.runtime.progressive import progressive_predict
+
+MODELS_DIR = Path(__file__).resolve().parent / "ai_service" / "models"
+MAX_SAMPLES = SAMPLE_RATE * 10
+
+
+def _recording(seconds=12, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(SAMPLE_RATE * seconds) / SAMPLE_RATE
+    env = sum(np.exp(-((t - b) / 0.03) ** 2) for b in np.arange(0.1, seconds, 0.8))
+    return (0.3 * env * np.sin(2 * np.pi * 50 * t) + rng.normal(0, 0.01, len(t))).astype(np.float32)
+
+
+def _default_probability(y, runner, mode):
+    audio = preprocess_audio(normalize_peak(y), SAMPLE_RATE, mode=mode)[:MAX_SAMPLES]
+    return float(np.asarray(predict(runner, to_features(audio, runner))).reshape(-1)[0])
+
+
+def test_full_span_matches_default():
+    """Test a run that never exits early ends on the default path's probability"""
+    print("=== Full Span Test ===")
+
+    for mode in ("heart", "lung"):
+        runner = TFLiteRunner(str(MODELS_DIR / f"{mode}_model.tflite"))
+        y = _recording()
+        result, audio = progressive_predict(y, runner, mode, MAX_SAMPLES, margin=1.0)
+        default = _default_probability(y, runner, mode)
+        print(f"  {mode}: {result.windows} windows over {result.seconds} s, "
+              f"p={result.probability:.4f} (default {default:.4f})")
+
+        assert not result.early_exit and result.windows == len(result.probabilities) > 1
+        assert abs(result.probability - default) < 1e-3, "Full progressive run differs from the default path"
+        assert len(audio) == int(result.seconds * SAMPLE_RATE) and np.max(np.abs(audio)) <= 1.0
+
+    print("✅ Full span test passed")
+
+
+def test_early_exit():
+    """Test the margin decides how far the span is extended"""
+    print("\n=== Early Exit Test ===")
+
+    runner = TFLiteRunner(str(MODELS_DIR / "heart_model.tflite"))
+    y = _recording(seed=1)
+
+    window_samples = (runner_expected_hw(runner)[1] - 1) * HOP
+    first, _ = progressive_predict(y, runner, "heart", MAX_SAMPLES, margin=0.0)
+    assert first.windows == 1 and first.early_exit and first.seconds == window_samples / SAMPLE_RATE
+
+    full, _ = progressive_predict(y, runner, "heart", MAX_SAMPLES, margin=1.0)
+    # a margin just past the first step's distance stops at the first step that clears it
+    p = full.probabilities
+    margin = abs(p[0] - 0.30) + 1e-6
+    expected = next((i + 1 for i, q in enumerate(p) if abs(q - 0.30) >= margin), len(p))
+    mid, _ = progressive_predict(y, runner, "heart", MAX_SAMPLES, margin=margin)
+    print(f"  probabilities {[round(q, 4) for q in p]}, margin {margin:.4f} -> {mid.windows} windows")
+    assert mid.windows == expected
+    assert np.allclose(mid.probabilities, p[:mid.windows]), "Extending changed earlier steps"
+
+    short, _ = progressive_predict(y[:SAMPLE_RATE * 3], runner, "heart", MAX_SAMPLES, margin=1.0)
+    assert short.windows == 1 and not short.early_exit and short.seconds == 3.0
+
+    print("✅ Early exit test passed")
+
+
+def test_no_early_exit_on_padded_input():
+    """Test an answer is only taken early from a span that fills the model window"""
+    print("\n=== Padded Input Test ===")
+
+    for mode in ("heart", "lung"):
+        runner = TFLiteRunner(str(MODELS_DIR / f"{mode}_model.tflite"))
+        W = runner_expected_hw(runner)[1]
+        for seed in range(3):
+            y = _recording(seed=seed)
+            for initial in (0.5, 2.0, 4.0):
+                result, _ = progressive_predict(y, runner, mode, MAX_SAMPLES, margin=0.0, initial_seconds=initial)
+                frames = 1 + int(round(result.seconds * SAMPLE_RATE)) // HOP
+                assert result.early_exit and frames >= W, f"{mode}: early exit on {frames} of {W} frames"
+        print(f"  {mode}: first answer from {result.seconds:.2f} s ({frames} frames, model window {W})")
+
+        short, _ = progressive_predict(_recording(5), runner, mode, MAX_SAMPLES, margin=0.0)
+        assert not short.early_exit and short.seconds == 5.0, "Clip shorter than a window was not used whole"
+
+    print("✅ Padded input test passed")
+
+
+def main():
+    print("🔍 Progressive Inference Tests")
+    print("=" * 50)
+
+    try:
+        test_full_span_matches_default()
+        test_early_exit()
+        test_no_early_exit_on_padded_input()
+
+        print("\n" + "=" * 50)
+        print("✅ All progressive inference tests passed!")
+
+    except Exception as e:
+        print(f"\n❌ Test failed: {e}")
+        import traceback
+        print(traceback.format_exc())
+        return False
+
+    return True
+
+
+if __name__ == "__main__":
+    main()
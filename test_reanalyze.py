@@ -0,0 +1,142 @@
+"""
+Test the offline bulk re-analysis CLI
+Verifies results are written per file and an interrupted run resumes
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+import soundfile as sf
+
+AI_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ai_service")
+SAMPLE_RATE = 16000
+
+
+def _write_recordings(folder, count):
+    t = np.arange(SAMPLE_RATE * 4) / SAMPLE_RATE
+    for i in range(count):
+        env = sum(np.exp(-((t - b) / 0.03) ** 2) for b in np.arange(0.1, 4, 0.8))
+        y = 0.3 * env * np.sin(2 * np.pi * 50 * t) + np.random.default_rng(i).normal(0, 0.002, len(t))
+        sf.write(os.path.join(folder, f"rec{i}.wav"), y, SAMPLE_RATE, subtype="PCM_16")
+    with open(os.path.join(folder, "broken.wav"), "wb") as f:
+        f.write(b"not a wav")
+
+
+def _run(*args, env=None):
+    proc = subprocess.run([sys.executable, "reanalyze.py", *args], cwd=AI_DIR, env=env,
+                          capture_output=True, text=True, timeout=300)
+    return proc.returncode, proc.stdout
+
+
+def test_manifest_and_resume():
+    """Test a manifest run writes every file and a resumed run skips finished ones"""
+    print("=== Re-analysis Test ===")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        _write_recordings(tmp, 4)
+        manifest = os.path.join(tmp, "manifest.csv")
+        with open(manifest, "w") as f:
+            f.write("path,mode\nrec0.wav,heart\nrec1.wav,lung\nrec2.wav,heart\nrec3.wav,lung\nbroken.wav,heart\n")
+        out = os.path.join(tmp, "scores.jsonl")
+
+        code, stdout = _run("--manifest", manifest, "--out", out, "--workers", "2")
+        print("  " + stdout.strip().replace("\n", "\n  "))
+        rows = [json.loads(line) for line in open(out)]
+        assert len(rows) == 5 and code == 1, "Expected 5 rows and a non-zero exit for the broken file"
+        by_name = {os.path.basename(r["path"]): r for r in rows}
+        assert by_name["broken.wav"]["result"] == "error"
+        assert by_name["rec1.wav"]["mode"] == "lung"
+        assert all(0.0 <= by_name[f"rec{i}.wav"]["probability"] <= 1.0 for i in range(4))
+
+        # simulate an interruption: two finished rows plus a half-written one
+        with open(out, "w") as f:
+            f.write("".join(json.dumps(r) + "\n" for r in rows[:2]) + '{"path": "x')
+
+        code, stdout = _run("--manifest", manifest, "--out", out, "--workers", "2")
+        print("  " + stdout.strip().replace("\n", "\n  "))
+        assert "2 already in" in stdout and "3 to process" in stdout
+        resumed = [json.loads(line) for line in open(out)]
+        assert sorted(r["path"] for r in resumed) == sorted(r["path"] for r in rows), "Resume lost or duplicated files"
+
+    print("✅ Re-analysis test passed")
+
+
+def test_batched_matches_per_file():
+    """Test --batch scores every file like the per-file run"""
+    print("\n=== Batched Re-analysis Test ===")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        _write_recordings(tmp, 5)
+        manifest = os.path.join(tmp, "manifest.csv")
+        with open(manifest, "w") as f:
+            f.write("path,mode\n" + "".join(f"rec{i}.wav,heart\n" for i in range(3)) +
+                    "broken.wav,heart\nrec3.wav,lung\nrec4.wav,lung\n")
+
+        results = {}
+        for name, extra in (("per-file", []), ("batched", ["--batch", "4"])):
+            out = os.path.join(tmp, f"{name}.jsonl")
+            code, stdout = _run("--manifest", manifest, "--out", out, "--workers", "1", *extra)
+            assert code == 1, stdout
+            results[name] = {os.path.basename(r["path"]): r for r in map(json.loads, open(out))}
+
+        assert results["batched"].keys() == results["per-file"].keys()
+        for name, row in results["per-file"].items():
+            batched = results["batched"][name]
+            assert batched["result"] == row["result"] and batched["mode"] == row["mode"], name
+            if row["result"] != "error":
+                assert abs(batched["probability"] - row["probability"]) < 1e-3, name
+        print(f"  {len(results['batched'])} files, batched results match")
+
+    print("✅ Batched re-analysis test passed")
+
+
+def test_service_quality_settings():
+    """Test the quality gate uses the service's AI_QC_* settings"""
+    print("\n=== Re-analysis QC Settings Test ===")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        _write_recordings(tmp, 2)
+        os.remove(os.path.join(tmp, "broken.wav"))
+        strict = {**os.environ, "AI_QC_MIN_SNR_DB": "200"}
+        for extra in ([], ["--batch", "2"]):
+            out = os.path.join(tmp, f"scores{len(extra)}.jsonl")
+            code, stdout = _run(tmp, "--out", out, "--workers", "1", *extra, env=strict)
+            rows = [json.loads(line) for line in open(out)]
+            assert code == 0 and len(rows) == 2, stdout
+            assert all(r["result"] == "retake" and "constant noise" in r["error"] for r in rows), rows
+
+            out = os.path.join(tmp, f"off{len(extra)}.jsonl")
+            _run(tmp, "--out", out, "--workers", "1", *extra, env={**strict, "AI_QC_ENABLED": "0"})
+            assert all(json.loads(line)["result"] in ("normal", "abnormal") for line in open(out))
+        print("  AI_QC_MIN_SNR_DB=200 -> retake, AI_QC_ENABLED=0 -> scored")
+
+    print("✅ Re-analysis QC settings test passed")
+
+
+def main():
+    print("🔍 Bulk Re-analysis Tests")
+    print("=" * 50)
+
+    try:
+        test_manifest_and_resume()
+        test_batched_matches_per_file()
+        test_service_quality_settings()
+
+        print("\n" + "=" * 50)
+        print("✅ All re-analysis tests passed!")
+
+    except Exception as e:
+        print(f"\n❌ Test failed: {e}")
+        import traceback
+        print(traceback.format_exc())
+        return False
+
+    return True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+Test the streaming pipeline
+Verifies block resampling, carried filter state and bounded memory
+"""
+
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+import numpy as np
+import soundfile as sf
+from pathlib import Path
+from scipy.signal import resample_poly, butter, sosfilt, sosfilt_zi
+from ai_service.runtime.tflite_runner import TFLiteRunner
+from ai_service.runtime.postprocess.recommendation import WindowPrediction, build_recommendation
+from ai_service.runtime.streaming import BlockResampler, StreamingFilter, stream_predictions
+
+MODELS_DIR = Path(__file__).resolve().parent / "ai_service" / "models"
+AI_DIR = Path(__file__).resolve().parent / "ai_service"
+
+# posts each recording to /infer/heart/stream and prints its NDJSON lines
+STREAM_ENDPOINT_SCRIPT = """
+import json, sys
+from fastapi.testclient import TestClient
+import app
+
+with TestClient(app.app) as client:
+    for path in sys.argv[1:]:
+        with open(path, "rb") as f:
+            r = client.post("/infer/heart/stream", files={"file": ("a.wav", f)})
+        assert r.status_code == 200, r.text
+        print(json.dumps([json.loads(line) for line in r.text.splitlines()]))
+"""
+
+
+def _stream_endpoint(*paths):
+    env = {**os.environ, "AI_WARMUP": "0"}
+    proc = subprocess.run([sys.executable, "-c", STREAM_ENDPOINT_SCRIPT, *map(str, paths)], cwd=AI_DIR, env=env,
+                          capture_output=True, text=True, timeout=300)
+    assert proc.returncode == 0, proc.stderr
+    return [json.loads(line) for line in proc.stdout.strip().splitlines()[-len(paths):]]
+
+
+def _heart_like(seconds, sr=16000, hum_hz=None, seed=0):
+    t = np.arange(int(seconds * sr)) / sr
+    env = sum(np.exp(-((t - b) / 0.03) ** 2) for b in np.arange(0.1, seconds, 0.8))
+    y = 0.3 * env * np.sin(2 * np.pi * 35 * t) + np.random.default_rng(seed).normal(0, 0.01, len(t))
+    if hum_hz is not None:
+        y += 0.05 * np.sin(2 * np.pi * hum_hz * t)
+    return y
+
+
+def test_block_resampler():
+    """Test block-wise resampling matches one-shot resampling"""
+    print("=== Block Resampler Test ===")
+
+    x = np.random.default_rng(0).normal(size=44100 * 2).astype(np.float32)
+    resampler = BlockResampler(44100, 16000)
+    out = [resampler.push(x[i:i + 3000]) for i in range(0, len(x), 3000)]
+    out.append(resampler.flush())
+    y = np.concatenate(out)
+
+    ref = resample_poly(x, 160, 441)
+    print(f"  Samples: {len(y)} (one-shot {len(ref)})")
+    assert len(y) == len(ref), "Resampled length differs"
+    assert np.allclose(y, ref, atol=1e-5), "Block resampling differs from one-shot"
+
+    print("✅ Block resampler test passed")
+
+
+def test_streaming_filter_state():
+    """Test carried filter state matches filtering the whole signal at once"""
+    print("\n=== Streaming Filter Test ===")
+
+    x = np.random.default_rng(1).normal(size=16000).astype(np.float32)
+    filt = StreamingFilter(16000, notch_freq=None)
+    y = np.concatenate([filt.push(x[i:i + 1000]) for i in range(0, len(x), 1000)])
+
+    sos = butter(5, [20.0 / 8000, 2000.0 / 8000], btype="band", output="sos")
+    ref = sosfilt(sos, x, zi=sosfilt_zi(sos) * x[0])[0]
+    assert np.allclose(y, ref, atol=1e-4), "Block filtering differs from one-shot"
+
+    print("✅ Streaming filter test passed")
+
+
+def test_streaming_bounded_memory():
+    """Test the timeline covers the recording and peak memory does not grow with length"""
+    print("\n=== Streaming Memory Test ===")
+
+    runner = TFLiteRunner(str(MODELS_DIR / "lung_model.tflite"))
+    rng = np.random.default_rng(2)
+    peaks = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for seconds in (30, 180):
+            path = str(Path(tmp) / f"{seconds}.wav")
+            sf.write(path, rng.normal(0, 0.1, 16000 * seconds).astype(np.float32), 16000)
+
+            list(stream_predictions(path, runner, "lung"))   # warm-up (librosa caches)
+            tracemalloc.start()
+            preds = list(stream_predictions(path, runner, "lung"))
+            peaks[seconds] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            covered = sum(p.window_seconds for p in preds)
+            print(f"  {seconds}s: {len(preds)} windows, {covered:.2f}s covered, peak {peaks[seconds] / 1e6:.2f} MB")
+            assert abs(covered - seconds) < 0.05, "Timeline does not add up to the recording length"
+
+    assert peaks[180] < peaks[30] * 1.5, "Peak memory grows with recording length"
+
+    print("✅ Streaming memory test passed")
+
+
+def test_stream_endpoint_notches_detected_hum():
+    """Test /infer/{mode}/stream notches the hum detected in the recording, not a fixed 60 Hz"""
+    print("\n=== Stream Endpoint Hum Test ===")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        hum, clean = Path(tmp) / "hum50.wav", Path(tmp) / "clean.wav"
+        sf.write(hum, _heart_like(20, hum_hz=50.0), 16000, subtype="PCM_16")
+        sf.write(clean, _heart_like(20, seed=1), 16000, subtype="PCM_16")
+        hum_lines, clean_lines = _stream_endpoint(hum, clean)
+
+    for lines in (hum_lines, clean_lines):
+        assert lines[-1]["type"] == "summary" and lines[-1]["status"] == "completed", lines[-1]
+        assert any(line["type"] == "window" for line in lines)
+    print(f"  mains_hum_hz: 50 Hz recording {hum_lines[-1]['debug']['mains_hum_hz']}, "
+          f"clean {clean_lines[-1]['debug']['mains_hum_hz']}")
+    assert hum_lines[-1]["debug"]["mains_hum_hz"] == [50.0]
+    assert clean_lines[-1]["debug"]["mains_hum_hz"] == []
+
+    print("✅ Stream endpoint hum test passed")
+
+
+def test_stream_endpoint_quality_gate():
+    """Test /infer/{mode}/stream stops silent or hum-only recordings at the quality gate"""
+    print("\n=== Stream Endpoint Quality Gate Test ===")
+
+    t = np.arange(16000 * 20) / 16000
+    with tempfile.TemporaryDirectory() as tmp:
+        silent, hum_only = Path(tmp) / "silent.wav", Path(tmp) / "hum.wav"
+        sf.write(silent, np.zeros(len(t)), 16000, subtype="PCM_16")
+        sf.write(hum_only, 0.3 * np.sin(2 * np.pi * 60 * t), 16000, subtype="PCM_16")
+        results = _stream_endpoint(silent, hum_only)
+
+    for lines in results:
+        print(f"  {lines[-1]['message']}")
+        assert len(lines) == 1 and lines[0]["type"] == "summary", "Windows streamed for a rejected recording"
+        assert lines[0]["status"] == "poor_signal_quality" and lines[0]["result"] == "retake"
+
+    print("✅ Stream endpoint quality gate test passed")
+
+
+def _consistency(text):
+    abnormal, last = map(int, re.fullmatch(r"(\d+)s of last (\d+)s abnormal", text).groups())
+    return abnormal, last
+
+
+def test_stream_summary_within_lookback():
+    """Test the summary never counts more abnormal seconds than the lookback"""
+    print("\n=== Stream Lookback Test ===")
+
+    # 36 s of abnormal 8 s windows: the oldest window straddles the 30 s lookback
+    history = [WindowPrediction("murmur", 0.95, 8.0 if i < 4 else 4.0, start_seconds=i * 8.0) for i in range(5)]
+    reco = build_recommendation("heart", history, lookback_seconds=30.0)
+    print(f"  all abnormal: {reco.consistency_text}")
+    assert _consistency(reco.consistency_text) == (30, 30)
+    quiet = [WindowPrediction("normal", 0.2, 8.0)] + [WindowPrediction("murmur", 0.8, 8.0) for _ in range(4)]
+    assert _consistency(build_recommendation("heart", quiet, lookback_seconds=30.0).consistency_text) == (30, 30)
+    quiet = [WindowPrediction("murmur", 0.8, 8.0)] + [WindowPrediction("normal", 0.2, 8.0) for _ in range(4)]
+    assert _consistency(build_recommendation("heart", quiet, lookback_seconds=30.0).consistency_text) == (0, 30)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        long = Path(tmp) / "long.wav"
+        sf.write(long, _heart_like(36), 16000, subtype="PCM_16")
+        lines = _stream_endpoint(long)[0]
+
+    covered = sum(line["seconds"] for line in lines if line["type"] == "window")
+    text = lines[-1]["recommendation"]["consistency_text"]
+    print(f"  36 s upload ({covered:.1f} s of windows): {text}")
+    abnormal, last = _consistency(text)
+    assert covered > 30 and last == 30 and abnormal <= last
+
+    print("✅ Stream lookback test passed")
+
+
+def main():
+    print("🔍 Streaming Pipeline Tests")
+    print("=" * 50)
+
+    try:
+        test_block_resampler()
+        test_streaming_filter_state()
+        test_streaming_bounded_memory()
+        test_stream_endpoint_notches_detected_hum()
+        test_stream_endpoint_quality_gate()
+        test_stream_summary_within_lookback()
+
+        print("\n" + "=" * 50)
+        print("✅ All streaming pipeline tests passed!")
+
+    except Exception as e:
+        print(f"\n❌ Test failed: {e}")
+        import traceback
+        print(traceback.format_exc())
+        return False
+
+    return True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Test the pre-fork supervisor
+Verifies workers share the listening socket, crashed workers are restarted
+and memory is reported per worker
+"""
+
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import textwrap
+import time
+
+from ai_service.runtime.supervisor import process_memory
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_process_memory():
+    """Test RSS/PSS/USS are read for the current process"""
+    print("=== Process Memory Test ===")
+
+    mem = process_memory()
+    print(f"  {mem}")
+    assert mem["rss"] > 0 and 0 < mem["uss"] <= mem["rss"]
+    assert process_memory(999999999) == {}
+
+    print("✅ Process memory test passed")
+
+
+def test_restarts_crashed_worker():
+    """Test a worker that crashes is replaced and the others keep serving"""
+    print("\n=== Worker Restart Test ===")
+
+    port = _free_port()
+    with tempfile.TemporaryDirectory() as tmp:
+        marker = os.path.join(tmp, "crashed")
+        script = textwrap.dedent(f"""
+            import os, socket
+            from ai_service.runtime.supervisor import Supervisor
+
+            def serve(sock):
+                # the first worker to start crashes once; everyone else echoes its pid
+                try:
+                    fd = os.open({marker!r}, os.O_CREAT | os.O_EXCL)
+                    os.close(fd)
+                    os._exit(3)
+                except FileExistsError:
+                    pass
+                while True:
+                    conn, _ = sock.accept()
+                    conn.sendall(str(os.getpid()).encode())
+                    conn.close()
+
+            Supervisor(serve, host="127.0.0.1", port={port}, workers=2,
+                       report_interval=1.0, warmup=None).run()
+        """)
+        proc = subprocess.Popen([sys.executable, "-c", script], cwd=ROOT,
+                                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        try:
+            time.sleep(4)
+            pids = set()
+            for _ in range(6):
+                with socket.create_connection(("127.0.0.1", port), timeout=5) as c:
+                    pids.add(int(c.recv(32)))
+            print(f"  served by pids {sorted(pids)}")
+            assert pids, "No worker answered"
+        finally:
+            proc.send_signal(signal.SIGTERM)
+            out, _ = proc.communicate(timeout=20)
+
+    print(textwrap.indent(out.strip(), "  "))
+    assert "exited with code 3" in out and "restarting" in out, "Crashed worker was not restarted"
+    assert "uss=" in out, "No memory report"
+    assert proc.returncode == 0
+
+    print("✅ Worker restart test passed")
+
+
+def main():
+    print("🔍 Supervisor Tests")
+    print("=" * 50)
+
+    try:
+        test_process_memory()
+        test_restarts_crashed_worker()
+
+        print("\n" + "=" * 50)
+        print("✅ All supervisor tests passed!")
+
+    except Exception as e:
+        print(f"\n❌ Test failed: {e}")
+        import traceback
+        print(traceback.format_exc())
+        return False
+
+    return True
+
+
+if __name__ == "__main__":
+    main()
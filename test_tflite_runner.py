@@ -0,0 +1,135 @@
+"""
+Test the TFLite runner
+Verifies quantization helpers and float/quantized parity reporting
+"""
+
+import tempfile
+import numpy as np
+from pathlib import Path
+from ai_service.runtime.tflite_runner import (
+    TFLiteRunner,
+    quantize,
+    dequantize,
+    compare_runners
+)
+from ai_service.runtime.tflite_tuning import (
+    candidate_configs,
+    resolve_runner_options
+)
+
+MODELS_DIR = Path(__file__).resolve().parent / "ai_service" / "models"
+
+
+def test_quantize_roundtrip():
+    """Test int8/uint8 quantization round trip on log-mel dB values"""
+    print("=== Quantize Round-Trip Test ===")
+
+    # log-mel dB features live in roughly [-80, 0]
+    x = np.linspace(-80.0, 0.0, 1000, dtype=np.float32)
+
+    for dtype, zero_point in ((np.int8, 127), (np.uint8, 255)):
+        scale = 80.0 / 255.0
+        q = quantize(x, dtype, scale, zero_point)
+        assert q.dtype == dtype, f"Quantized dtype {q.dtype} != {dtype}"
+
+        back = dequantize(q, scale, zero_point)
+        max_err = float(np.max(np.abs(back - x)))
+        print(f"  {np.dtype(dtype).name}: max error {max_err:.4f} (scale {scale:.4f})")
+        assert max_err <= scale / 2 + 1e-5, "Round-trip error larger than half a step"
+
+    # values outside the representable range saturate instead of wrapping
+    q = quantize(np.array([-1000.0, 1000.0]), np.int8, 0.5, 0)
+    assert q.tolist() == [-128, 127], "Quantize did not saturate"
+
+    print("✅ Quantize round-trip test passed")
+
+
+def test_float_runner_predict():
+    """Test float model output is a float probability"""
+    print("\n=== Float Runner Test ===")
+
+    runner = TFLiteRunner(str(MODELS_DIR / "heart_model.tflite"))
+    assert not runner.is_quantized, "Float model reported as quantized"
+
+    x = np.full(runner.input_shape, -40.0, dtype=np.float32)
+    y = runner.predict(x)
+    print(f"  Output: {y} ({y.dtype})")
+    assert y.dtype == np.float32, "Output not dequantized to float32"
+
+    print("✅ Float runner test passed")
+
+
+def test_compare_runners_self_parity():
+    """Test parity report on identical models"""
+    print("\n=== Parity Report Test ===")
+
+    ref = TFLiteRunner(str(MODELS_DIR / "lung_model.tflite"))
+    cand = TFLiteRunner(str(MODELS_DIR / "lung_model.tflite"))
+
+    rng = np.random.default_rng(0)
+    inputs = [rng.uniform(-80, 0, ref.input_shape).astype(np.float32) for _ in range(4)]
+    report = compare_runners(ref, cand, inputs)
+    print(f"  Report: {report}")
+
+    assert report["samples"] == 4
+    assert report["max_abs_diff"] == 0.0, "Identical models disagree"
+    assert report["decision_agreement"] == 1.0
+
+    print("✅ Parity report test passed")
+
+
+def test_autotune_cache():
+    """Test per-model autotune results are cached and reused"""
+    print("\n=== Autotune Cache Test ===")
+
+    configs = candidate_configs(max_threads=4)
+    threads = sorted({c["num_threads"] for c in configs if c["delegate"] == "xnnpack"})
+    assert threads == [1, 2, 4], f"Unexpected thread candidates {threads}"
+
+    model = str(MODELS_DIR / "lung_model.tflite")
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = Path(tmp) / "tuning.json"
+
+        opts = resolve_runner_options(model, autotune_mode="cache", cache_path=cache)
+        assert opts["source"] == "default", "Empty cache should give runtime defaults"
+
+        opts = resolve_runner_options(model, autotune_mode="startup", cache_path=cache)
+        print(f"  Tuned: {opts}")
+        assert opts["source"] == "autotune" and cache.exists(), "Startup autotune did not store a result"
+
+        cached = resolve_runner_options(model, autotune_mode="cache", cache_path=cache)
+        assert cached == opts, "Cached config not reused"
+
+        forced = resolve_runner_options(model, autotune_mode="cache", num_threads=2, cache_path=cache)
+        assert forced["num_threads"] == 2 and forced["source"] == "config", "Explicit threads not applied"
+
+        runner = TFLiteRunner(model, num_threads=opts["num_threads"], delegate=opts["delegate"])
+        runner.predict(np.zeros(runner.input_shape, dtype=np.float32))
+
+    print("✅ Autotune cache test passed")
+
+
+def main():
+    print("🔍 TFLite Runner Tests")
+    print("=" * 50)
+
+    try:
+        test_quantize_roundtrip()
+        test_float_runner_predict()
+        test_compare_runners_self_parity()
+        test_autotune_cache()
+
+        print("\n" + "=" * 50)
+        print("✅ All TFLite runner tests passed!")
+
+    except Exception as e:
+        print(f"\n❌ Test failed: {e}")
+        import traceback
+        print(traceback.format_exc())
+        return False
+
+    return True
+
+
+if __name__ == "__main__":
+    main()
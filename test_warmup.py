@@ -0,0 +1,100 @@
+"""
+Test the startup warm-up
+Verifies the first request after startup is as fast as steady state
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+from ai_service.runtime.warmup import LatencyTracker, run_warmup
+
+AI_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ai_service")
+
+# a fresh process: startup (and warm-up) through TestClient, then a few uploads
+FIRST_REQUEST_SCRIPT = """
+import io, json
+import soundfile as sf
+from fastapi.testclient import TestClient
+import app
+from runtime.warmup import synthetic_recording
+
+buf = io.BytesIO()
+sf.write(buf, synthetic_recording(10.0, seed=3), 44100, format="WAV", subtype="PCM_16")
+with TestClient(app.app) as client:
+    for _ in range(4):
+        for mode in ("heart", "lung"):
+            r = client.post(f"/infer/{mode}", files={"file": ("a.wav", buf.getvalue())})
+            assert r.status_code == 200, r.text
+    print(json.dumps({"latency": client.get("/metrics").json()["latency"],
+                      "warmup": client.get("/health").json()["warmup"]}))
+"""
+
+
+def _first_requests(warmup: bool) -> dict:
+    env = {**os.environ, "AI_WARMUP": "1" if warmup else "0"}
+    proc = subprocess.run([sys.executable, "-c", FIRST_REQUEST_SCRIPT], cwd=AI_DIR, env=env,
+                          capture_output=True, text=True, timeout=300)
+    assert proc.returncode == 0, proc.stderr
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def test_warmup_helpers():
+    """Test failing steps are reported, not raised, and latencies are tracked per key"""
+    print("=== Warm-up Helpers Test ===")
+
+    report = run_warmup({"ok": lambda: None, "broken": lambda: 1 / 0})
+    assert set(report["steps_ms"]) == {"ok", "broken"} and "ZeroDivisionError" in report["errors"]["broken"]
+
+    tracker = LatencyTracker(window=3)
+    for ms in (900.0, 50.0, 60.0, 70.0):
+        tracker.record("heart", ms)
+    assert tracker.snapshot() == {"heart": {"requests": 4, "first_ms": 900.0, "median_ms": 60.0}}
+
+    print("✅ Warm-up helpers test passed")
+
+
+def test_first_request_latency():
+    """Test the first request matches steady state with warm-up, and is slower without"""
+    print("\n=== First Request Latency Test ===")
+
+    cold = _first_requests(warmup=False)
+    warm = _first_requests(warmup=True)
+    for name, run in (("no warm-up", cold), ("warm-up", warm)):
+        print(f"  {name}: " + ", ".join(f"{m} first {v['first_ms']} ms / median {v['median_ms']} ms"
+                                        for m, v in run["latency"].items()))
+    print(f"  warm-up took {warm['warmup']['total_ms']} ms: {warm['warmup']['steps_ms']}")
+
+    assert cold["warmup"] is None and not warm["warmup"]["errors"]
+    assert len(warm["warmup"]["steps_ms"]) == 10
+    for mode in ("heart", "lung"):
+        steady = warm["latency"][mode]["median_ms"]
+        assert warm["latency"][mode]["first_ms"] < 2.0 * steady + 50, f"{mode}: first request still slow"
+    assert cold["latency"]["heart"]["first_ms"] > 2.0 * warm["latency"]["heart"]["first_ms"]
+
+    print("✅ First request latency test passed")
+
+
+def main():
+    print("🔍 Warm-up Tests")
+    print("=" * 50)
+
+    try:
+        test_warmup_helpers()
+        test_first_request_latency()
+
+        print("\n" + "=" * 50)
+        print("✅ All warm-up tests passed!")
+
+    except Exception as e:
+        print(f"\n❌ Test failed: {e}")
+        import traceback
+        print(traceback.format_exc())
+        return False
+
+    return True
+
+
+if __name__ == "__main__":
+    main()
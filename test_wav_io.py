@@ -0,0 +1,173 @@
+"""
+Test memory-mapped WAV loading and shared-storage path checks
+"""
+
+import os
+import tempfile
+import numpy as np
+import soundfile as sf
+from pathlib import Path
+from ai_service.runtime.features import load_wav_mono_16k
+from ai_service.runtime.wav_io import (
+    mmap_wav, load_wav_mmap_mono_16k, pcm_from_bytes, pcm_to_mono_16k, resolve_storage_path,
+)
+
+
+def test_mmap_matches_librosa():
+    """Test mmap decoding gives the same samples as the upload path"""
+    print("=== Memory-Mapped Decode Test ===")
+
+    rng = np.random.default_rng(0)
+    cases = [
+        ("mono16.wav", rng.normal(0, 0.2, 16000), 16000, "PCM_16"),
+        ("stereo44k.wav", rng.normal(0, 0.2, (44100, 2)), 44100, "PCM_16"),
+        ("float22k.wav", rng.normal(0, 0.2, 22050), 22050, "FLOAT"),
+        ("pcm24.wav", rng.normal(0, 0.2, 8000), 16000, "PCM_24"),   # falls back to librosa
+    ]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, data, sr, subtype in cases:
+            path = os.path.join(tmp, name)
+            sf.write(path, np.clip(data, -1, 1), sr, subtype=subtype)
+
+            a = load_wav_mmap_mono_16k(path)
+            b = load_wav_mono_16k(path)
+            print(f"  {name}: {a.shape} max diff {np.max(np.abs(a - b)):.2e}")
+            assert a.shape == b.shape, f"{name}: length differs"
+            assert np.allclose(a, b, atol=1e-6), f"{name}: samples differ"
+
+        mapped = mmap_wav(os.path.join(tmp, "stereo44k.wav"))
+        assert mapped is not None and mapped[0].shape == (44100, 2) and mapped[1] == 44100
+        assert mmap_wav(os.path.join(tmp, "pcm24.wav")) is None, "24-bit should need a real decoder"
+
+    print("✅ Memory-mapped decode test passed")
+
+
+def test_raw_pcm_matches_wav():
+    """Test raw PCM bodies decode to the same samples as the WAV upload"""
+    print("\n=== Raw PCM Test ===")
+
+    rng = np.random.default_rng(1)
+    cases = [
+        ("int16", np.int16, rng.normal(0, 0.2, (16000, 1)), 16000, "PCM_16"),
+        ("int16", np.int16, rng.normal(0, 0.2, (44100, 2)), 44100, "PCM_16"),
+        ("float32", np.float32, rng.normal(0, 0.2, (22050, 1)), 22050, "FLOAT"),
+    ]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for fmt, dtype, data, sr, subtype in cases:
+            data = np.clip(data, -1, 1)
+            path = os.path.join(tmp, "rec.wav")
+            sf.write(path, data, sr, subtype=subtype)
+
+            body = sf.read(path, dtype=fmt)[0].astype(dtype).reshape(len(data), -1).tobytes()
+            samples = pcm_from_bytes(body, fmt, data.shape[1])
+            assert np.shares_memory(samples, np.frombuffer(body, dtype=np.uint8)), "PCM body was copied"
+
+            a = pcm_to_mono_16k(samples, sr, normalize=False)
+            b = load_wav_mono_16k(path, normalize=False)
+            print(f"  {fmt} {sr} Hz x{data.shape[1]}: {a.shape}")
+            assert a.shape == b.shape and np.array_equal(a, b), f"{fmt} {sr} Hz: samples differ"
+
+    for args in ((b"\x00" * 3, "int16", 1), (b"\x00" * 4, "int24", 1), (b"\x00" * 6, "float32", 2), (b"", "int16", 1)):
+        try:
+            pcm_from_bytes(*args)
+        except ValueError:
+            continue
+        raise AssertionError(f"Invalid PCM accepted: {args[1:]}")
+
+    print("✅ Raw PCM test passed")
+
+
+def test_streamed_data_size():
+    """Test a data chunk sized 0 / 0xFFFFFFFF runs to the end of the file"""
+    print("\n=== Streamed WAV Size Test ===")
+
+    samples = (np.random.default_rng(2).normal(0, 0.2, 16000) * 32767).astype("<i2")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "streamed.wav")
+        sf.write(path, samples, 16000, subtype="PCM_16")
+        raw = bytearray(Path(path).read_bytes())
+        size_at = raw.index(b"data") + 4
+
+        for size in (0, 0xFFFFFFFF):
+            raw[size_at:size_at + 4] = size.to_bytes(4, "little")
+            Path(path).write_bytes(raw)
+            data, sr = mmap_wav(path)
+            print(f"  data size {size:#x}: {data.shape[0]} frames")
+            assert sr == 16000 and np.array_equal(data[:, 0], samples), f"size {size:#x}: samples differ"
+            del data
+
+        # a failed header parse does not leave the file mapped
+        bad = os.path.join(tmp, "bad.wav")
+        Path(bad).write_bytes(b"RIFF" + bytes(4) + b"WAVE" + b"junk" + bytes(100))
+        try:
+            mmap_wav(bad)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("WAV without a data chunk accepted")
+        if os.path.exists("/proc/self/maps"):
+            assert bad not in Path("/proc/self/maps").read_text(), "mapping left open"
+
+    print("✅ Streamed WAV size test passed")
+
+
+def test_storage_path_traversal():
+    """Test storage keys cannot escape the shared root"""
+    print("\n=== Storage Path Test ===")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp) / "shared"
+        (root / "temp_audio").mkdir(parents=True)
+        (root / "temp_audio" / "rec.wav").write_bytes(b"")
+        outside = Path(tmp) / "secret.wav"
+        outside.write_bytes(b"")
+        os.symlink(outside, root / "link.wav")
+
+        ok = resolve_storage_path(root, "temp_audio/rec.wav")
+        assert ok == (root / "temp_audio" / "rec.wav").resolve()
+        assert resolve_storage_path(root, str(root / "temp_audio" / "rec.wav")) == ok
+
+        for bad in ("../secret.wav", "temp_audio/../../secret.wav", str(outside), "/etc/passwd", "link.wav"):
+            try:
+                resolve_storage_path(root, bad)
+            except PermissionError:
+                print(f"  rejected: {bad}")
+                continue
+            raise AssertionError(f"Path escaped the shared root: {bad}")
+
+        for bad in ("", "a\x00b"):
+            try:
+                resolve_storage_path(root, bad)
+            except ValueError:
+                continue
+            raise AssertionError(f"Invalid key accepted: {bad!r}")
+
+    print("✅ Storage path test passed")
+
+
+def main():
+    print("🔍 WAV I/O Tests")
+    print("=" * 50)
+
+    try:
+        test_mmap_matches_librosa()
+        test_raw_pcm_matches_wav()
+        test_streamed_data_size()
+        test_storage_path_traversal()
+
+        print("\n" + "=" * 50)
+        print("✅ All WAV I/O tests passed!")
+
+    except Exception as e:
+        print(f"\n❌ Test failed: {e}")
+        import traceback
+        print(traceback.format_exc())
+        return False
+
+    return True
+
+
+if __name__ == "__main__":
+    main()
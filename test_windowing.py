@@ -0,0 +1,95 @@
+"""
+Test sliding-window analysis
+Verifies window coverage, batched inference parity and timeline aggregation
+"""
+
+import numpy as np
+from pathlib import Path
+from ai_service.runtime.tflite_runner import TFLiteRunner
+from ai_service.runtime.windowing import window_starts, windowed_features, predict_windows
+from ai_service.runtime.postprocess.recommendation import build_recommendation
+
+MODELS_DIR = Path(__file__).resolve().parent / "ai_service" / "models"
+SAMPLE_RATE = 16000
+
+
+def test_window_starts():
+    """Test windows cover every frame"""
+    print("=== Window Starts Test ===")
+
+    assert window_starts(100, 256, 128) == [0], "Short recording should give one window"
+    assert window_starts(256, 256, 128) == [0]
+
+    starts = window_starts(1000, 256, 128)
+    print(f"  Starts: {starts}")
+    assert starts[0] == 0 and starts[-1] + 256 == 1000, "Windows do not reach the end"
+    assert all(b - a <= 128 for a, b in zip(starts, starts[1:])), "Gap between windows"
+
+    print("✅ Window starts test passed")
+
+
+def test_batched_matches_single():
+    """Test batched invokes give the same probabilities as one invoke per window"""
+    print("\n=== Batched Inference Test ===")
+
+    runner = TFLiteRunner(str(MODELS_DIR / "heart_model.tflite"))
+    rng = np.random.default_rng(0)
+    audio = rng.normal(0, 0.1, SAMPLE_RATE * 30).astype(np.float32)
+
+    X, starts, _ = windowed_features(audio, runner)
+    print(f"  Windows: {X.shape}")
+    assert X.shape[0] == len(starts) and X.shape[1:] == tuple(runner.input_shape[1:])
+
+    batched = runner.predict_batch(X, batch_size=4).reshape(-1)
+    single = np.array([runner.predict(x[np.newaxis]).reshape(-1)[0] for x in X])
+    print(f"  Max diff: {np.max(np.abs(batched - single)):.2e}")
+    assert np.allclose(batched, single, atol=1e-5), "Batched and single predictions differ"
+
+    print("✅ Batched inference test passed")
+
+
+def test_timeline_recommendation():
+    """Test the timeline covers the recording and aggregates"""
+    print("\n=== Timeline Test ===")
+
+    runner = TFLiteRunner(str(MODELS_DIR / "lung_model.tflite"))
+    rng = np.random.default_rng(1)
+    seconds = 25
+    audio = rng.normal(0, 0.1, SAMPLE_RATE * seconds).astype(np.float32)
+
+    timeline = predict_windows(audio, runner, "lung")
+    covered = sum(w.window_seconds for w in timeline)
+    print(f"  {len(timeline)} windows covering {covered:.2f}s")
+    assert abs(covered - seconds) < 0.1, "Timeline does not add up to the recording length"
+    assert all(w.label in ("normal", "crackles") for w in timeline)
+
+    reco = build_recommendation("lung", timeline, lookback_seconds=seconds)
+    print(f"  Recommendation: {reco.status} / {reco.consistency_text}")
+    assert reco.status in ("Normal", "Crackles Detected")
+
+    print("✅ Timeline test passed")
+
+
+def main():
+    print("🔍 Windowed Analysis Tests")
+    print("=" * 50)
+
+    try:
+        test_window_starts()
+        test_batched_matches_single()
+        test_timeline_recommendation()
+
+        print("\n" + "=" * 50)
+        print("✅ All windowed analysis tests passed!")
+
+    except Exception as e:
+        print(f"\n❌ Test failed: {e}")
+        import traceback
+        print(traceback.format_exc())
+        return False
+
+    return True
+
+
+if __name__ == "__main__":
+    main()